@@ -0,0 +1,509 @@
+"""
+即時滾動統計
+每個裝置維護 1 分鐘 / 5 分鐘 / 1 小時的固定視窗（tumbling）與滑動視窗（sliding）統計：
+筆數、最小值、最大值、平均值、變異數與開燈比例
+
+每筆數據只更新「目前的小區段」，O(1)：
+    - 滑動視窗切成 SLOTS 個小區段，查詢時合併最近 SLOTS 個區段（固定成本，不掃描數據）
+    - 平均值與變異數以 Welford 演算法累加，區段合併使用 Chan 的合併公式
+    - 固定視窗結束時回呼 on_close，由 StatsArchive 寫入 CSV，重新啟動後仍可查詢
+"""
+
+import csv
+import os
+import threading
+from array import array
+from collections import deque
+
+from csv_tail import read_header, read_tail_lines
+from csv_writer import BatchCSVWriter, FSYNC_INTERVAL
+from ring_buffer import LIGHT_ON, LIGHT_UNKNOWN, format_timestamp, parse_timestamp
+
+# 視窗名稱與秒數
+WINDOWS = {'1m': 60, '5m': 300, '1h': 3600}
+
+# 滑動視窗切成幾個小區段（1 小時視窗的精度為 1 分鐘）
+SLOTS = 60
+
+# 每個裝置、每種視窗在記憶體中保留幾個已結束的固定視窗
+CLOSED_KEEP = 60
+
+# dump_state() 中每個 Summary 佔幾個 double（溫度、濕度各 5 個，加上開燈與已知筆數）
+SUMMARY_SIZE = 12
+
+
+class FieldStats:
+    """單一數值欄位的累計統計（Welford 演算法）"""
+
+    __slots__ = ('count', 'mean', 'm2', 'min', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = float('inf')
+        self.max = float('-inf')
+
+    def add(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        if x < self.min:
+            self.min = x
+        if x > self.max:
+            self.max = x
+
+    def merge(self, other):
+        """合併另一段的統計（Chan 的平行變異數公式）"""
+        if not other.count:
+            return
+        if not self.count:
+            self.count, self.mean, self.m2 = other.count, other.mean, other.m2
+            self.min, self.max = other.min, other.max
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def pack(self, out):
+        """把統計值附加到 out（array('d')）"""
+        out.extend((self.count, self.mean, self.m2, self.min, self.max))
+
+    def unpack(self, values, i):
+        """從 values[i:] 讀回 pack() 的內容，回傳下一個位置"""
+        count, self.mean, self.m2, self.min, self.max = values[i:i + 5]
+        self.count = int(count)
+        return i + 5
+
+    @property
+    def variance(self):
+        """母體變異數"""
+        return self.m2 / self.count if self.count else None
+
+    def as_dict(self):
+        if not self.count:
+            return {'min': None, 'max': None, 'avg': None, 'variance': None}
+        return {
+            'min': round(self.min, 2),
+            'max': round(self.max, 2),
+            'avg': round(self.mean, 2),
+            'variance': round(self.variance, 4),
+        }
+
+
+class Summary:
+    """一段時間內的溫度、濕度與電燈狀態統計"""
+
+    __slots__ = ('temperature', 'humidity', 'light_on', 'light_known')
+
+    def __init__(self):
+        self.temperature = FieldStats()
+        self.humidity = FieldStats()
+        self.light_on = 0
+        self.light_known = 0
+
+    @property
+    def count(self):
+        return self.temperature.count
+
+    def add(self, temperature, humidity, light):
+        self.temperature.add(temperature)
+        self.humidity.add(humidity)
+        if light != LIGHT_UNKNOWN:
+            self.light_known += 1
+            self.light_on += light == LIGHT_ON
+
+    def merge(self, other):
+        self.temperature.merge(other.temperature)
+        self.humidity.merge(other.humidity)
+        self.light_on += other.light_on
+        self.light_known += other.light_known
+
+    def pack(self, out):
+        self.temperature.pack(out)
+        self.humidity.pack(out)
+        out.extend((self.light_on, self.light_known))
+
+    def unpack(self, values, i):
+        i = self.temperature.unpack(values, i)
+        i = self.humidity.unpack(values, i)
+        self.light_on, self.light_known = int(values[i]), int(values[i + 1])
+        return i + 2
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'temperature': self.temperature.as_dict(),
+            'humidity': self.humidity.as_dict(),
+            'light_on_ratio': round(self.light_on / self.light_known, 4) if self.light_known else None,
+        }
+
+
+class WindowAggregator:
+    """
+    單一長度的視窗統計（同時維護固定視窗與滑動視窗）
+
+    Args:
+        seconds: 視窗長度（秒）
+        slots: 滑動視窗切成幾個小區段
+        on_close: 固定視窗結束時呼叫 on_close(start, end, summary)
+            （在下一個視窗的第一筆數據進來時觸發）
+    """
+
+    def __init__(self, seconds, slots=SLOTS, on_close=None):
+        self.seconds = seconds
+        self.slots = slots
+        self.slot_seconds = seconds / slots
+        self.on_close = on_close
+        self._slot_ids = [None] * slots
+        self._slot_stats = [None] * slots
+        self._window_id = None
+        self._window = Summary()
+
+    def add(self, timestamp, temperature, humidity, light):
+        """加入一筆數據，O(1)"""
+        window_id = int(timestamp // self.seconds)
+        if window_id != self._window_id:
+            if self._window_id is not None and window_id < self._window_id:
+                # 比目前視窗還舊的數據（時鐘倒退）不計入固定視窗
+                window_id = None
+            else:
+                if self._window_id is not None and self._window.count and self.on_close is not None:
+                    start = self._window_id * self.seconds
+                    self.on_close(start, start + self.seconds, self._window)
+                self._window_id = window_id
+                self._window = Summary()
+        if window_id is not None:
+            self._window.add(temperature, humidity, light)
+
+        slot_id = int(timestamp // self.slot_seconds)
+        pos = slot_id % self.slots
+        if self._slot_ids[pos] != slot_id:
+            if self._slot_ids[pos] is not None and slot_id < self._slot_ids[pos]:
+                return
+            self._slot_ids[pos] = slot_id
+            self._slot_stats[pos] = Summary()
+        self._slot_stats[pos].add(temperature, humidity, light)
+
+    def sliding(self, now):
+        """
+        最近 seconds 秒的統計（合併仍在範圍內的小區段）
+
+        Args:
+            now: 目前的 epoch 秒數
+        """
+        newest = int(now // self.slot_seconds)
+        oldest = newest - self.slots + 1
+        result = Summary()
+        for slot_id, stats in zip(self._slot_ids, self._slot_stats):
+            if slot_id is not None and oldest <= slot_id <= newest:
+                result.merge(stats)
+        return result
+
+    def tumbling(self, now):
+        """
+        目前固定視窗的統計
+
+        Returns:
+            tuple: (視窗開始 epoch 秒數, Summary)；目前視窗還沒有數據時 Summary 為空
+        """
+        window_id = int(now // self.seconds)
+        if window_id != self._window_id:
+            return window_id * self.seconds, Summary()
+        return window_id * self.seconds, self._window
+
+    @property
+    def state_size(self):
+        """dump_state() 附加的 double 個數"""
+        return (1 + SUMMARY_SIZE) * (1 + self.slots)
+
+    def dump_state(self, out):
+        """
+        把目前視窗與所有小區段附加到 out（array('d')），沒有編號的視窗或區段記為 -1
+
+        區段編號與視窗編號都小於 2**53，以 double 保存不會失去精度
+        """
+        empty = Summary()
+        out.append(-1 if self._window_id is None else self._window_id)
+        self._window.pack(out)
+        for slot_id, stats in zip(self._slot_ids, self._slot_stats):
+            out.append(-1 if slot_id is None else slot_id)
+            (stats or empty).pack(out)
+
+    def restore_state(self, values, i):
+        """從 values[i:] 讀回 dump_state() 的內容，回傳下一個位置"""
+        window_id = int(values[i])
+        self._window_id = None if window_id < 0 else window_id
+        self._window = Summary()
+        i = self._window.unpack(values, i + 1)
+        for pos in range(self.slots):
+            slot_id = int(values[i])
+            if slot_id < 0:
+                self._slot_ids[pos] = self._slot_stats[pos] = None
+                i += 1 + SUMMARY_SIZE
+                continue
+            self._slot_ids[pos] = slot_id
+            self._slot_stats[pos] = Summary()
+            i = self._slot_stats[pos].unpack(values, i + 1)
+        return i
+
+
+class DeviceAggregates:
+    """
+    單一裝置所有視窗的統計
+
+    Args:
+        device: 裝置名稱
+        windows: {名稱: 秒數}
+        on_close: 固定視窗結束時呼叫 on_close(device, 視窗名稱, start, end, record)
+    """
+
+    def __init__(self, device, windows=WINDOWS, on_close=None):
+        self.device = device
+        self._lock = threading.Lock()
+        self.closed = {name: deque(maxlen=CLOSED_KEEP) for name in windows}
+        self._on_close = on_close
+        self.windows = {
+            name: WindowAggregator(seconds, on_close=self._closer(name))
+            for name, seconds in windows.items()
+        }
+
+    def _closer(self, name):
+        def close(start, end, summary):
+            record = {'start': format_timestamp(start), 'end': format_timestamp(end), **summary.as_dict()}
+            closed = self.closed[name]
+            if closed and closed[-1]['end'] >= record['end']:
+                # 啟動時重新播放歷史數據，這個視窗已從歸檔讀回
+                return
+            closed.append(record)
+            if self._on_close is not None:
+                self._on_close(self.device, name, start, end, record)
+        return close
+
+    def add(self, timestamp, temperature, humidity, light):
+        with self._lock:
+            for window in self.windows.values():
+                window.add(timestamp, temperature, humidity, light)
+
+    def snapshot(self, name, now, closed=1):
+        """
+        取得指定視窗的統計
+
+        Args:
+            name: 視窗名稱（例如 '5m'）
+            now: 目前的 epoch 秒數
+            closed: 附上最近幾個已結束的固定視窗
+        """
+        window = self.windows[name]
+        with self._lock:
+            sliding = window.sliding(now).as_dict()
+            start, current = window.tumbling(now)
+            current = current.as_dict()
+            recent = list(self.closed[name])[-closed:] if closed > 0 else []
+        return {
+            'sliding': sliding,
+            'tumbling': {
+                'start': format_timestamp(start),
+                'end': format_timestamp(start + window.seconds),
+                **current,
+            },
+            'closed': recent,
+        }
+
+    def dump_state(self):
+        """所有視窗目前的統計（依 windows 的順序串接成 array('d')，供 checkpoint.py 使用）"""
+        out = array('d')
+        with self._lock:
+            for window in self.windows.values():
+                window.dump_state(out)
+        return out
+
+    def restore_state(self, values):
+        """還原 dump_state() 的內容（視窗設定必須相同）"""
+        expected = sum(window.state_size for window in self.windows.values())
+        if len(values) != expected:
+            raise ValueError(f"統計狀態長度 {len(values)} 與視窗設定不符（需要 {expected}）")
+        values = values.tolist()    # array 或 memoryview；list 切片較快
+        with self._lock:
+            i = 0
+            for window in self.windows.values():
+                i = window.restore_state(values, i)
+
+
+class RollingAggregates:
+    """
+    所有裝置的滾動統計
+
+    Args:
+        windows: {名稱: 秒數}
+        archive: StatsArchive（保存已結束的固定視窗），None 表示不保存
+    """
+
+    def __init__(self, windows=WINDOWS, archive=None):
+        self.windows = dict(windows)
+        self.archive = archive
+        self._devices = {}
+        self._create_lock = threading.Lock()
+
+    def _device(self, device):
+        state = self._devices.get(device)
+        if state is not None:
+            return state
+        with self._create_lock:
+            state = self._devices.get(device)
+            if state is None:
+                on_close = self.archive.save if self.archive is not None else None
+                state = DeviceAggregates(device, self.windows, on_close)
+                if self.archive is not None:
+                    for name, records in self.archive.recent(device).items():
+                        state.closed[name].extend(records)
+                # 寫入時複製，讀取端不需要鎖
+                devices = dict(self._devices)
+                devices[device] = state
+                self._devices = devices
+            return state
+
+    def add(self, device, timestamp, temperature, humidity, light):
+        """加入一筆數據（各視窗皆為 O(1)）"""
+        self._device(device).add(timestamp, temperature, humidity, light)
+
+    def devices(self):
+        return sorted(self._devices)
+
+    def dump_state(self):
+        """{裝置: array('d')}，每個裝置各自在鎖內複製"""
+        return {device: state.dump_state() for device, state in self._devices.items()}
+
+    def restore_state(self, device, values):
+        """還原單一裝置的統計（已結束的固定視窗仍由 StatsArchive 讀回）"""
+        self._device(device).restore_state(values)
+
+    def snapshot(self, name, now, device=None, closed=1):
+        """
+        取得統計
+
+        Args:
+            name: 視窗名稱
+            now: 目前的 epoch 秒數
+            device: 裝置名稱，None 表示所有裝置
+            closed: 附上最近幾個已結束的固定視窗
+
+        Returns:
+            dict: {裝置: 統計}；指定的裝置不存在時回傳 None
+        """
+        devices = self._devices
+        if device is not None:
+            if device not in devices:
+                return None
+            return {device: devices[device].snapshot(name, now, closed)}
+        return {d: devices[d].snapshot(name, now, closed) for d in sorted(devices)}
+
+
+STATS_FIELDNAMES = [
+    '裝置', '視窗', '開始', '結束', '筆數',
+    '溫度最小', '溫度最大', '溫度平均', '溫度變異數',
+    '濕度最小', '濕度最大', '濕度平均', '濕度變異數',
+    '開燈比例',
+]
+
+
+class StatsArchive:
+    """
+    已結束固定視窗的 CSV 歸檔
+
+    啟動時讀回檔尾最近的視窗；重新播放歷史數據時，已寫入過的視窗不會重複寫入
+
+    Args:
+        path: CSV 檔案路徑
+        load_rows: 啟動時從檔尾讀回的列數
+    """
+
+    def __init__(self, path, load_rows=10_000):
+        self.path = path
+        self.load_rows = load_rows
+        self.writer = BatchCSVWriter(path, STATS_FIELDNAMES, batch_size=100, flush_interval=5.0,
+                                     fsync_policy=FSYNC_INTERVAL, fsync_interval=60.0,
+                                     report_interval=0, name='統計寫入器')
+        self._recent = {}
+        self._last_end = {}
+
+    def open(self):
+        """讀回最近的視窗並啟動背景寫入"""
+        if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            self._load()
+        self.writer.start()
+        return self
+
+    def close(self):
+        self.writer.close()
+
+    def recent(self, device):
+        """
+        取得啟動時讀回的視窗
+
+        Returns:
+            dict: {視窗名稱: [record, ...]}（由舊到新）
+        """
+        return self._recent.get(device, {})
+
+    def save(self, device, name, start, end, record):
+        """on_close 回調：寫入一個已結束的視窗（已寫入過的略過）"""
+        key = (device, name)
+        if end <= self._last_end.get(key, float('-inf')):
+            return
+        self._last_end[key] = end
+        temperature, humidity = record['temperature'], record['humidity']
+        self.writer.write({
+            '裝置': device,
+            '視窗': name,
+            '開始': record['start'],
+            '結束': record['end'],
+            '筆數': record['count'],
+            '溫度最小': temperature['min'],
+            '溫度最大': temperature['max'],
+            '溫度平均': temperature['avg'],
+            '溫度變異數': temperature['variance'],
+            '濕度最小': humidity['min'],
+            '濕度最大': humidity['max'],
+            '濕度平均': humidity['avg'],
+            '濕度變異數': humidity['variance'],
+            '開燈比例': record['light_on_ratio'],
+        })
+
+    def _load(self):
+        """從檔尾讀回最近 load_rows 列"""
+        header = read_header(self.path)
+        if header != STATS_FIELDNAMES:
+            print(f"⚠️  統計檔 {self.path} 的欄位不符，略過讀取")
+            return
+
+        def number(text):
+            return float(text) if text else None
+
+        lines = read_tail_lines(self.path, self.load_rows)
+        for fields in csv.reader(line.decode('utf-8') for line in lines):
+            try:
+                row = dict(zip(STATS_FIELDNAMES, fields))
+                device, name = row['裝置'], row['視窗']
+                record = {
+                    'start': row['開始'],
+                    'end': row['結束'],
+                    'count': int(row['筆數']),
+                    'temperature': {'min': number(row['溫度最小']), 'max': number(row['溫度最大']),
+                                    'avg': number(row['溫度平均']), 'variance': number(row['溫度變異數'])},
+                    'humidity': {'min': number(row['濕度最小']), 'max': number(row['濕度最大']),
+                                 'avg': number(row['濕度平均']), 'variance': number(row['濕度變異數'])},
+                    'light_on_ratio': number(row['開燈比例']),
+                }
+                end = parse_timestamp(row['結束'])
+            except (KeyError, ValueError):
+                continue
+            windows = self._recent.setdefault(device, {})
+            windows.setdefault(name, deque(maxlen=CLOSED_KEEP)).append(record)
+            key = (device, name)
+            self._last_end[key] = max(self._last_end.get(key, float('-inf')), end)
@@ -0,0 +1,463 @@
+"""
+接收路徑上的警報規則引擎
+每筆數據進入接收管線時依裝置找出適用的規則逐一檢查，每條規則只保存固定大小的增量狀態，
+每筆數據每條規則 O(1)：
+
+    threshold - 數值高於 above 或低於 below
+    rate      - 變化速度超過 max_per_minute（每分鐘變化量，與至少 min_interval 秒前的數值比較）
+    zscore    - 與最近 window 筆的平均值相差超過 z 個標準差（執行中的總和與平方和）
+    light_on  - 電燈連續開啟超過 hours 小時
+    silent    - 裝置超過 seconds 秒沒有數據（由 tick() 定期檢查，不在接收路徑上）
+
+同一條規則、同一個裝置在警報解除前只通知一次（解除時再通知一次 resolved），
+解除後 cooldown 秒內再次觸發不會重複通知
+
+規則檔（JSON 列表，修改後自動重新載入）範例:
+    [{"id": "客廳高溫", "type": "threshold", "device": "客廳", "field": "temperature", "above": 30}]
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from ring_buffer import LIGHT_ON, format_timestamp
+
+logger = logging.getLogger('alerts')
+
+STATE_FIRING = 'firing'
+STATE_RESOLVED = 'resolved'
+
+# 可檢查的數值欄位
+FIELDS = {'temperature': '溫度', 'humidity': '濕度'}
+
+# 預設值
+DEFAULT_SEVERITY = 'warning'
+DEFAULT_COOLDOWN = 60.0     # 解除後幾秒內再次觸發不通知（避免數值在門檻附近跳動時重複通知）
+RECENT_KEEP = 200           # 保留最近幾則通知（/api/alerts）
+
+
+class Rule:
+    """
+    規則基底類別
+
+    Args:
+        config: 規則設定 dict（id、type、device 以及各類型的參數）
+    """
+
+    kind = None
+    per_sample = True
+
+    def __init__(self, config):
+        self.config = config
+        self.id = str(config['id'])
+        self.device = config.get('device') or None   # None 表示所有裝置
+        self.severity = config.get('severity', DEFAULT_SEVERITY)
+        self.cooldown = float(config.get('cooldown', DEFAULT_COOLDOWN))
+
+    def new_state(self):
+        """建立一個裝置的增量狀態（不需要狀態時回傳 None）"""
+        return None
+
+    def check(self, state, timestamp, sample):
+        """
+        檢查一筆數據
+
+        Returns:
+            tuple: 觸發時回傳 (數值, 說明)；未觸發時回傳 None
+        """
+        raise NotImplementedError
+
+
+class FieldRule(Rule):
+    """檢查單一數值欄位的規則"""
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.field = config.get('field', 'temperature')
+        if self.field not in FIELDS:
+            raise ValueError(f"規則 {self.id}: field 必須是 {', '.join(FIELDS)} 其中之一")
+        self.label = FIELDS[self.field]
+
+
+def _optional_float(value):
+    return None if value is None else float(value)
+
+
+class ThresholdRule(FieldRule):
+    """數值高於 above 或低於 below"""
+
+    kind = 'threshold'
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.above = _optional_float(config.get('above'))
+        self.below = _optional_float(config.get('below'))
+        if self.above is None and self.below is None:
+            raise ValueError(f"規則 {self.id}: threshold 需要 above 或 below")
+
+    def check(self, state, timestamp, sample):
+        value = sample[self.field]
+        if self.above is not None and value > self.above:
+            return value, f"{self.label} {value:.2f} 高於 {self.above}"
+        if self.below is not None and value < self.below:
+            return value, f"{self.label} {value:.2f} 低於 {self.below}"
+        return None
+
+
+class RateRule(FieldRule):
+    """
+    變化速度（每分鐘變化量）超過 max_per_minute
+
+    與至少 min_interval 秒前的參考點比較（批次數據的間隔很短，逐筆相比會放大雜訊），
+    兩次比較之間沿用上一次的結果
+    """
+
+    kind = 'rate'
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.limit = float(config['max_per_minute'])
+        self.min_interval = float(config.get('min_interval', 60))
+
+    def new_state(self):
+        return [None, None, None]   # [參考點時間, 參考點數值, 上一次的結果]
+
+    def check(self, state, timestamp, sample):
+        value = sample[self.field]
+        ref_time, ref_value, result = state
+        if ref_time is None:
+            state[0], state[1] = timestamp, value
+            return None
+        elapsed = timestamp - ref_time
+        if elapsed < self.min_interval:
+            return result
+        rate = (value - ref_value) * 60 / elapsed
+        result = (rate, f"{self.label}每分鐘變化 {rate:+.2f}，超過 ±{self.limit}") if abs(rate) > self.limit else None
+        state[:] = [timestamp, value, result]
+        return result
+
+
+class ZScoreState:
+    """最近 window 筆的執行中總和與平方和"""
+
+    __slots__ = ('values', 'total', 'total_sq')
+
+    def __init__(self, window):
+        self.values = deque(maxlen=window)
+        self.total = 0.0
+        self.total_sq = 0.0
+
+
+class ZScoreRule(FieldRule):
+    """與最近 window 筆的平均值相差超過 z 個標準差（至少累積 min_samples 筆才檢查）"""
+
+    kind = 'zscore'
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.window = int(config.get('window', 60))
+        self.z = float(config.get('z', 4.0))
+        self.min_samples = int(config.get('min_samples', min(10, self.window)))
+        if self.window < 2:
+            raise ValueError(f"規則 {self.id}: window 至少為 2")
+
+    def new_state(self):
+        return ZScoreState(self.window)
+
+    def check(self, state, timestamp, sample):
+        value = sample[self.field]
+        values = state.values
+        n = len(values)
+        result = None
+        if n >= self.min_samples:
+            mean = state.total / n
+            variance = state.total_sq / n - mean * mean
+            if variance > 1e-12:
+                z = (value - mean) / variance ** 0.5
+                if abs(z) > self.z:
+                    result = z, f"{self.label} {value:.2f} 偏離最近 {n} 筆平均 {mean:.2f} 達 {z:+.1f} 個標準差"
+        if n == self.window:
+            old = values[0]
+            state.total -= old
+            state.total_sq -= old * old
+        values.append(value)
+        state.total += value
+        state.total_sq += value * value
+        return result
+
+
+class LightOnRule(Rule):
+    """電燈連續開啟超過 hours 小時"""
+
+    kind = 'light_on'
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.hours = float(config['hours'])
+
+    def new_state(self):
+        return [None]   # 開燈的時間
+
+    def check(self, state, timestamp, sample):
+        if sample['light'] != LIGHT_ON:
+            state[0] = None
+            return None
+        if state[0] is None:
+            state[0] = timestamp
+        hours = (timestamp - state[0]) / 3600
+        if hours >= self.hours:
+            return hours, f"電燈已連續開啟 {hours:.1f} 小時（超過 {self.hours:g} 小時）"
+        return None
+
+
+class SilentRule(Rule):
+    """裝置超過 seconds 秒沒有數據"""
+
+    kind = 'silent'
+    per_sample = False
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.seconds = float(config['seconds'])
+
+    def check(self, state, now, last_seen):
+        silent = now - last_seen
+        if silent >= self.seconds:
+            return silent, f"已 {silent:.0f} 秒沒有數據（超過 {self.seconds:g} 秒）"
+        return None
+
+
+RULE_TYPES = {cls.kind: cls for cls in (ThresholdRule, RateRule, ZScoreRule, LightOnRule, SilentRule)}
+
+
+def build_rules(configs):
+    """
+    由設定建立規則
+
+    Raises:
+        ValueError: 類型未知、id 重複或缺少參數
+    """
+    rules = []
+    ids = set()
+    for config in configs:
+        try:
+            cls = RULE_TYPES[config['type']]
+            rule = cls(config)
+        except KeyError as e:
+            raise ValueError(f"規則設定錯誤（缺少或未知的 {e}）: {config}") from None
+        except TypeError:
+            raise ValueError(f"規則設定錯誤（參數型別不正確）: {config}") from None
+        if rule.id in ids:
+            raise ValueError(f"規則 id 重複: {rule.id}")
+        ids.add(rule.id)
+        rules.append(rule)
+    return rules
+
+
+class AlertEngine:
+    """
+    警報規則引擎
+
+    Args:
+        path: 規則檔路徑（JSON 列表）；None 表示只使用 load() 載入的規則
+        notify: 通知回調，參數為警報 dict（在呼叫 evaluate() / tick() 的執行緒中執行）
+        recent: 保留最近幾則通知
+    """
+
+    def __init__(self, path=None, notify=None, recent=RECENT_KEEP):
+        self.path = path
+        self.notify = notify
+        self.recent = deque(maxlen=recent)
+        self._lock = threading.Lock()
+        self._rules = []
+        self._by_device = {}     # 裝置名稱 -> 只套用到該裝置的逐筆規則
+        self._wildcard = []      # 套用到所有裝置的逐筆規則
+        self._silent = []
+        self._states = {}        # (規則 id, 裝置) -> 增量狀態
+        self._active = {}        # (規則 id, 裝置) -> 觸發中的警報
+        self._last_fired = {}    # (規則 id, 裝置) -> 上次通知的時間
+        self._last_seen = {}     # 裝置 -> 最後一筆數據的時間
+        self._mtime = None
+        self.evaluations = 0
+        self.fired = 0
+        self.resolved = 0
+        self.suppressed = 0
+        self.reloads = 0
+
+    def __len__(self):
+        return len(self._rules)
+
+    def load(self, configs):
+        """
+        換成新的規則集（設定沒有改變的規則保留增量狀態與觸發中的警報）
+
+        Raises:
+            ValueError: 規則設定錯誤（原本的規則維持不變）
+        """
+        rules = build_rules(configs)
+        by_device, wildcard, silent = {}, [], []
+        for rule in rules:
+            if not rule.per_sample:
+                silent.append(rule)
+            elif rule.device is None:
+                wildcard.append(rule)
+            else:
+                by_device.setdefault(rule.device, []).append(rule)
+
+        with self._lock:
+            old = {rule.id: rule.config for rule in self._rules}
+            keep = {rule.id for rule in rules if old.get(rule.id) == rule.config}
+            self._states = {k: v for k, v in self._states.items() if k[0] in keep}
+            self._active = {k: v for k, v in self._active.items() if k[0] in keep}
+            self._last_fired = {k: v for k, v in self._last_fired.items() if k[0] in keep}
+            self._rules = rules
+            self._by_device = by_device
+            self._wildcard = wildcard
+            self._silent = silent
+            self.reloads += 1
+        return len(rules)
+
+    def load_file(self, force=False):
+        """
+        規則檔有修改時重新載入（檔案不存在時清空規則）
+
+        Returns:
+            bool: 是否重新載入
+        """
+        if self.path is None:
+            return False
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._mtime and not force:
+            return False
+        self._mtime = mtime
+        if mtime is None:
+            self.load([])
+            return True
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                count = self.load(json.load(f))
+        except (OSError, ValueError) as e:
+            logger.error("⚠️  警報規則載入失敗，維持原本的規則: %s", e)
+            return False
+        logger.info("🚨 已載入 %d 條警報規則（%s）", count, self.path)
+        return True
+
+    def seen(self, device, timestamp):
+        """記錄裝置最後一筆數據的時間（啟動時由歷史數據設定，silent 規則使用）"""
+        if timestamp > self._last_seen.get(device, float('-inf')):
+            self._last_seen[device] = timestamp
+
+    def evaluate(self, device, timestamp, sample):
+        """
+        檢查一筆數據（接收管線每筆數據呼叫一次）
+
+        Args:
+            device: 裝置名稱
+            timestamp: epoch 秒數
+            sample: 含 temperature、humidity、light 的 dict
+
+        Returns:
+            list: 這次產生的通知
+        """
+        alerts = []
+        with self._lock:
+            self.seen(device, timestamp)
+            rules = self._by_device.get(device)
+            for group in (self._wildcard, rules) if rules else (self._wildcard,):
+                for rule in group:
+                    key = (rule.id, device)
+                    state = self._states.get(key)
+                    if state is None and key not in self._states:
+                        state = self._states[key] = rule.new_state()
+                    self._update(alerts, rule, key, device, timestamp, rule.check(state, timestamp, sample))
+                self.evaluations += len(group)
+            # 有新數據時解除該裝置的 silent 警報
+            for rule in self._silent:
+                key = (rule.id, device)
+                if key in self._active:
+                    self._update(alerts, rule, key, device, timestamp, None)
+        self._deliver(alerts)
+        return alerts
+
+    def tick(self, now=None):
+        """
+        定期呼叫：檢查 silent 規則，規則檔有修改時重新載入
+
+        Returns:
+            list: 這次產生的通知
+        """
+        self.load_file()
+        now = time.time() if now is None else now
+        alerts = []
+        with self._lock:
+            for rule in self._silent:
+                for device, last_seen in self._last_seen.items():
+                    if rule.device is not None and rule.device != device:
+                        continue
+                    key = (rule.id, device)
+                    self._update(alerts, rule, key, device, now, rule.check(None, now, last_seen))
+        self._deliver(alerts)
+        return alerts
+
+    def _update(self, alerts, rule, key, device, timestamp, result):
+        """（持有鎖時呼叫）依檢查結果更新觸發狀態，狀態改變時加入通知"""
+        active = self._active.get(key)
+        if result is None:
+            if active is not None:
+                del self._active[key]
+                self.resolved += 1
+                alerts.append({**active, 'state': STATE_RESOLVED, 'timestamp': format_timestamp(timestamp)})
+            return
+        if active is not None:
+            return
+        last = self._last_fired.get(key)
+        if last is not None and timestamp - last < rule.cooldown:
+            self.suppressed += 1
+            return
+        value, message = result
+        alert = {
+            'rule': rule.id,
+            'type': rule.kind,
+            'device': device,
+            'severity': rule.severity,
+            'state': STATE_FIRING,
+            'value': round(value, 2),
+            'message': message,
+            'timestamp': format_timestamp(timestamp),
+        }
+        self._active[key] = alert
+        self._last_fired[key] = timestamp
+        self.fired += 1
+        alerts.append(alert)
+
+    def _deliver(self, alerts):
+        """（不持有鎖）記錄並送出通知，通知回調的錯誤不影響接收"""
+        for alert in alerts:
+            self.recent.append(alert)
+            if self.notify is not None:
+                try:
+                    self.notify(alert)
+                except Exception as e:
+                    logger.error("⚠️  警報通知失敗: %s", e)
+
+    def active(self):
+        """觸發中的警報列表"""
+        with self._lock:
+            return list(self._active.values())
+
+    def stats(self):
+        """規則數與觸發統計"""
+        return {
+            'rules': len(self._rules),
+            'evaluations': self.evaluations,
+            'fired': self.fired,
+            'resolved': self.resolved,
+            'suppressed': self.suppressed,
+            'reloads': self.reloads,
+        }
@@ -3,14 +3,40 @@ Flask 版本的 MQTT 監控應用程式
 替代 Streamlit，解決 Raspberry Pi 相容性問題
 """
 
-from flask import Flask, render_template, jsonify
-from flask_socketio import SocketIO
+from flask import Flask, Response, render_template, jsonify, request
+from flask_socketio import SocketIO, emit
 import paho.mqtt.client as mqtt
 from datetime import datetime
 import json
+import logging
 import threading
-import csv
+import time
 import os
+import atexit
+import uuid
+import heapq
+from operator import itemgetter
+from csv_writer import FSYNC_INTERVAL
+from ring_buffer import SensorRingBuffer, encode_light, decode_light, format_timestamp, make_record, LIGHT_UNKNOWN
+from storage import create_storage, BACKEND_CSV
+from downsample import DownsampleCache, downsample_indices, METHOD_LTTB, METHODS
+from pipeline import IngestPipeline, BACKPRESSURE_DROP_OLDEST
+from devices import DeviceRegistry
+from binary_payload import is_binary, unpack as unpack_binary, TOPIC_SUFFIX as BINARY_TOPIC_SUFFIX
+from aggregates import RollingAggregates, StatsArchive, WINDOWS, CLOSED_KEEP
+from metrics import Registry, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from log_config import setup_logging, set_level
+from alerts import AlertEngine, STATE_FIRING
+from snapshots import SnapshotCache, snapshot_response
+from export import iter_export, FORMATS as EXPORT_FORMATS, FORMAT_CSV, FORMAT_XLSX, HAS_OPENPYXL
+from export import CONTENT_TYPES as EXPORT_CONTENT_TYPES
+from checkpoint import write_checkpoint, load_checkpoint, CheckpointError
+from shared_ring import SharedRingBuffer, FLAG_MQTT_CONNECTED
+from array import array
+
+# 日誌設定：每筆 MQTT 訊息為 DEBUG，同一種訊息每秒最多輸出 1 次（可累積 5 次）
+LOG_LEVEL = 'INFO'
+logger = logging.getLogger('app_flask')
 
 app = Flask(__name__)
 socketio = SocketIO(app, cors_allowed_origins="*")
@@ -18,126 +44,405 @@ socketio = SocketIO(app, cors_allowed_origins="*")
 # MQTT 設定
 MQTT_BROKER = "localhost"
 MQTT_PORT = 1883
-MQTT_TOPIC = "客廳/感測器"
+MQTT_TOPIC = "+/感測器"       # 萬用字元：每個房間的 Pico 發布到 <房間>/感測器
+MQTT_BINARY_TOPIC = MQTT_TOPIC + BINARY_TOPIC_SUFFIX  # 二進位負載（binary_payload.py）
+
+# 記憶體中保留的歷史筆數（每筆約 17 bytes，10 萬筆約 1.7 MB）
+HISTORY_CAPACITY = 100_000
+# 每個裝置另外保留的歷史筆數，以及最多登錄幾個裝置
+DEVICE_HISTORY_CAPACITY = 10_000
+MAX_DEVICES = 256
+# /api/history 未指定 limit 時回傳的筆數
+HISTORY_DEFAULT_LIMIT = 100
+# 指定時間範圍（from/to）查詢歸檔時最多回傳的筆數
+HISTORY_RANGE_MAX_LIMIT = 100_000
+
+# 降採樣設定（/api/history?points=500）
+DOWNSAMPLE_MAX_POINTS = 5000          # points 參數上限
+DOWNSAMPLE_MAX_SOURCE_ROWS = 1_000_000  # 從歸檔讀取來降採樣的最多筆數
+downsample_cache = DownsampleCache(max_entries=64, ttl=1.0)
+
+# 匯出設定（/api/export）：同時進行的匯出數上限，超過時回傳 429
+EXPORT_MAX_CONCURRENT = 2
+export_slots = threading.BoundedSemaphore(EXPORT_MAX_CONCURRENT)
 
-# 全域數據儲存
-sensor_data = []
-latest_data = {
+# 輪詢 API（/api/latest、/api/history）的快照：每個版本只序列化一次，支援 ETag 與 gzip
+snapshots = SnapshotCache(max_entries=64, max_bytes=64 * 1024 * 1024, dumps=app.json.dumps)
+
+# 即時串流設定：連線時送一次快照，之後只推送帶序號的增量
+STREAM_ID = uuid.uuid4().hex     # 每次啟動不同，客戶端據此判斷序號是否仍有效
+SNAPSHOT_POINTS = 500            # 快照中歷史圖表的點數（降採樣）
+RESUME_MAX_DELTAS = 1000         # 重連時最多補送幾筆增量，超過則改送快照
+
+# 全域數據儲存（所有裝置合併的數據流）與各裝置的狀態
+sensor_data = SensorRingBuffer(HISTORY_CAPACITY)
+devices = DeviceRegistry(DEVICE_HISTORY_CAPACITY, MAX_DEVICES)
+EMPTY_LATEST = {
     'light_status': '未知',
     'temperature': 0,
     'humidity': 0,
     'timestamp': None
 }
 mqtt_connected = False
+# 多程序部署（app_workers.py）時由 create_app() 建立，供唯讀的工作程序 mmap 讀取；單一程序時為 None
+shared_ring = None
 
-# CSV 檔案路徑
+# 儲存後端：'csv'（sensor_data.csv）或 'sqlite'（sensor_data.db）
+# 改用 SQLite 前可先執行 migrate_to_sqlite.py 匯入既有的 CSV / Excel 數據
+STORAGE_BACKEND = BACKEND_CSV
 CSV_FILE = 'sensor_data.csv'
+SQLITE_FILE = 'sensor_data.db'
 
-def load_from_csv():
-    """從 CSV 檔案載入歷史數據"""
-    global sensor_data
-    if os.path.exists(CSV_FILE):
-        try:
-            with open(CSV_FILE, 'r', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                loaded_data = []
-                for row in reader:
-                    data_dict = {
-                        'timestamp': row['時間戳記'],
-                        'light_status': row['電燈狀態'],
-                        'temperature': float(row['溫度']),
-                        'humidity': float(row['濕度'])
-                    }
-                    loaded_data.append(data_dict)
-                
-                # 只保留最近 100 筆
-                sensor_data = loaded_data[-100:]
-                
-                # 更新最新數據
-                if sensor_data:
-                    global latest_data
-                    latest_data = sensor_data[-1].copy()
-                
-                print(f"✅ 已載入 {len(sensor_data)} 筆歷史數據")
-        except Exception as e:
-            print(f"⚠️  載入 CSV 檔案時發生錯誤: {e}")
+# 批次寫入設定
+CSV_BATCH_SIZE = 200          # 累積幾筆寫入一次
+CSV_FLUSH_INTERVAL = 1.0      # 最多等待幾秒寫入一次
+CSV_FSYNC_POLICY = FSYNC_INTERVAL   # SQLite 後端對應到 PRAGMA synchronous（none=OFF / batch=FULL / interval=NORMAL）
+CSV_FSYNC_INTERVAL = 5.0      # interval 策略下 fsync 的最短間隔（秒）
+CSV_INDEX_BUCKET_SECONDS = 300  # 稀疏索引每 5 分鐘記錄一個位置
 
-def save_to_csv(data):
-    """儲存數據到 CSV 檔案"""
-    file_exists = os.path.exists(CSV_FILE)
-    
-    with open(CSV_FILE, 'a', newline='', encoding='utf-8') as f:
-        fieldnames = ['時間戳記', '電燈狀態', '溫度', '濕度']
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        
-        if not file_exists:
-            writer.writeheader()
-        
-        writer.writerow(data)
+# 滾動統計：已結束的固定視窗寫入這個檔案，重新啟動後仍可查詢
+STATS_FILE = 'sensor_stats.csv'
+
+# 記憶體狀態檢查點（checkpoint.py）：重新啟動時直接讀回，不必從歸檔重新解析
+CHECKPOINT_FILE = 'sensor_state.ckpt'
+CHECKPOINT_INTERVAL = 60.0      # 每幾秒寫入一次（數據沒有改變時略過）
+
+# 警報規則（alerts.py）：規則檔修改後自動重新載入，警報透過 Socket.IO、MQTT 與日誌通知
+ALERT_RULES_FILE = 'alert_rules.json'
+ALERT_TOPIC = "{device}/警報"    # 每個房間的警報主題（不會與訂閱的 +/感測器 重疊）
+ALERT_TICK_INTERVAL = 5.0       # 每幾秒檢查 silent 規則與規則檔是否修改
+
+# 接收佇列設定：MQTT 回調只放入佇列，由工作執行緒解析、儲存與推送
+INGEST_QUEUE_SIZE = 10_000                   # 佇列上限
+INGEST_WORKERS = 1                           # 工作執行緒數量（大於 1 時不保證序號順序）
+INGEST_BACKPRESSURE = BACKPRESSURE_DROP_OLDEST  # 佇列滿時: drop_oldest / block / drop_new
+INGEST_BLOCK_TIMEOUT = 1.0                   # block 策略最多阻擋 MQTT 執行緒幾秒
+
+# 儲存後端：MQTT 回調只負責放入批次寫入佇列
+storage = create_storage(
+    STORAGE_BACKEND,
+    CSV_FILE,
+    SQLITE_FILE,
+    batch_size=CSV_BATCH_SIZE,
+    flush_interval=CSV_FLUSH_INTERVAL,
+    fsync_policy=CSV_FSYNC_POLICY,
+    fsync_interval=CSV_FSYNC_INTERVAL,
+    bucket_seconds=CSV_INDEX_BUCKET_SECONDS,
+)
+
+def notify_alert(alert):
+    """警報通知：推送到前端、發布到 MQTT 警報主題並寫入日誌"""
+    if alert['state'] == STATE_FIRING:
+        logger.warning("🚨 警報 [%s] %s: %s", alert['device'], alert['rule'], alert['message'])
+    else:
+        logger.info("✅ 警報解除 [%s] %s", alert['device'], alert['rule'])
+    socketio.emit('alert', alert)
+    if mqtt_connected:
+        mqtt_client.publish(ALERT_TOPIC.format(device=alert['device']),
+                            json.dumps(alert, ensure_ascii=False), qos=1)
+
+alert_engine = AlertEngine(ALERT_RULES_FILE, notify=notify_alert)
+
+# 每個裝置 1 分鐘 / 5 分鐘 / 1 小時的滾動統計（每筆數據 O(1) 更新）
+stats_archive = StatsArchive(STATS_FILE)
+rolling_stats = RollingAggregates(WINDOWS, stats_archive)
+
+def storage_source():
+    """檢查點記錄的歸檔識別（更換儲存後端或檔案時不使用舊的檢查點）"""
+    return f"{storage.name}:{os.path.abspath(CSV_FILE if storage.name == BACKEND_CSV else SQLITE_FILE)}"
+
+def load_checkpoint_state():
+    """
+    從檢查點還原記憶體狀態
+
+    Returns:
+        bool: 成功回傳 True；檢查點不存在、損壞或比歸檔舊時回傳 False（改從歸檔載入）
+    """
+    t0 = time.perf_counter()
+    try:
+        tail = storage.tail(1)
+        archive_latest = tail[0][0] if tail else None
+        meta = load_checkpoint(CHECKPOINT_FILE, sensor_data, devices, rolling_stats,
+                               source=storage_source(), archive_latest=archive_latest)
+    except CheckpointError as e:
+        print(f"ℹ️  不使用檢查點: {e}")
+        return False
+    except Exception as e:
+        print(f"⚠️  讀取檢查點時發生錯誤: {e}")
+        return False
+    print(f"⚡ 已從檢查點還原 {len(sensor_data)} 筆歷史數據（{len(devices)} 個裝置），"
+          f"{meta['bytes'] / 1024:.0f} KB，{(time.perf_counter() - t0) * 1000:.1f} ms")
+    return True
+
+def load_history():
+    """
+    載入最近的歷史數據：優先使用檢查點，不能使用時從儲存後端載入最近 HISTORY_CAPACITY 筆
+    CSV 由檔尾往回讀取、SQLite 由時間索引讀取，啟動時間與歸檔大小無關
+    """
+    global checkpoint_total
+    try:
+        if load_checkpoint_state():
+            checkpoint_total = sensor_data.total
+        else:
+            for *row, device in storage.tail(HISTORY_CAPACITY, with_device=True):
+                sensor_data.append(*row)
+                devices.record(device, *row)
+                rolling_stats.add(device, *row)
+            print(f"✅ 已載入 {len(sensor_data)} 筆歷史數據（{len(devices)} 個裝置）")
+        for name in devices.names():
+            alert_engine.seen(name, devices.get(name).last_seen)
+    except Exception as e:
+        print(f"⚠️  載入歷史數據時發生錯誤: {e}")
+
+# 上次寫入檢查點時的累計筆數（沒有新數據時不重寫）
+checkpoint_total = None
+
+def save_checkpoint():
+    """寫入檢查點（由 checkpoint 執行緒定期呼叫，程式結束時再寫一次）"""
+    global checkpoint_total
+    total = sensor_data.total
+    if total == checkpoint_total:
+        return
+    t0 = time.perf_counter()
+    try:
+        meta = write_checkpoint(CHECKPOINT_FILE, sensor_data, devices, rolling_stats, source=storage_source())
+    except Exception as e:
+        logger.error("寫入檢查點錯誤: %s", e)
+        return
+    checkpoint_total = total
+    CHECKPOINT_WRITE.observe(time.perf_counter() - t0)
+    logger.debug("💾 檢查點已寫入: %d bytes", meta['bytes'])
+
+# Prometheus 指標（/metrics）
+metrics = Registry()
+MQTT_RECEIVED = metrics.counter('mqtt_messages_received_total', 'MQTT 收到的訊息數')
+MQTT_PARSED = metrics.counter('mqtt_messages_parsed_total', '成功解析的訊息數')
+MQTT_FAILED = metrics.counter('mqtt_messages_failed_total', '處理失敗的訊息數')
+MQTT_DROPPED = metrics.counter('mqtt_messages_dropped_total', '接收佇列已滿而丟棄的訊息數')
+MQTT_RECONNECTS = metrics.counter('mqtt_reconnects_total', 'MQTT 重新連線次數')
+MQTT_DUPLICATES = metrics.counter('mqtt_samples_duplicate_total', '依裝置序號判斷為重複而略過的數據筆數')
+SEQUENCE_MISSING = metrics.gauge('mqtt_samples_missing', '依裝置序號判斷為缺號（尚未補到）的筆數')
+SEQUENCE_REORDERED = metrics.counter('mqtt_samples_reordered_total', '比裝置最大序號晚到的數據筆數')
+MQTT_UP = metrics.gauge('mqtt_connected', 'MQTT 是否已連線（1 / 0）')
+INGEST_QUEUE_DEPTH = metrics.gauge('ingest_queue_depth', '接收佇列目前長度')
+INGEST_QUEUE_WAIT = metrics.histogram('ingest_queue_wait_seconds', '訊息在接收佇列中等待的時間')
+INGEST_STAGE = metrics.histogram('ingest_stage_seconds', '各處理階段的耗時（fanout 即 socketio.emit）', ['stage'])
+STORAGE_FLUSH = metrics.histogram('storage_flush_seconds', '儲存後端每次批次寫入的耗時')
+STORAGE_ROWS = metrics.counter('storage_rows_written_total', '儲存後端已寫入的筆數')
+STORAGE_FAILED_FLUSHES = metrics.counter('storage_flush_failures_total', '儲存後端批次寫入失敗的次數（失敗的批次會保留重試）')
+STORAGE_FAILED_ROWS = metrics.counter('storage_rows_failed_total', '寫入失敗的累計筆數（同一筆重試多次會重複計算）')
+STORAGE_RETRY_ROWS = metrics.gauge('storage_rows_retrying', '寫入失敗、等待重試的筆數')
+SOCKETIO_CLIENTS = metrics.gauge('socketio_clients', '目前連線的 Socket.IO 客戶端數')
+ALERTS_FIRED = metrics.counter('alerts_fired_total', '觸發的警報數（同一警報解除前只計一次）')
+ALERTS_ACTIVE = metrics.gauge('alerts_active', '目前觸發中的警報數')
+EXPORT_ACTIVE = metrics.gauge('exports_active', '目前進行中的匯出數')
+EXPORT_ROWS = metrics.counter('export_rows_total', '已匯出的數據筆數', ['format'])
+EXPORT_REJECTED = metrics.counter('exports_rejected_total', '同時匯出數已達上限而拒絕的請求數')
+CHECKPOINT_WRITE = metrics.histogram('checkpoint_write_seconds', '每次寫入記憶體狀態檢查點的耗時')
+mqtt_connect_count = 0
 
 def on_connect(client, userdata, flags, reason_code, properties):
     """MQTT 連線回調"""
-    global mqtt_connected
+    global mqtt_connected, mqtt_connect_count
     if reason_code.is_failure:
-        print(f"❌ MQTT 連線失敗: {reason_code}")
+        logger.error("❌ MQTT 連線失敗: %s", reason_code)
         mqtt_connected = False
     else:
-        print(f"✅ MQTT 連線成功")
+        logger.info("✅ MQTT 連線成功")
         mqtt_connected = True
-        client.subscribe(MQTT_TOPIC, qos=1)
-        print(f"✅ 已訂閱主題: {MQTT_TOPIC}")
+        mqtt_connect_count += 1
+        if mqtt_connect_count > 1:
+            MQTT_RECONNECTS.inc()
+        client.subscribe([(MQTT_TOPIC, 1), (MQTT_BINARY_TOPIC, 1)])
+        logger.info("✅ 已訂閱主題: %s, %s", MQTT_TOPIC, MQTT_BINARY_TOPIC)
+    snapshots.publish()
+    if shared_ring is not None:
+        shared_ring.set_flag(FLAG_MQTT_CONNECTED, mqtt_connected)
+    socketio.emit('status', {'mqtt_connected': mqtt_connected})
+
+def on_disconnect(client, userdata, flags, reason_code, properties):
+    """MQTT 斷線回調"""
+    global mqtt_connected
+    logger.warning("⚠️  MQTT 連線中斷: %s", reason_code)
+    mqtt_connected = False
+    snapshots.publish()
+    if shared_ring is not None:
+        shared_ring.set_flag(FLAG_MQTT_CONNECTED, False)
+    socketio.emit('status', {'mqtt_connected': mqtt_connected})
 
 def on_message(client, userdata, message):
-    """MQTT 訊息回調"""
-    global latest_data, sensor_data
+    """MQTT 訊息回調：只記錄接收時間並放入處理佇列，解析與寫入由工作執行緒負責"""
+    MQTT_RECEIVED.inc()
+    properties = getattr(message, 'properties', None)
+    content_type = getattr(properties, 'ContentType', None) if properties is not None else None
+    ingest_pipeline.submit((time.time(), message.topic, message.payload, content_type))
+
+def parse_stage(item):
+    """
+    處理階段 1：解析負載並提取數據
+
+    二進位負載（主題 /bin 後綴或 Content Type）一則訊息可包含多筆數據（Pico 端批次發布），
+    直接走訪 struct.iter_unpack 一次組成所有數據；其餘以 JSON 解析
+
+    Returns:
+        list: 數據 dict 的列表
+    """
+    received, topic, raw, content_type = item
+    device = topic.split('/')[0]
+
+    if is_binary(topic, content_type):
+        device_id, count, sent_at, records = unpack_binary(raw)
+        logger.debug("📨 收到二進位訊息: %s 裝置 %d，%d 筆", topic, device_id, count)
+        MQTT_PARSED.inc()
+        if not count:
+            return None
+        # 裝置的時鐘不一定準確：發送時間對齊接收時間，各筆保留與發送時間的間隔
+        # （斷線補傳的舊數據因此仍是當初的時間）
+        return [{
+            'epoch': received - (sent_at - timestamp),
+            'device': device,
+            'device_seq': seq,
+            'device_session': None,
+            'temperature': temperature / 100,
+            'humidity': humidity / 100,
+            'light': light if light in (0, 1) else LIGHT_UNKNOWN,
+            'light_status': decode_light(light),
+            'message_id': None,
+            'sent_at': None,
+        } for seq, timestamp, temperature, humidity, light in records]
+
+    payload = raw.decode('utf-8')
+    logger.debug("📨 收到訊息: %s", payload)
     
-    try:
-        payload = message.payload.decode('utf-8')
-        print(f"📨 收到訊息: {payload}")
-        
-        # 解析 JSON
-        data_dict = json.loads(payload)
-        
-        # 提取數據
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        temperature = data_dict.get('temperature', data_dict.get('temp', 0))
-        humidity = data_dict.get('humidity', data_dict.get('humi', 0))
-        light_status = data_dict.get('light_status', data_dict.get('light', '未知'))
-        
-        # 更新最新數據
-        latest_data = {
-            'light_status': light_status,
-            'temperature': temperature,
-            'humidity': humidity,
-            'timestamp': timestamp
-        }
-        
-        # 儲存到列表
-        sensor_data.append(latest_data.copy())
+    # 解析 JSON
+    data_dict = json.loads(payload)
+    MQTT_PARSED.inc()
+    
+    # 提取數據
+    light_status = data_dict.get('light_status', data_dict.get('light', '未知'))
+    # 裝置序號：沒有 seq 時使用整數的 message_id（test_mqtt_publish.py），QoS 1 重送的訊息因此可以去除
+    seq = data_dict.get('seq', data_dict.get('message_id'))
+    return [{
+        'epoch': received,
+        'device': device,
+        'device_seq': seq if isinstance(seq, int) else None,
+        # 發布端每次執行不同的識別碼：改變時序號重新計算（沒有帶時，QoS 1 從 1 開始的重送仍記為重複）
+        'device_session': data_dict.get('session'),
+        'temperature': float(data_dict.get('temperature', data_dict.get('temp', 0))),
+        'humidity': float(data_dict.get('humidity', data_dict.get('humi', 0))),
+        'light': encode_light(light_status),
+        'light_status': light_status,
+        # 負載測試（bench_mqtt_load.py）用來計算端對端延遲與遺失筆數，一般裝置不會送
+        'message_id': data_dict.get('message_id'),
+        'sent_at': data_dict.get('sent_at'),
+    }]
+
+def persist_stage(samples):
+    """
+    處理階段 2：寫入環形緩衝區並放入儲存後端的批次寫入佇列
+
+    帶有裝置序號的數據先去除重複（QoS 1 重新連線後 Broker 重送、Pico 斷線補傳或重新開機後重送）
+    時間只在同一個裝置內保持遞增（不早於該裝置的上一筆），其他裝置較新的數據不影響補傳數據的原始時間；
+    合併所有裝置的環形緩衝區與 CSV 索引因此可能收到較舊的數據，兩者都能處理
+
+    Returns:
+        list: 實際寫入的數據；全部重複時回傳 None（不進入後續階段）
+    """
+    accepted = []
+    for sample in samples:
+        if sample['device_seq'] is not None and not devices.accept(sample['device'], sample['device_seq'],
+                                                                   sample['device_session']):
+            MQTT_DUPLICATES.inc()
+            continue
+
+        epoch = sample['epoch'] = devices.clamp_timestamp(sample['device'], sample['epoch'])
         
-        # 只保留最近 100 筆
-        if len(sensor_data) > 100:
-            sensor_data.pop(0)
+        # 儲存到環形緩衝區（O(1)，超過容量自動覆蓋最舊的數據）
+        sample['seq'] = sensor_data.append(epoch, sample['temperature'], sample['humidity'], sample['light'])
+        devices.record(sample['device'], epoch, sample['temperature'], sample['humidity'], sample['light'])
+        if shared_ring is not None:
+            shared_ring.append(epoch, sample['temperature'], sample['humidity'], sample['light'], sample['device'])
         
-        # 儲存到 CSV
-        csv_data = {
-            '時間戳記': timestamp,
-            '電燈狀態': light_status,
-            '溫度': temperature,
-            '濕度': humidity
+        # 放入儲存後端的批次寫入佇列
+        storage.append(epoch, sample['light_status'], sample['temperature'], sample['humidity'],
+                       device=sample['device'])
+        accepted.append(sample)
+    # 最新數據與序號統計已改變，輪詢 API 的快照換新版本
+    snapshots.publish()
+    return accepted or None
+
+def aggregate_stage(samples):
+    """處理階段 3：更新該裝置的滾動統計"""
+    for sample in samples:
+        rolling_stats.add(sample['device'], sample['epoch'],
+                          sample['temperature'], sample['humidity'], sample['light'])
+    return samples
+
+def fanout_stage(samples):
+    """處理階段 4：透過 WebSocket 推送增量到前端（帶序號，客戶端不需再呼叫 /api/latest）"""
+    for sample in samples:
+        delta = {
+            'seq': sample['seq'],
+            'device': sample['device'],
+            'light_status': sample['light_status'],
+            'temperature': sample['temperature'],
+            'humidity': sample['humidity'],
+            'timestamp': format_timestamp(sample['epoch']),
+            'total_records': len(sensor_data)
         }
-        save_to_csv(csv_data)
-        
-        # 透過 WebSocket 推送到前端
-        socketio.emit('new_data', latest_data)
-        
-    except Exception as e:
-        print(f"處理訊息錯誤: {e}")
+        if sample['message_id'] is not None:
+            delta['message_id'] = sample['message_id']
+            delta['sent_at'] = sample['sent_at']
+        socketio.emit('delta', delta)
+    return samples
+
+def alert_stage(samples):
+    """處理階段 5：依警報規則檢查每筆數據（每條規則 O(1) 的增量狀態）"""
+    for sample in samples:
+        alert_engine.evaluate(sample['device'], sample['epoch'], sample)
+    return samples
+
+def observe_stage(name, seconds):
+    """接收管線的計時回調：寫入 Prometheus 分桶統計"""
+    if name == 'queue_wait':
+        INGEST_QUEUE_WAIT.observe(seconds)
+    else:
+        INGEST_STAGE.observe(seconds, stage=name)
+
+# MQTT 接收與處理分離：環形緩衝區的序號需要依序產生，預設只用 1 個工作執行緒
+ingest_pipeline = IngestPipeline(
+    [('parse', parse_stage), ('persist', persist_stage), ('aggregate', aggregate_stage),
+     ('fanout', fanout_stage), ('alert', alert_stage)],
+    maxsize=INGEST_QUEUE_SIZE,
+    workers=INGEST_WORKERS,
+    policy=INGEST_BACKPRESSURE,
+    block_timeout=INGEST_BLOCK_TIMEOUT,
+    on_timing=observe_stage,
+)
+MQTT_FAILED.set_function(lambda: ingest_pipeline.failed)
+MQTT_DROPPED.set_function(lambda: ingest_pipeline.dropped)
+MQTT_UP.set_function(lambda: int(mqtt_connected))
+SEQUENCE_MISSING.set_function(lambda: devices.sequence_totals()['missing'])
+SEQUENCE_REORDERED.set_function(lambda: devices.sequence_totals()['reordered'])
+INGEST_QUEUE_DEPTH.set_function(ingest_pipeline.depth)
+ALERTS_FIRED.set_function(lambda: alert_engine.fired)
+ALERTS_ACTIVE.set_function(lambda: len(alert_engine.active()))
+
+def observe_flush(seconds, rows):
+    """儲存後端的批次寫入回調"""
+    STORAGE_FLUSH.observe(seconds)
+    STORAGE_ROWS.inc(rows)
+
+storage.writer.flush_observer = observe_flush
+STORAGE_FAILED_FLUSHES.set_function(lambda: storage.writer.stats()['failed_flushes'])
+STORAGE_FAILED_ROWS.set_function(lambda: storage.writer.stats()['failed_rows'])
+STORAGE_RETRY_ROWS.set_function(lambda: storage.writer.stats()['retry_rows'])
 
 # 啟動 MQTT 客戶端
 mqtt_client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION2)
 mqtt_client.on_connect = on_connect
 mqtt_client.on_message = on_message
+mqtt_client.on_disconnect = on_disconnect
 
 def start_mqtt():
     """在背景執行緒中啟動 MQTT"""
@@ -145,15 +450,159 @@ def start_mqtt():
         mqtt_client.connect(MQTT_BROKER, MQTT_PORT, 60)
         mqtt_client.loop_forever()
     except Exception as e:
-        print(f"MQTT 錯誤: {e}")
+        logger.error("MQTT 錯誤: %s", e)
 
-# 啟動前先載入歷史數據
-print("📂 載入歷史數據...")
-load_from_csv()
+def run_alert_ticker():
+    """定期檢查 silent 規則，並在規則檔修改時重新載入"""
+    while True:
+        time.sleep(ALERT_TICK_INTERVAL)
+        try:
+            alert_engine.tick()
+        except Exception as e:
+            logger.error("警報檢查錯誤: %s", e)
 
-# 在背景執行緒中啟動 MQTT
-mqtt_thread = threading.Thread(target=start_mqtt, daemon=True)
-mqtt_thread.start()
+def run_checkpointer():
+    """定期寫入記憶體狀態檢查點"""
+    while True:
+        time.sleep(CHECKPOINT_INTERVAL)
+        save_checkpoint()
+
+def seed_shared_ring():
+    """把已載入的各裝置歷史依時間順序寫入共用環形緩衝區（工作程序啟動後就有數據可查）"""
+    streams = []
+    for name in devices.names():
+        timestamps, temperatures, humidities, lights = devices.get(name).history.columns()
+        streams.append(zip(timestamps, temperatures, humidities, lights, [name] * len(timestamps)))
+    for row in heapq.merge(*streams, key=lambda row: row[0]):
+        shared_ring.append(*row)
+
+app_started = False
+
+def create_app(start_mqtt_client=True, shared_ring_path=None):
+    """
+    載入歷史數據並啟動背景工作（匯入模組本身不會讀檔或啟動執行緒，工具與測試可以便宜地匯入）
+
+    重複呼叫時不會再啟動一次
+
+    Args:
+        start_mqtt_client: 是否連線 MQTT Broker（測試時可關閉，直接呼叫 on_message 送入訊息）
+        shared_ring_path: 多程序部署時共用環形緩衝區的檔案（app_workers.py 指定），None 表示不建立
+
+    Returns:
+        Flask: app
+    """
+    global app_started, shared_ring
+    if app_started:
+        return app
+    app_started = True
+    setup_logging(LOG_LEVEL, rate=1.0, burst=5)
+
+    # 啟動前先載入歷史數據（先讀回已保存的統計視窗，重新播放歷史時才不會重複寫入）
+    stats_archive.open()
+    atexit.register(stats_archive.close)
+    print("📂 載入歷史數據...")
+    load_history()
+    alert_engine.load_file()
+    if shared_ring_path is not None:
+        shared_ring = SharedRingBuffer.create(shared_ring_path, HISTORY_CAPACITY, MAX_DEVICES)
+        seed_shared_ring()
+        print(f"🧠 共用環形緩衝區: {shared_ring_path}（{len(shared_ring)} 筆）")
+
+    # 啟動儲存後端的批次寫入，程式結束時寫入剩餘數據
+    storage.open()
+    atexit.register(storage.close)
+
+    # atexit 後註冊先執行：先處理完佇列、寫入最後的檢查點，再關閉儲存
+    atexit.register(save_checkpoint)
+    ingest_pipeline.start()
+    atexit.register(ingest_pipeline.stop)
+
+    # 在背景執行緒中啟動 MQTT
+    if start_mqtt_client:
+        threading.Thread(target=start_mqtt, name='mqtt', daemon=True).start()
+    threading.Thread(target=run_alert_ticker, name='alert-ticker', daemon=True).start()
+    threading.Thread(target=run_checkpointer, name='checkpointer', daemon=True).start()
+    return app
+
+def parse_time_param(value):
+    """
+    解析查詢參數中的時間
+
+    支援 'YYYY-MM-DD HH:MM:SS'、'YYYY-MM-DDTHH:MM:SS'、'YYYY-MM-DD' 或 epoch 秒數
+
+    Returns:
+        float: epoch 秒數，未提供時回傳 None
+    """
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    return datetime.fromisoformat(value.replace('T', ' ')).timestamp()
+
+def downsampled_history(start, end, points, method, buffer=None, device=None):
+    """
+    取得時間範圍內降採樣後的歷史數據
+
+    範圍在記憶體保有完整數據的期間內時直接使用環形緩衝區的陣列，否則從儲存後端讀取
+    （CSV 依寫入順序回傳，裝置補傳的數據可能夾在較新的數據之後，降採樣前依時間排序）
+
+    Args:
+        buffer: 使用的環形緩衝區（預設為所有裝置合併的 sensor_data）
+        device: 從儲存後端讀取時只取此裝置的數據
+    """
+    buffer = sensor_data if buffer is None else buffer
+    complete = buffer.complete_since()
+    if start is None or (complete is not None and start >= complete):
+        columns = buffer.columns(start, end)
+    else:
+        columns = (array('d'), array('f'), array('f'), array('b'))
+        rows = sorted(storage.iter_range(start, end, DOWNSAMPLE_MAX_SOURCE_ROWS, device), key=itemgetter(0))
+        for row in rows:
+            for column, value in zip(columns, row):
+                column.append(value)
+
+    timestamps, temperatures, humidities, lights = columns
+    indices = downsample_indices(timestamps, [temperatures, humidities], points, method)
+    return [make_record(timestamps[i], temperatures[i], humidities[i], lights[i]) for i in indices]
+
+def build_snapshot():
+    """建立即時串流的快照：最新數據、降採樣後的歷史與目前序號"""
+    return {
+        'stream': STREAM_ID,
+        'seq': sensor_data.total,
+        'latest': sensor_data.latest() or EMPTY_LATEST,
+        'history': downsampled_history(None, None, SNAPSHOT_POINTS, METHOD_LTTB),
+        'mqtt_connected': mqtt_connected,
+        'total_records': len(sensor_data),
+        'alerts': alert_engine.active()
+    }
+
+@socketio.on('connect')
+def handle_connect(auth=None):
+    """
+    Socket.IO 連線：客戶端帶上次的 stream 與 seq 時只補送漏掉的增量，否則送快照
+
+    auth 格式: {'stream': '...', 'since': 最後收到的序號}
+    """
+    SOCKETIO_CLIENTS.inc()
+    if auth and auth.get('stream') == STREAM_ID and isinstance(auth.get('since'), int):
+        missed = sensor_data.since(auth['since'])
+        if missed is not None and len(missed) <= RESUME_MAX_DELTAS:
+            emit('resume', {
+                'stream': STREAM_ID,
+                'deltas': [{'seq': seq, **record} for seq, record in missed],
+                'mqtt_connected': mqtt_connected,
+                'total_records': len(sensor_data)
+            })
+            return
+    emit('snapshot', build_snapshot())
+
+@socketio.on('disconnect')
+def handle_disconnect(*args):
+    """Socket.IO 斷線（更新 /metrics 的連線數）"""
+    SOCKETIO_CLIENTS.dec()
 
 @app.route('/')
 def index():
@@ -162,26 +611,259 @@ def index():
 
 @app.route('/api/latest')
 def get_latest():
-    """取得最新數據 API"""
-    return jsonify({
-        **latest_data,
+    """取得最新數據 API（同一版本的回應只序列化一次）"""
+    snapshot = snapshots.get(('latest', None), lambda: {
+        **(sensor_data.latest() or EMPTY_LATEST),
         'mqtt_connected': mqtt_connected,
-        'total_records': len(sensor_data)
+        'total_records': len(sensor_data),
+        'sequence': devices.sequence_totals()
     })
+    return snapshot_response(snapshot, request, Response)
+
+def history_response(buffer, device=None):
+    """
+    依查詢參數回傳歷史數據（/api/history 與 /api/history/<device> 共用）
+
+    Args:
+        buffer: 最近數據使用的環形緩衝區
+        device: 查詢儲存後端時只取此裝置的數據，None 表示全部
+    """
+    try:
+        start = parse_time_param(request.args.get('from'))
+        end = parse_time_param(request.args.get('to'))
+    except ValueError:
+        return jsonify({'error': '時間格式錯誤，請使用 YYYY-MM-DD HH:MM:SS 或 epoch 秒數'}), 400
+
+    points = request.args.get('points', type=int)
+    if points:
+        method = request.args.get('method', METHOD_LTTB)
+        if method not in METHODS:
+            return jsonify({'error': f'method 必須是 {", ".join(METHODS)} 其中之一'}), 400
+        points = max(3, min(points, DOWNSAMPLE_MAX_POINTS))
+
+        if start is None and end is None:
+            # 整段記憶體數據：與 limit 查詢一樣使用快照，每個版本只降採樣並序列化一次
+            snapshot = snapshots.get(('history', device, 'points', points, method),
+                                     lambda: downsampled_history(None, None, points, method, buffer, device))
+            return snapshot_response(snapshot, request, Response)
+
+        # 單一裝置的範圍已完全過去時結果不會再變（該裝置的時間遞增），否則以累計筆數作為資料版本；
+        # 所有裝置合併時，其他裝置補傳的數據仍可能落在過去的範圍內
+        latest = buffer.latest_timestamp()
+        final = device is not None and end is not None and latest is not None and end < latest
+        version = 0 if final else buffer.total
+        return jsonify(downsample_cache.get_or_compute(
+            (device, start, end, points, method), version,
+            lambda: downsampled_history(start, end, points, method, buffer, device)))
+
+    limit = request.args.get('limit', HISTORY_DEFAULT_LIMIT, type=int)
+
+    if start is None and end is None:
+        # 最近的數據直接從記憶體讀取（同一版本的回應只序列化一次）
+        limit = max(0, min(limit, buffer.capacity))
+        snapshot = snapshots.get(('history', device, limit), lambda: buffer.records(limit))
+        return snapshot_response(snapshot, request, Response)
+
+    # 時間範圍查詢：CSV 為一次 seek 加上一段循序讀取，SQLite 由時間索引查詢
+    limit = max(0, min(limit, HISTORY_RANGE_MAX_LIMIT))
+    rows = storage.query(start, end, limit, device)
+    return jsonify([make_record(*row) for row in rows])
 
 @app.route('/api/history')
 def get_history():
-    """取得歷史數據 API"""
-    return jsonify(sensor_data)
+    """
+    取得歷史數據 API（所有裝置合併）
+
+    Query 參數:
+        from / to: 時間範圍（任一有指定時改由儲存後端查詢）
+        limit: 最多回傳幾筆（預設 HISTORY_DEFAULT_LIMIT）
+        points: 降採樣的目標點數（指定時忽略 limit，回傳整個範圍保留形狀的數據）
+        method: 降採樣方法 lttb（預設）或 minmax
+    """
+    return history_response(sensor_data)
+
+@app.route('/api/devices')
+def get_devices():
+    """裝置列表 API（每個裝置的訊息數、最後上線時間與最新數據）"""
+    return jsonify(devices.summaries())
+
+@app.route('/api/latest/<device>')
+def get_device_latest(device):
+    """取得指定裝置的最新數據 API"""
+    state = devices.get(device)
+    if state is None:
+        return jsonify({'error': f'找不到裝置: {device}'}), 404
+    snapshot = snapshots.get(('latest', device), lambda: {
+        **(state.latest() or EMPTY_LATEST),
+        'device': device,
+        'mqtt_connected': mqtt_connected,
+        'total_records': len(state.history),
+        'sequence': state.sequence.as_dict()
+    })
+    return snapshot_response(snapshot, request, Response)
+
+@app.route('/api/history/<device>')
+def get_device_history(device):
+    """取得指定裝置的歷史數據 API（Query 參數同 /api/history）"""
+    state = devices.get(device)
+    if state is None:
+        return jsonify({'error': f'找不到裝置: {device}'}), 404
+    return history_response(state.history, device)
+
+@app.route('/api/aggregate')
+def get_aggregate():
+    """
+    時間範圍統計 API（筆數、溫濕度最小/最大/平均、開燈比例）
+
+    Query 參數:
+        from / to: 時間範圍（未指定表示全部）
+        device: 裝置名稱（未指定表示全部裝置）
+    """
+    try:
+        start = parse_time_param(request.args.get('from'))
+        end = parse_time_param(request.args.get('to'))
+    except ValueError:
+        return jsonify({'error': '時間格式錯誤，請使用 YYYY-MM-DD HH:MM:SS 或 epoch 秒數'}), 400
+    return jsonify(storage.aggregate(start, end, request.args.get('device')))
+
+@app.route('/api/export')
+def export_data():
+    """
+    匯出歷史數據 API（串流下載，不會把整個範圍載入記憶體）
+
+    Query 參數:
+        format: csv（預設）或 xlsx
+        from / to: 時間範圍（未指定表示全部）
+        device: 裝置名稱（未指定表示全部裝置）
+    """
+    fmt = request.args.get('format', FORMAT_CSV)
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f'format 必須是 {", ".join(EXPORT_FORMATS)} 其中之一'}), 400
+    if fmt == FORMAT_XLSX and not HAS_OPENPYXL:
+        return jsonify({'error': '伺服器未安裝 openpyxl，無法匯出 xlsx'}), 501
+    try:
+        start = parse_time_param(request.args.get('from'))
+        end = parse_time_param(request.args.get('to'))
+    except ValueError:
+        return jsonify({'error': '時間格式錯誤，請使用 YYYY-MM-DD HH:MM:SS 或 epoch 秒數'}), 400
+
+    if not export_slots.acquire(blocking=False):
+        EXPORT_REJECTED.inc()
+        return jsonify({'error': f'同時匯出數已達上限（{EXPORT_MAX_CONCURRENT}），請稍後再試'}), 429, {'Retry-After': '5'}
+    EXPORT_ACTIVE.inc()
+
+    def release():
+        EXPORT_ACTIVE.dec()
+        export_slots.release()
+
+    # 逐筆讀取儲存後端（CSV 為獨立的唯讀檔案、SQLite 為 WAL 唯讀連線），不會阻擋接收執行緒的寫入
+    rows = storage.iter_range(start, end, None, request.args.get('device'), with_device=True)
+    body = iter_export(fmt, rows, progress=lambda n: EXPORT_ROWS.inc(n, format=fmt))
+    filename = f"sensor_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}"
+    response = Response(body, content_type=EXPORT_CONTENT_TYPES[fmt],
+                        headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+    # 下載完成或客戶端中斷時都會呼叫，確保釋放匯出名額
+    response.call_on_close(release)
+    return response
+
+@app.route('/api/alerts')
+def get_alerts():
+    """警報 API：觸發中的警報、最近的通知（含解除）與規則統計"""
+    return jsonify({
+        'active': alert_engine.active(),
+        'recent': list(alert_engine.recent),
+        **alert_engine.stats()
+    })
+
+@app.route('/api/alerts/reload', methods=['POST'])
+def reload_alerts():
+    """立即重新載入警報規則檔（平時每 ALERT_TICK_INTERVAL 秒自動檢查）"""
+    reloaded = alert_engine.load_file(force=True)
+    return jsonify({'reloaded': reloaded, **alert_engine.stats()}), 200 if reloaded else 400
+
+@app.route('/api/stats')
+def get_stats():
+    """
+    滾動統計 API（直接回傳持續更新的統計，不掃描數據）
+
+    Query 參數:
+        window: 視窗長度 1m / 5m / 1h（預設 5m）
+        device: 裝置名稱（未指定表示所有裝置）
+        closed: 附上最近幾個已結束的固定視窗（預設 1）
+
+    回傳每個裝置的 sliding（最近一段時間）、tumbling（目前的固定視窗）與 closed
+    """
+    window = request.args.get('window', '5m')
+    if window not in WINDOWS:
+        return jsonify({'error': f'window 必須是 {", ".join(WINDOWS)} 其中之一'}), 400
+    closed = max(0, min(request.args.get('closed', 1, type=int), CLOSED_KEEP))
+    device = request.args.get('device')
+    result = rolling_stats.snapshot(window, datetime.now().timestamp(), device, closed)
+    if result is None:
+        return jsonify({'error': f'找不到裝置: {device}'}), 404
+    return jsonify({'window': window, 'devices': result})
+
+@app.route('/metrics')
+def get_metrics():
+    """Prometheus 指標"""
+    return metrics.render(), 200, {'Content-Type': METRICS_CONTENT_TYPE}
+
+@app.route('/api/profile', methods=['GET', 'POST'])
+def profile():
+    """
+    執行中抽樣 cProfile 接收工作執行緒
+
+    POST /api/profile?action=start&sample=0.1  開始分析 10% 的訊息
+    POST /api/profile?action=stop              停止並回傳 pstats 報表（純文字）
+    GET  /api/profile                          目前是否正在分析
+    """
+    if request.method == 'GET':
+        return jsonify({'profiling': ingest_pipeline.profiling})
+    action = request.args.get('action')
+    if action == 'start':
+        sample = request.args.get('sample', 0.1, type=float)
+        ingest_pipeline.start_profile(sample)
+        logger.info("🔬 開始抽樣分析（%.0f%% 的訊息）", sample * 100)
+        return jsonify({'profiling': True, 'sample': sample})
+    if action == 'stop':
+        report = ingest_pipeline.stop_profile()
+        if report is None:
+            return jsonify({'error': '目前沒有在分析'}), 409
+        return report, 200, {'Content-Type': 'text/plain; charset=utf-8'}
+    return jsonify({'error': 'action 必須是 start 或 stop'}), 400
+
+@app.route('/api/log-level', methods=['POST'])
+def change_log_level():
+    """執行中調整日誌等級（?level=DEBUG 可查看每筆訊息）"""
+    level = request.args.get('level', '').upper()
+    if level not in ('DEBUG', 'INFO', 'WARNING', 'ERROR'):
+        return jsonify({'error': 'level 必須是 DEBUG / INFO / WARNING / ERROR'}), 400
+    set_level(level)
+    return jsonify({'level': level})
+
+@app.route('/api/pipeline')
+def get_pipeline():
+    """接收管線統計 API（佇列長度、丟棄筆數、各階段延遲、儲存寫入統計）"""
+    return jsonify({
+        **ingest_pipeline.stats(),
+        'storage': storage.stats(),
+        'snapshots': snapshots.stats()
+    })
 
 if __name__ == '__main__':
+    create_app()
     print("=" * 60)
     print(" Flask MQTT 監控應用程式")
     print("=" * 60)
     print(f" 啟動中...")
     print(f" MQTT Broker: {MQTT_BROKER}:{MQTT_PORT}")
-    print(f" MQTT Topic: {MQTT_TOPIC}")
-    print(f" CSV 檔案: {CSV_FILE}")
+    print(f" MQTT Topic: {MQTT_TOPIC}（JSON）, {MQTT_BINARY_TOPIC}（二進位）")
+    print(f" 儲存後端: {storage.name} ({CSV_FILE if storage.name == BACKEND_CSV else SQLITE_FILE})")
+    print(f" 記憶體歷史容量: {HISTORY_CAPACITY} 筆（每個裝置 {DEVICE_HISTORY_CAPACITY} 筆，最多 {MAX_DEVICES} 個裝置）")
+    print(f" 批次寫入: 每 {CSV_BATCH_SIZE} 筆或 {CSV_FLUSH_INTERVAL} 秒, fsync={CSV_FSYNC_POLICY}")
+    print(f" 檢查點: {CHECKPOINT_FILE}（每 {CHECKPOINT_INTERVAL:g} 秒）")
+    print(f" 警報規則: {ALERT_RULES_FILE}（{len(alert_engine)} 條）, 通知主題: {ALERT_TOPIC}")
+    print(f" 接收佇列: {INGEST_QUEUE_SIZE} 筆, {INGEST_WORKERS} 個工作執行緒, 背壓={INGEST_BACKPRESSURE}")
     print("=" * 60)
     
     socketio.run(app, host='0.0.0.0', port=8080, debug=False, allow_unsafe_werkzeug=True)
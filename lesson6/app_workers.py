@@ -0,0 +1,344 @@
+"""
+多程序部署（共用記憶體環形緩衝區）
+單一程序時 HTTP、WebSocket 與 MQTT 共用同一個 GIL；這裡把接收與讀取分成不同程序：
+
+    接收程序 × 1 : app_flask.create_app(shared_ring_path=...)，訂閱 MQTT、寫入歸檔、統計與警報，
+                   每筆數據另外寫入共用環形緩衝區（shared_ring.py）；完整的 API 只開在 127.0.0.1:INGEST_PORT
+    工作程序 × N : 共用 fork 前建立的監聽 socket，以唯讀 mmap 讀取共用環形緩衝區，直接回應
+                   /、/api/latest、/api/latest/<裝置>、/api/history、/api/history/<裝置>（limit 查詢），
+                   並每 FANOUT_INTERVAL 秒檢查新數據、以 Socket.IO 推送增量；
+                   其他 /api/*（時間範圍、降採樣、統計、匯出、警報、裝置列表…）與 /metrics 轉送給接收程序
+
+讀取端不取得任何鎖，工作程序再多也不會拖慢接收程序的寫入，也不需要 Redis 等外部服務
+    - 長輪詢的多個請求可能分到不同工作程序，網頁在這個模式只使用 WebSocket
+    - 警報的 'alert' 事件只由接收程序推送；工作程序的客戶端在連線時從 /api/alerts 取得觸發中的警報
+
+使用方式:
+    uv run python app_workers.py                     # 工作程序數 = CPU 核心數
+    uv run python app_workers.py --workers 4 --port 8080
+"""
+
+import argparse
+import http.client
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import tempfile
+from urllib.parse import quote
+
+from flask import Flask, Response, render_template, jsonify, request
+from flask_socketio import SocketIO, emit
+from werkzeug.serving import make_server
+
+import app_flask
+from app_flask import (EMPTY_LATEST, HISTORY_DEFAULT_LIMIT, DEVICE_HISTORY_CAPACITY, SNAPSHOT_POINTS,
+                       RESUME_MAX_DELTAS)
+from downsample import DownsampleCache, downsample_indices, METHOD_LTTB
+from ring_buffer import make_record
+from shared_ring import SharedRingBuffer, FLAG_MQTT_CONNECTED
+from snapshots import SnapshotCache, snapshot_response
+
+PORT = 8080
+INGEST_PORT = 8081
+WORKERS = os.cpu_count() or 1
+
+# 共用環形緩衝區的檔案放在記憶體檔案系統（Linux 的 /dev/shm），沒有時放在暫存目錄
+SHARED_RING_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+# 工作程序每幾秒檢查一次新數據並推送增量
+FANOUT_INTERVAL = 0.1
+
+# 轉送給接收程序的逾時秒數（匯出大檔案時需要較長）
+PROXY_TIMEOUT = 300
+PROXY_CHUNK_SIZE = 64 * 1024
+# 逐段連線相關的標頭，轉送時不複製
+HOP_HEADERS = {'connection', 'keep-alive', 'transfer-encoding', 'te', 'trailer', 'upgrade', 'host'}
+
+logger = logging.getLogger('app_workers')
+
+
+def proxy_to_ingest(ingest_port):
+    """把目前的請求轉送給接收程序，串流回傳結果"""
+    conn = http.client.HTTPConnection('127.0.0.1', ingest_port, timeout=PROXY_TIMEOUT)
+    target = quote(request.path)
+    if request.query_string:
+        target += '?' + request.query_string.decode('latin-1')
+    headers = {k: v for k, v in request.headers if k.lower() not in HOP_HEADERS}
+    try:
+        conn.request(request.method, target, body=request.get_data() or None, headers=headers)
+        upstream = conn.getresponse()
+    except OSError as e:
+        conn.close()
+        return jsonify({'error': f'接收程序沒有回應: {e}'}), 502
+
+    def body():
+        try:
+            while True:
+                chunk = upstream.read(PROXY_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            conn.close()
+
+    response_headers = [(k, v) for k, v in upstream.getheaders() if k.lower() not in HOP_HEADERS]
+    return Response(body(), status=upstream.status, headers=response_headers)
+
+
+def fetch_ingest_json(ingest_port, path):
+    """向接收程序取得 JSON（失敗時回傳 None）"""
+    conn = http.client.HTTPConnection('127.0.0.1', ingest_port, timeout=2)
+    try:
+        conn.request('GET', path)
+        response = conn.getresponse()
+        return json.loads(response.read()) if response.status == 200 else None
+    except (OSError, ValueError):
+        return None
+    finally:
+        conn.close()
+
+
+def make_delta(row, total_records):
+    """共用緩衝區的一筆數據轉為 Socket.IO 增量（與 app_flask.fanout_stage 相同欄位）"""
+    seq, ts, temperature, humidity, light, device = row
+    return {'seq': seq, 'device': device, **make_record(ts, temperature, humidity, light),
+            'total_records': total_records}
+
+
+def create_worker_app(ring, ingest_port=INGEST_PORT):
+    """
+    建立工作程序的 Flask app（在 fork 之後的子程序中呼叫，會啟動推送增量的背景執行緒）
+
+    Args:
+        ring: 唯讀開啟的 SharedRingBuffer
+        ingest_port: 接收程序的 API 連接埠（轉送用）
+
+    Returns:
+        tuple: (app, socketio)
+    """
+    app = Flask(__name__)
+    socketio = SocketIO(app, cors_allowed_origins="*")
+    snapshots = SnapshotCache(max_entries=64, max_bytes=64 * 1024 * 1024, dumps=app.json.dumps)
+    downsample_cache = DownsampleCache(max_entries=8, ttl=1.0)
+    seen = {'version': None}
+
+    def refresh():
+        """共用緩衝區有新數據或 MQTT 連線狀態改變時，快照換新版本；回傳連線狀態"""
+        connected = ring.flag(FLAG_MQTT_CONNECTED)
+        version = (ring.total, connected)
+        if version != seen['version']:
+            seen['version'] = version
+            snapshots.publish()
+        return connected
+
+    def snapshot_history():
+        """整個共用緩衝區降採樣到 SNAPSHOT_POINTS 點（同一個累計筆數只計算一次）"""
+        def compute():
+            rows = ring.rows()
+            timestamps = [row[1] for row in rows]
+            series = [[row[2] for row in rows], [row[3] for row in rows]]
+            return [make_record(*rows[i][1:5])
+                    for i in downsample_indices(timestamps, series, SNAPSHOT_POINTS, METHOD_LTTB)]
+        return downsample_cache.get_or_compute('snapshot', ring.total, compute)
+
+    def build_snapshot():
+        """與 app_flask.build_snapshot 相同格式；stream 為寫入端識別碼，所有工作程序相同"""
+        alerts = fetch_ingest_json(ingest_port, '/api/alerts')
+        return {
+            'stream': ring.writer_id,
+            'seq': ring.total,
+            'latest': ring.latest() or EMPTY_LATEST,
+            'history': snapshot_history(),
+            'mqtt_connected': ring.flag(FLAG_MQTT_CONNECTED),
+            'total_records': len(ring),
+            'alerts': alerts['active'] if alerts else [],
+        }
+
+    @socketio.on('connect')
+    def handle_connect(auth=None):
+        """客戶端帶上次的 stream 與 seq 時只補送漏掉的增量（任何一個工作程序都能補送），否則送快照"""
+        if auth and auth.get('stream') == ring.writer_id and isinstance(auth.get('since'), int):
+            missed = ring.since(auth['since'])
+            if missed is not None and len(missed) <= RESUME_MAX_DELTAS:
+                total_records = len(ring)
+                emit('resume', {
+                    'stream': ring.writer_id,
+                    'deltas': [make_delta(row, total_records) for row in missed],
+                    'mqtt_connected': ring.flag(FLAG_MQTT_CONNECTED),
+                    'total_records': total_records
+                })
+                return
+        emit('snapshot', build_snapshot())
+
+    @app.route('/')
+    def index():
+        """主頁（只使用 WebSocket）"""
+        return render_template('index.html', websocket_only=True)
+
+    @app.route('/api/latest')
+    def get_latest():
+        """最新數據（共用緩衝區，同一版本只序列化一次）"""
+        connected = refresh()
+        snapshot = snapshots.get(('latest', None), lambda: {
+            **(ring.latest() or EMPTY_LATEST),
+            'mqtt_connected': connected,
+            'total_records': len(ring)
+        })
+        return snapshot_response(snapshot, request, Response)
+
+    @app.route('/api/latest/<device>')
+    def get_device_latest(device):
+        """指定裝置的最新數據"""
+        info = ring.device_info(device)
+        if info is None:
+            return jsonify({'error': f'找不到裝置: {device}'}), 404
+        connected = refresh()
+        snapshot = snapshots.get(('latest', device), lambda: {
+            **(ring.latest(device) or EMPTY_LATEST),
+            'device': device,
+            'mqtt_connected': connected,
+            'total_records': min(info[1], DEVICE_HISTORY_CAPACITY)
+        })
+        return snapshot_response(snapshot, request, Response)
+
+    def history_response(device=None):
+        """只有 limit 的查詢由共用緩衝區回應，時間範圍與降採樣轉送給接收程序"""
+        if any(key in request.args for key in ('from', 'to', 'points')):
+            return proxy_to_ingest(ingest_port)
+        refresh()
+        limit = request.args.get('limit', HISTORY_DEFAULT_LIMIT, type=int)
+        if device is None:
+            limit = max(0, min(limit, ring.capacity))
+            snapshot = snapshots.get(('history', None, limit), lambda: ring.records(limit))
+        else:
+            limit = max(0, min(limit, DEVICE_HISTORY_CAPACITY))
+            snapshot = snapshots.get(('history', device, limit), lambda: ring.device_records(device, limit))
+        return snapshot_response(snapshot, request, Response)
+
+    @app.route('/api/history')
+    def get_history():
+        """歷史數據（所有裝置合併）"""
+        return history_response()
+
+    @app.route('/api/history/<device>')
+    def get_device_history(device):
+        """指定裝置的歷史數據"""
+        if ring.device_info(device) is None:
+            return jsonify({'error': f'找不到裝置: {device}'}), 404
+        return history_response(device)
+
+    @app.route('/api/<path:path>', methods=['GET', 'POST'])
+    @app.route('/metrics')
+    def forward(path=None):
+        """其他 API 轉送給接收程序"""
+        return proxy_to_ingest(ingest_port)
+
+    def fanout():
+        """定期檢查共用緩衝區，推送新數據的增量與 MQTT 連線狀態"""
+        last = ring.total
+        connected = ring.flag(FLAG_MQTT_CONNECTED)
+        while True:
+            socketio.sleep(FANOUT_INTERVAL)
+            try:
+                if ring.flag(FLAG_MQTT_CONNECTED) != connected:
+                    connected = not connected
+                    socketio.emit('status', {'mqtt_connected': connected})
+                total = ring.total
+                if total == last:
+                    continue
+                rows = ring.since(last)
+                if rows is None or len(rows) > RESUME_MAX_DELTAS:
+                    # 落後太多（或寫入端重新啟動）：改送快照，之後從快照的序號繼續
+                    snapshot = build_snapshot()
+                    socketio.emit('snapshot', snapshot)
+                    last = snapshot['seq']
+                elif rows:
+                    total_records = len(ring)
+                    for row in rows:
+                        socketio.emit('delta', make_delta(row, total_records))
+                    # 以實際送出的最後一筆為準（since 讀到的累計筆數可能與上面的 total 不同）
+                    last = rows[-1][0]
+            except Exception as e:
+                logger.error("推送增量錯誤: %s", e)
+
+    socketio.start_background_task(fanout)
+    return app, socketio
+
+
+def serve_worker(fd, ring_path, ingest_port=INGEST_PORT):
+    """工作程序：在繼承的監聽 socket 上提供 HTTP 與 Socket.IO"""
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    ring = SharedRingBuffer.open(ring_path, wait=60)
+    app, _ = create_worker_app(ring, ingest_port)
+    server = make_server('0.0.0.0', 0, app, threaded=True, fd=fd)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+def run_ingest(ring_path, ingest_port=INGEST_PORT):
+    """接收程序：原本的 app_flask，另外寫入共用環形緩衝區，API 只開在本機"""
+    app_flask.create_app(shared_ring_path=ring_path)
+    try:
+        app_flask.socketio.run(app_flask.app, host='127.0.0.1', port=ingest_port, debug=False,
+                               allow_unsafe_werkzeug=True)
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    """主程式"""
+    parser = argparse.ArgumentParser(description='多程序部署：1 個接收程序 + N 個唯讀網頁工作程序')
+    parser.add_argument('--workers', type=int, default=WORKERS, help=f'工作程序數（預設 CPU 核心數 {WORKERS}）')
+    parser.add_argument('--port', type=int, default=PORT, help=f'對外連接埠（預設 {PORT}）')
+    parser.add_argument('--ingest-port', type=int, default=INGEST_PORT,
+                        help=f'接收程序的本機 API 連接埠（預設 {INGEST_PORT}）')
+    parser.add_argument('--ring', help=f'共用環形緩衝區檔案（預設 {SHARED_RING_DIR}/sensor_ring.<port>）')
+    args = parser.parse_args()
+    ring_path = args.ring or os.path.join(SHARED_RING_DIR, f'sensor_ring.{args.port}')
+
+    print("=" * 60)
+    print(" Flask MQTT 監控應用程式（多程序）")
+    print("=" * 60)
+    print(f" 工作程序: {args.workers} 個，對外連接埠 {args.port}")
+    print(f" 接收程序: 127.0.0.1:{args.ingest_port}（MQTT {app_flask.MQTT_BROKER}:{app_flask.MQTT_PORT}）")
+    print(f" 共用環形緩衝區: {ring_path}")
+    print("=" * 60)
+
+    if os.path.exists(ring_path):
+        os.remove(ring_path)
+    ctx = multiprocessing.get_context('fork')
+    ingest = ctx.Process(target=run_ingest, args=(ring_path, args.ingest_port), name='ingest')
+    ingest.start()
+
+    # 等接收程序載入歷史數據並建立共用緩衝區，再開始接受連線
+    SharedRingBuffer.open(ring_path, wait=120).close()
+    listener = socket.create_server(('0.0.0.0', args.port), backlog=256)
+    workers = [ctx.Process(target=serve_worker, args=(listener.fileno(), ring_path, args.ingest_port),
+                           name=f'worker-{i}', daemon=True)
+               for i in range(args.workers)]
+    for worker in workers:
+        worker.start()
+    print(f"✅ 已啟動 {len(workers)} 個工作程序: http://localhost:{args.port}")
+
+    try:
+        ingest.join()
+    except KeyboardInterrupt:
+        print("\n⏹️  停止中...")
+    finally:
+        for worker in workers:
+            worker.terminate()
+        # 接收程序同樣收到 Ctrl+C，等它處理完佇列並寫入檢查點
+        ingest.join(timeout=30)
+        if ingest.is_alive():
+            ingest.terminate()
+        listener.close()
+        if os.path.exists(ring_path):
+            os.remove(ring_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""
+警報規則引擎基準測試（alerts.py）
+產生數千條規則分散在多個裝置上，量測接收路徑上每筆數據的規則檢查成本，
+以及 silent 規則的定期檢查與規則重新載入的耗時
+
+每個裝置的規則依裝置名稱建立索引，每筆數據只檢查該裝置的規則與套用到所有裝置的規則，
+成本與規則總數無關，只與每個裝置的規則數有關
+
+使用方式:
+    uv run python bench_alerts.py                              # 100 個裝置、規則數 0 / 1000 / 5000
+    uv run python bench_alerts.py --devices 500 --rules 0,10000,50000 --samples 500000
+"""
+
+import argparse
+import random
+import time
+
+from alerts import AlertEngine, RULE_TYPES
+
+# 逐筆規則依序輪流使用的類型與參數（門檻設得不容易觸發，量測的是檢查成本）
+RULE_TEMPLATES = [
+    {'type': 'threshold', 'field': 'temperature', 'above': 45},
+    {'type': 'rate', 'field': 'humidity', 'max_per_minute': 10},
+    {'type': 'zscore', 'field': 'temperature', 'window': 60, 'z': 6},
+    {'type': 'light_on', 'hours': 24},
+]
+
+
+def make_rules(count, devices, wildcard, silent):
+    """
+    產生規則設定
+
+    Args:
+        count: 指定裝置的規則數（平均分給每個裝置）
+        devices: 裝置名稱列表
+        wildcard: 套用到所有裝置的規則數
+        silent: silent 規則數
+    """
+    configs = []
+    for i in range(count):
+        configs.append({'id': f'r{i}', 'device': devices[i % len(devices)],
+                        **RULE_TEMPLATES[i % len(RULE_TEMPLATES)]})
+    for i in range(wildcard):
+        configs.append({'id': f'w{i}', **RULE_TEMPLATES[i % len(RULE_TEMPLATES)]})
+    for i in range(silent):
+        configs.append({'id': f's{i}', 'type': 'silent', 'seconds': 600 + i})
+    return configs
+
+
+def make_samples(count, devices, seed=0):
+    """每個裝置各自隨機漫步，依序輪流產生 (裝置, 時間, 數據)"""
+    rng = random.Random(seed)
+    state = {name: [25.0, 60.0] for name in devices}
+    start = 1_700_000_000.0
+    samples = []
+    for i in range(count):
+        name = devices[i % len(devices)]
+        values = state[name]
+        values[0] += rng.gauss(0, 0.05)
+        values[1] += rng.gauss(0, 0.2)
+        samples.append((name, start + i * 10 / len(devices),
+                        {'temperature': values[0], 'humidity': values[1], 'light': rng.random() < 0.5}))
+    return samples
+
+
+def run(configs, samples, repeat):
+    """
+    量測 evaluate() 的耗時（重複幾次取最快，每次都重新建立引擎）
+
+    Returns:
+        tuple: (每筆 µs, 每筆檢查的規則數, 觸發數, 引擎)
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        engine = AlertEngine()
+        engine.load(configs)
+        evaluate = engine.evaluate
+        t0 = time.perf_counter()
+        for device, timestamp, sample in samples:
+            evaluate(device, timestamp, sample)
+        best = min(best, time.perf_counter() - t0)
+    return best / len(samples) * 1e6, engine.evaluations / len(samples), engine.fired, engine
+
+
+def main():
+    """主程式"""
+    parser = argparse.ArgumentParser(description='警報規則引擎基準測試')
+    parser.add_argument('--devices', type=int, default=100, help='裝置數（預設 100）')
+    parser.add_argument('--rules', default='0,1000,5000', help='指定裝置的規則數，逗號分隔（預設 0,1000,5000）')
+    parser.add_argument('--wildcard', type=int, default=5, help='套用到所有裝置的規則數（預設 5）')
+    parser.add_argument('--silent', type=int, default=10, help='silent 規則數（預設 10）')
+    parser.add_argument('--samples', type=int, default=100_000, help='數據筆數（預設 100000）')
+    parser.add_argument('--repeat', type=int, default=3, help='重複幾次取最快（預設 3）')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(" 警報規則引擎基準測試")
+    print("=" * 60)
+    print(f" 規則類型: {', '.join(RULE_TYPES)}")
+    print(f" {args.devices} 個裝置、{args.samples:,} 筆數據，"
+          f"另有 {args.wildcard} 條全裝置規則與 {args.silent} 條 silent 規則\n")
+
+    devices = [f'房間{i:04d}' for i in range(args.devices)]
+    samples = make_samples(args.samples, devices)
+
+    print(f" {'規則總數':>9} {'每裝置':>7} {'檢查/筆':>8} {'µs/筆':>8} {'µs/規則':>8} {'筆/秒':>11} "
+          f"{'觸發':>6} {'重新載入 ms':>11} {'tick ms':>8}")
+    for count in (int(x) for x in args.rules.split(',')):
+        configs = make_rules(count, devices, args.wildcard, args.silent)
+        micros, per_sample, fired, engine = run(configs, samples, args.repeat)
+
+        t0 = time.perf_counter()
+        engine.load(configs)
+        reload_ms = (time.perf_counter() - t0) * 1000
+
+        now = samples[-1][1] + 1
+        t0 = time.perf_counter()
+        engine.tick(now)
+        tick_ms = (time.perf_counter() - t0) * 1000
+
+        per_rule = micros / per_sample if per_sample else 0
+        print(f" {len(configs):>9,} {count / args.devices:>7.0f} {per_sample:>8.1f} {micros:>8.2f} {per_rule:>8.3f} "
+              f"{1e6 / micros:>11,.0f} {fired:>6,} {reload_ms:>11.1f} {tick_ms:>8.2f}")
+
+    print("\n 每筆成本只隨「每個裝置的規則數」增加；tick 為 silent 規則數 × 裝置數，每 5 秒一次")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
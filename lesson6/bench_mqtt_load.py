@@ -0,0 +1,326 @@
+"""
+MQTT 多裝置負載測試
+模擬 N 個裝置以指定的總速率發布感測器數據，每筆數據帶有 message_id 與高精度發送時間，
+收集端記錄 app_flask.py 推送 'delta' 的時間，計算吞吐量、端對端延遲（p50 / p99 / p999）
+以及遺失與重複的筆數，找出接收管線的飽和點
+
+兩種執行方式:
+    --inprocess  不需要 MQTT Broker：在同一個程式中載入 app（預設 app_flask），
+                 以模擬 Broker 直接呼叫 on_message，並攔截 socketio.emit 收集結果；
+                 --app 可指定其他模組，比較不同版本的 app_flask.py
+    （預設）     透過真正的 Broker 發布，並以 Socket.IO 客戶端連到執行中的 app_flask.py 收集結果
+                 （需要 python-socketio[client]；發布端與收集端需在同一台電腦，時鐘才一致）
+
+使用方式:
+    uv run python bench_mqtt_load.py --inprocess --devices 20 --rate 2000 --duration 10
+    uv run python bench_mqtt_load.py --inprocess --app app_flask_old     # 比較另一個版本
+    uv run python bench_mqtt_load.py --broker localhost --app-url http://localhost:8080 --rate 500
+    uv run python bench_mqtt_load.py --inprocess --mode asyncio --devices 200 --rate 5000
+"""
+
+import argparse
+import asyncio
+import importlib
+import json
+import math
+import os
+import random
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+
+import paho.mqtt.client as mqtt
+
+# 嘗試導入 Socket.IO 客戶端（連到獨立執行的 app_flask.py 時使用）
+try:
+    import socketio
+    import requests  # noqa: F401  Socket.IO 客戶端的 polling 傳輸需要
+    HAS_SOCKETIO_CLIENT = True
+except ImportError:
+    HAS_SOCKETIO_CLIENT = False
+
+TOPIC_SUFFIX = '感測器'
+DEVICE_PREFIX = '負載'
+
+
+def make_payload(device, n, rng):
+    """
+    建立一筆測試數據（JSON bytes）
+
+    Args:
+        device: 裝置編號
+        n: 該裝置的第幾筆
+        rng: random.Random
+    """
+    return json.dumps({
+        'temperature': round(20 + rng.uniform(-5, 10), 2),
+        'humidity': round(50 + rng.uniform(-10, 20), 2),
+        'light_status': '開' if n % 2 == 0 else '關',
+        'message_id': f'{device}-{n}',
+        'sent_at': time.time(),
+    }, ensure_ascii=False).encode('utf-8')
+
+
+def percentile(sorted_values, p):
+    """已排序列表的百分位數（最近排名法）"""
+    if not sorted_values:
+        return None
+    k = max(0, min(len(sorted_values) - 1, math.ceil(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+class Collector:
+    """收集 'delta' 事件：計算延遲、遺失與重複"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.seen = {}
+        self.latencies = []
+        self.first_at = None
+        self.last_at = None
+
+    def record(self, delta):
+        """記錄一個 delta（沒有 message_id 的一般數據略過）"""
+        message_id = delta.get('message_id')
+        if message_id is None:
+            return
+        now = time.time()
+        with self._lock:
+            count = self.seen.get(message_id, 0)
+            self.seen[message_id] = count + 1
+            if count == 0:
+                self.latencies.append(now - delta['sent_at'])
+            if self.first_at is None:
+                self.first_at = now
+            self.last_at = now
+
+    @property
+    def received(self):
+        return len(self.seen)
+
+
+class InProcessBroker:
+    """
+    模擬 Broker：發布時直接呼叫 app 的 on_message
+
+    Args:
+        on_message: paho 格式的訊息回調 on_message(client, userdata, message)
+    """
+
+    def __init__(self, on_message):
+        self.on_message = on_message
+
+    def publish(self, topic, payload, qos=1):
+        self.on_message(None, None, SimpleNamespace(topic=topic, payload=payload, qos=qos))
+
+    def close(self):
+        pass
+
+
+class BrokerPublisher:
+    """一個裝置一條 MQTT 連線（與實際多塊 Pico W 相同）"""
+
+    def __init__(self, host, port, client_id, qos):
+        self.qos = qos
+        self.client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION2,
+                                  client_id=client_id)
+        self.client.max_queued_messages_set(0)
+        self.client.connect(host, port, 60)
+        self.client.loop_start()
+
+    def publish(self, topic, payload, qos=None):
+        self.client.publish(topic, payload, qos=self.qos if qos is None else qos)
+
+    def close(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+
+
+def device_schedule(index, devices, rate, started):
+    """
+    裝置的發布時間表：每個裝置的速率為 rate / devices，
+    各裝置的起始時間錯開，總速率平均分布
+
+    Returns:
+        tuple: (第一筆的時間, 間隔秒數)
+    """
+    interval = devices / rate
+    return started + interval * index / devices, interval
+
+
+def run_threads(publishers, topics, args, counts):
+    """每個裝置一個執行緒"""
+    started = time.monotonic() + 0.1
+    deadline = started + args.duration
+
+    def device(i):
+        rng = random.Random(args.seed + i)
+        next_at, interval = device_schedule(i, args.devices, args.rate, started)
+        n = 0
+        while next_at < deadline:
+            delay = next_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            publishers[i].publish(topics[i], make_payload(i, n, rng))
+            n += 1
+            next_at += interval
+        counts[i] = n
+
+    threads = [threading.Thread(target=device, args=(i,), daemon=True) for i in range(args.devices)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.monotonic() - started
+
+
+def run_asyncio(publishers, topics, args, counts):
+    """每個裝置一個 asyncio 工作（裝置數很多時比執行緒省資源）"""
+
+    async def device(i, started, deadline):
+        rng = random.Random(args.seed + i)
+        next_at, interval = device_schedule(i, args.devices, args.rate, started)
+        n = 0
+        while next_at < deadline:
+            delay = next_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            publishers[i].publish(topics[i], make_payload(i, n, rng))
+            n += 1
+            next_at += interval
+        counts[i] = n
+
+    async def run():
+        started = time.monotonic() + 0.1
+        deadline = started + args.duration
+        await asyncio.gather(*(device(i, started, deadline) for i in range(args.devices)))
+        return time.monotonic() - started
+
+    return asyncio.run(run())
+
+
+def attach_inprocess(args, collector):
+    """
+    在暫存目錄中載入 app 模組（不會寫到正式的 sensor_data.csv），攔截 socketio.emit
+
+    Returns:
+        tuple: (app 模組, 模擬 Broker)
+    """
+    workdir = args.workdir or tempfile.mkdtemp(prefix='bench_mqtt_')
+    os.chdir(workdir)
+    print(f"📁 app 工作目錄: {workdir}")
+    app = importlib.import_module(args.app)
+    if hasattr(app, 'create_app'):
+        # 匯入時不會啟動；不連線真正的 Broker，訊息由模擬 Broker 直接送入 on_message
+        app.create_app(start_mqtt_client=False)
+
+    original_emit = app.socketio.emit
+
+    def emit(event, *emit_args, **kwargs):
+        if event == 'delta' and emit_args:
+            collector.record(emit_args[0])
+        return original_emit(event, *emit_args, **kwargs)
+
+    app.socketio.emit = emit
+    return app, InProcessBroker(app.on_message)
+
+
+def attach_remote(args, collector):
+    """以 Socket.IO 客戶端連到執行中的 app_flask.py"""
+    client = socketio.Client(reconnection=False)
+    client.on('delta', collector.record)
+    client.connect(args.app_url)
+    return client
+
+
+def report(args, sent, publish_time, collector, app=None):
+    """印出測試結果"""
+    latencies = sorted(collector.latencies)
+    duplicates = sum(count - 1 for count in collector.seen.values())
+    lost = sent - collector.received
+    receive_time = (collector.last_at - collector.first_at) if collector.received > 1 else 0
+
+    def ms(value):
+        return f"{value * 1000:.2f} ms" if value is not None else '-'
+
+    print("\n" + "=" * 60)
+    print(f" 裝置數: {args.devices}    模式: {args.mode}    "
+          f"{'模擬 Broker' if args.inprocess else f'Broker {args.broker}:{args.port}'}")
+    print(f" 目標速率: {args.rate:,.0f} 筆/秒    實際發布: {sent / publish_time:,.0f} 筆/秒")
+    print(f" 發布: {sent:,} 筆    收到: {collector.received:,} 筆    "
+          f"遺失: {lost:,} 筆 ({lost / max(sent, 1):.2%})    重複: {duplicates:,} 筆")
+    if receive_time:
+        print(f" 接收吞吐量: {collector.received / receive_time:,.0f} 筆/秒")
+    print(f" 端對端延遲: p50 {ms(percentile(latencies, 50))}    p99 {ms(percentile(latencies, 99))}    "
+          f"p999 {ms(percentile(latencies, 99.9))}    最大 {ms(latencies[-1] if latencies else None)}")
+    if app is not None and hasattr(app, 'ingest_pipeline'):
+        stats = app.ingest_pipeline.stats()
+        print(f" 接收佇列: 最大長度 {stats['max_depth']:,}    丟棄 {stats['dropped']:,}    "
+              f"失敗 {stats['failed']:,}    平均排隊 {stats['queue_wait']['avg_ms']:.2f} ms")
+    print("=" * 60)
+
+
+def main():
+    """主程式"""
+    parser = argparse.ArgumentParser(description='MQTT 多裝置負載測試（端對端延遲）')
+    parser.add_argument('--devices', type=int, default=10, help='模擬裝置數（預設 10）')
+    parser.add_argument('--rate', type=float, default=500, help='所有裝置合計每秒發布筆數（預設 500）')
+    parser.add_argument('--duration', type=float, default=10, help='發布秒數（預設 10）')
+    parser.add_argument('--mode', choices=('threads', 'asyncio'), default='threads',
+                        help='每個裝置使用執行緒或 asyncio 工作（預設 threads）')
+    parser.add_argument('--inprocess', action='store_true', help='使用模擬 Broker 並在同一程式中載入 app')
+    parser.add_argument('--app', default='app_flask', help='--inprocess 時載入的模組（預設 app_flask）')
+    parser.add_argument('--workdir', default=None, help='--inprocess 時 app 的工作目錄（預設為新的暫存目錄）')
+    parser.add_argument('--broker', default='localhost', help='MQTT Broker 位址（預設 localhost）')
+    parser.add_argument('--port', type=int, default=1883, help='MQTT Broker 連接埠（預設 1883）')
+    parser.add_argument('--qos', type=int, choices=(0, 1, 2), default=1, help='發布 QoS（預設 1）')
+    parser.add_argument('--app-url', default='http://localhost:8080', help='app_flask.py 的網址')
+    parser.add_argument('--drain', type=float, default=10, help='發布結束後最多再等幾秒收齊數據（預設 10）')
+    parser.add_argument('--seed', type=int, default=0, help='亂數種子')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(" MQTT 多裝置負載測試")
+    print("=" * 60)
+
+    collector = Collector()
+    app = client = None
+    topics = [f'{DEVICE_PREFIX}{i:03d}/{TOPIC_SUFFIX}' for i in range(args.devices)]
+
+    if args.inprocess:
+        app, broker = attach_inprocess(args, collector)
+        if args.devices > getattr(app, 'MAX_DEVICES', args.devices):
+            print(f"⚠️  裝置數超過 app 的 MAX_DEVICES ({app.MAX_DEVICES})，多出的裝置不會有各自的狀態")
+        publishers = [broker] * args.devices
+    else:
+        if not HAS_SOCKETIO_CLIENT:
+            print("❌ 需要 Socket.IO 客戶端才能收集結果：uv pip install 'python-socketio[client]'")
+            print("   或使用 --inprocess 以模擬 Broker 測試")
+            return
+        client = attach_remote(args, collector)
+        print(f"✅ 已連線 {args.app_url}，建立 {args.devices} 條 MQTT 連線...")
+        publishers = [BrokerPublisher(args.broker, args.port, f'bench-{os.getpid()}-{i}', args.qos)
+                      for i in range(args.devices)]
+
+    print(f"🚀 {args.devices} 個裝置，合計 {args.rate:,.0f} 筆/秒，持續 {args.duration} 秒...")
+    counts = [0] * args.devices
+    runner = run_asyncio if args.mode == 'asyncio' else run_threads
+    publish_time = runner(publishers, topics, args, counts)
+    sent = sum(counts)
+
+    # 等待管線處理完剩餘數據
+    deadline = time.monotonic() + args.drain
+    while collector.received < sent and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    for publisher in set(publishers):
+        publisher.close()
+    if client is not None:
+        client.disconnect()
+
+    report(args, sent, publish_time, collector, app)
+
+
+if __name__ == "__main__":
+    main()
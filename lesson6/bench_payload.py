@@ -0,0 +1,122 @@
+"""
+負載格式基準測試
+比較 JSON 與二進位格式（binary_payload.py）每筆數據的傳輸位元組數與伺服器解碼成本
+
+    JSON          - lesson7/main.py 原本的格式，伺服器以 json.loads 加上欄位名稱備援查詢解析
+    二進位 1 筆   - 每則訊息一筆（17 bytes），以 struct 解碼
+    二進位 N 筆   - 每則訊息 N 筆，以 struct.iter_unpack 一次解碼
+
+使用方式:
+    uv run python bench_payload.py                  # 預設 10 萬筆、批次 10 筆
+    uv run python bench_payload.py --count 500000 --batch 50
+"""
+
+import argparse
+import json
+import random
+import time
+
+from binary_payload import encode, decode
+from ring_buffer import encode_light
+
+# MQTT 3.1.1 固定標頭（2 bytes）加上主題長度欄位（2 bytes），QoS 1 另有 2 bytes 封包編號
+MQTT_OVERHEAD = 6
+
+
+def make_readings(count, seed=0):
+    """產生測試數據 (序號, 時間戳記, 溫度, 濕度, 電燈狀態編碼)"""
+    rng = random.Random(seed)
+    start = int(time.time())
+    return [
+        (i, start + i * 10, round(rng.uniform(20.0, 35.0), 1), round(rng.uniform(40.0, 80.0), 1), rng.choice((0, 1)))
+        for i in range(count)
+    ]
+
+
+def json_messages(readings):
+    """lesson7/main.py 的 JSON 格式（一筆一則訊息）"""
+    return [
+        json.dumps({'temperature': t, 'humidity': h, 'light_status': '開' if light else '關'}).encode('utf-8')
+        for _, _, t, h, light in readings
+    ]
+
+
+def decode_json(messages):
+    """app_flask.py 原本的 JSON 解析方式"""
+    rows = []
+    for raw in messages:
+        data = json.loads(raw.decode('utf-8'))
+        rows.append((
+            float(data.get('temperature', data.get('temp', 0))),
+            float(data.get('humidity', data.get('humi', 0))),
+            encode_light(data.get('light_status', data.get('light', '未知'))),
+        ))
+    return rows
+
+
+def decode_binary(messages):
+    """二進位格式解碼"""
+    rows = []
+    for raw in messages:
+        rows.extend(decode(raw)[1])
+    return rows
+
+
+def measure(label, messages, decoder, topic_bytes, repeat):
+    """
+    量測一種格式
+
+    Returns:
+        tuple: (標籤, 每筆負載 bytes, 每筆線上 bytes, 每筆解碼微秒, 解出筆數)
+    """
+    best = float('inf')
+    rows = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rows = decoder(messages)
+        best = min(best, time.perf_counter() - started)
+    payload = sum(len(m) for m in messages)
+    wire = payload + len(messages) * (MQTT_OVERHEAD + topic_bytes)
+    return label, payload / len(rows), wire / len(rows), best / len(rows) * 1e6, len(rows)
+
+
+def main():
+    """主程式"""
+    parser = argparse.ArgumentParser(description='JSON 與二進位負載格式基準測試')
+    parser.add_argument('--count', type=int, default=100_000, help='數據筆數（預設 100000）')
+    parser.add_argument('--batch', type=int, default=10, help='二進位批次每則訊息的筆數（預設 10）')
+    parser.add_argument('--repeat', type=int, default=3, help='重複幾次取最快（預設 3）')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(" 負載格式基準測試")
+    print("=" * 60)
+
+    readings = make_readings(args.count)
+    json_topic = len('客廳/感測器'.encode('utf-8'))
+    bin_topic = len('客廳/感測器/bin'.encode('utf-8'))
+
+    single = [encode(1, [r]) for r in readings]
+    batched = [encode(1, readings[i:i + args.batch]) for i in range(0, len(readings), args.batch)]
+
+    # 確認二進位格式解回的數值與原始數據一致
+    check = decode_binary(batched)
+    assert all(abs(a[2] - b[2]) < 0.01 and abs(a[3] - b[3]) < 0.01 and a[4] == b[4]
+               for a, b in zip(check, readings)), "二進位格式解碼結果不一致"
+
+    results = [
+        measure('JSON', json_messages(readings), decode_json, json_topic, args.repeat),
+        measure('二進位 1 筆', single, decode_binary, bin_topic, args.repeat),
+        measure(f'二進位 {args.batch} 筆', batched, decode_binary, bin_topic, args.repeat),
+    ]
+
+    base = results[0]
+    print(f"\n {args.count:,} 筆數據（線上 bytes 含 MQTT 標頭與主題）\n")
+    print(f" {'格式':<12} {'負載/筆':>10} {'線上/筆':>10} {'解碼(µs/筆)':>12} {'解碼加速':>10}")
+    for label, payload, wire, micros, _ in results:
+        print(f" {label:<12} {payload:>10.1f} {wire:>10.1f} {micros:>12.2f} {base[3] / micros:>9.1f}x")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+輪詢快照基準測試（snapshots.py）
+模擬 N 個分頁輪詢 /api/history?limit=L 與 /api/latest，比較：
+
+    每次請求序列化 - 原本的做法，每個請求都組成 dict 列表並 json 序列化
+    快照           - 每筆新數據只序列化一次，其餘請求回傳同一份 bytes
+    快照 + ETag    - 客戶端帶 If-None-Match，版本沒變時只回 304（不傳內容）
+
+使用方式:
+    uv run python bench_snapshots.py
+    uv run python bench_snapshots.py --clients 50 --limit 1000 --samples 200
+"""
+
+import argparse
+import gzip
+import random
+import time
+
+from ring_buffer import SensorRingBuffer
+from snapshots import SnapshotCache, default_dumps, GZIP_LEVEL
+
+
+def fill(buffer, count, seed=0):
+    rng = random.Random(seed)
+    start = time.time() - count * 10
+    for i in range(count):
+        buffer.append(start + i * 10, rng.uniform(20, 30), rng.uniform(40, 80), i % 2)
+
+
+def run(buffer, clients, limit, samples, polls, mode):
+    """
+    新增 samples 筆數據，每筆之間每個客戶端輪詢 polls 次
+
+    Returns:
+        tuple: (總秒數, 序列化次數, 傳送 bytes)
+    """
+    cache = SnapshotCache()
+    etags = [None] * clients
+    serialized = sent = 0
+    rng = random.Random(1)
+    t0 = time.perf_counter()
+    for _ in range(samples):
+        buffer.append(time.time(), rng.uniform(20, 30), rng.uniform(40, 80), 1)
+        cache.publish()
+        for _ in range(polls):
+            for client in range(clients):
+                if mode == 'plain':
+                    body = default_dumps(buffer.records(limit)).encode('utf-8')
+                    serialized += 1
+                    sent += len(body)
+                    continue
+                snapshot = cache.get(('history', limit), lambda: buffer.records(limit))
+                if mode == 'etag' and etags[client] == snapshot.etag:
+                    continue      # 304
+                etags[client] = snapshot.etag
+                sent += len(snapshot.gzipped())
+        if mode != 'plain':
+            serialized = cache.builds
+    return time.perf_counter() - t0, serialized, sent
+
+
+def main():
+    """主程式"""
+    parser = argparse.ArgumentParser(description='輪詢快照基準測試')
+    parser.add_argument('--clients', type=int, default=20, help='輪詢的分頁數（預設 20）')
+    parser.add_argument('--limit', type=int, default=500, help='/api/history 的 limit（預設 500）')
+    parser.add_argument('--samples', type=int, default=50, help='新數據筆數（預設 50）')
+    parser.add_argument('--polls', type=int, default=3, help='每筆新數據之間每個分頁輪詢幾次（預設 3）')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(" 輪詢快照基準測試")
+    print("=" * 60)
+    buffer = SensorRingBuffer(100_000)
+    fill(buffer, 100_000)
+    requests = args.clients * args.samples * args.polls
+    print(f" {args.clients} 個分頁輪詢 /api/history?limit={args.limit}，{args.samples} 筆新數據，"
+          f"共 {requests:,} 個請求（gzip 等級 {GZIP_LEVEL}）\n")
+
+    print(f" {'模式':<14} {'總秒數':>8} {'µs/請求':>9} {'序列化次數':>10} {'傳送 KB':>10}")
+    base = None
+    for label, mode in (('每次請求序列化', 'plain'), ('快照', 'snapshot'), ('快照 + ETag', 'etag')):
+        seconds, serialized, sent = run(buffer, args.clients, args.limit, args.samples, args.polls, mode)
+        base = base or seconds
+        print(f" {label:<14} {seconds:>8.2f} {seconds / requests * 1e6:>9.1f} {serialized:>10,} "
+              f"{sent / 1024:>10,.0f}   {base / seconds:>5.1f}x")
+    print("\n 「每次請求序列化」的傳送量未壓縮；快照模式為 gzip 後的大小")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
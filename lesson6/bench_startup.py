@@ -0,0 +1,121 @@
+"""
+啟動載入時間基準測試
+產生不同大小（可達數 GB）的 sensor_data.csv，
+比較「完整解析整個檔案」與「由檔尾往回讀取」兩種載入方式的耗時
+
+使用方式:
+    uv run python bench_startup.py                       # 預設 256MB、1GB、4GB
+    uv run python bench_startup.py --sizes-mb 64 512     # 自訂檔案大小
+    uv run python bench_startup.py --full-scan           # 一併測量舊版完整解析（很慢）
+"""
+
+import argparse
+import csv
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from csv_tail import read_tail_rows
+
+FIELDNAMES = ['時間戳記', '電燈狀態', '溫度', '濕度']
+
+
+def generate_csv(path, size_bytes, seed=0):
+    """
+    產生指定大小的測試 CSV（每秒一筆，時間戳記遞增）
+
+    每小時 3600 列共用一份預先格式化好的「分:秒,數值」樣板，
+    只替換「日期 時」前綴，因此能以接近磁碟速度產生數 GB 的檔案
+
+    Returns:
+        int: 產生的列數
+    """
+    rng = random.Random(seed)
+    template = [
+        f":{i // 60:02d}:{i % 60:02d},{rng.choice('開關')},"
+        f"{20 + rng.uniform(-5, 10):.2f},{50 + rng.uniform(-10, 20):.2f}\n"
+        for i in range(3600)
+    ]
+    hour = datetime(2020, 1, 1)
+    rows = 0
+
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write(','.join(FIELDNAMES) + '\n')
+        while f.tell() < size_bytes:
+            prefix = hour.strftime('%Y-%m-%d %H')
+            f.write(prefix + prefix.join(template))
+            rows += len(template)
+            hour += timedelta(hours=1)
+    return rows
+
+
+def full_scan_load(path, keep):
+    """舊版載入方式：DictReader 解析每一列後只保留最後 keep 筆"""
+    loaded = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            loaded.append({
+                'timestamp': row['時間戳記'],
+                'light_status': row['電燈狀態'],
+                'temperature': float(row['溫度']),
+                'humidity': float(row['濕度'])
+            })
+    return loaded[-keep:]
+
+
+def timed(func, *args):
+    """執行並回傳（結果, 秒數）"""
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+
+def main():
+    """主程式"""
+    parser = argparse.ArgumentParser(description='CSV 啟動載入時間基準測試')
+    parser.add_argument('--sizes-mb', type=int, nargs='+', default=[256, 1024, 4096],
+                        help='要測試的檔案大小（MB）')
+    parser.add_argument('--keep', type=int, default=100_000, help='載入最後幾筆（預設 100000）')
+    parser.add_argument('--dir', default=None, help='測試檔案存放目錄（預設為系統暫存目錄）')
+    parser.add_argument('--full-scan', action='store_true', help='一併測量舊版完整解析的耗時')
+    parser.add_argument('--keep-files', action='store_true', help='測試結束後保留產生的檔案')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(" CSV 啟動載入時間基準測試")
+    print("=" * 60)
+
+    results = []
+    for size_mb in args.sizes_mb:
+        fd, path = tempfile.mkstemp(prefix=f'bench_{size_mb}mb_', suffix='.csv', dir=args.dir)
+        os.close(fd)
+        try:
+            print(f"\n📝 產生 {size_mb} MB 測試檔案...")
+            rows, gen_time = timed(generate_csv, path, size_mb * 1024 * 1024)
+            print(f"   {rows:,} 列，耗時 {gen_time:.1f} 秒")
+
+            tail, tail_time = timed(read_tail_rows, path, args.keep)
+            print(f"⚡ 由檔尾讀取 {len(tail):,} 筆: {tail_time * 1000:.1f} ms")
+
+            scan_time = None
+            if args.full_scan:
+                scanned, scan_time = timed(full_scan_load, path, args.keep)
+                print(f"🐢 完整解析後保留 {len(scanned):,} 筆: {scan_time:.2f} 秒")
+
+            results.append((size_mb, rows, tail_time, scan_time))
+        finally:
+            if not args.keep_files:
+                os.remove(path)
+
+    print("\n" + "=" * 60)
+    print(f" {'大小(MB)':>10} {'列數':>14} {'檔尾讀取(ms)':>14} {'完整解析(s)':>12}")
+    for size_mb, rows, tail_time, scan_time in results:
+        scan = f"{scan_time:.2f}" if scan_time is not None else '-'
+        print(f" {size_mb:>10} {rows:>14,} {tail_time * 1000:>14.1f} {scan:>12}")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
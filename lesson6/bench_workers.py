@@ -0,0 +1,188 @@
+"""
+多程序讀取基準測試（app_workers.py + shared_ring.py）
+一個寫入程序持續把數據寫入共用環形緩衝區，N 個工作程序共用同一個監聽 socket 提供 API，
+多個客戶端程序同時輪詢 /api/latest、/api/history?limit=100 與 /api/history/<裝置>?limit=100，
+比較不同工作程序數的每秒請求數
+
+    - 工作程序只讀取 mmap，不取得鎖；同時量測寫入程序的寫入速率，確認讀取端再多也不會拖慢寫入
+    - 單核心環境（或客戶端本身用掉所有 CPU）時看不到擴展，請在 4 核心的 Pi 上執行
+
+使用方式:
+    uv run python bench_workers.py
+    uv run python bench_workers.py --workers 1,2,4 --clients 8 --duration 10 --rate 200
+"""
+
+import argparse
+import http.client
+import multiprocessing
+import os
+import random
+import socket
+import tempfile
+import time
+from urllib.parse import quote
+
+from app_workers import serve_worker
+from shared_ring import SharedRingBuffer
+
+# 模擬的裝置數與預先寫入的筆數
+DEVICES = 20
+PREFILL = 100_000
+CAPACITY = 100_000
+
+
+def writer(path, rate, stop, ready, written):
+    """
+    寫入程序：預先填滿緩衝區後以固定速率寫入
+
+    Args:
+        rate: 每秒筆數（0 為全速）
+        written: multiprocessing.Value，回報寫入筆數
+    """
+    ring = SharedRingBuffer.create(path, CAPACITY, 256)
+    rng = random.Random(0)
+    now = time.time() - PREFILL
+    for i in range(PREFILL):
+        ring.append(now + i, rng.uniform(20, 30), rng.uniform(40, 80), i % 2, f'房間{i % DEVICES:02d}')
+    ready.set()
+    started = time.perf_counter()
+    count = 0
+    while not stop.is_set():
+        ring.append(time.time(), rng.uniform(20, 30), rng.uniform(40, 80), count % 2, f'房間{count % DEVICES:02d}')
+        count += 1
+        if rate:
+            delay = started + count / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        if count % 100 == 0:
+            written.value = count
+    written.value = count
+
+
+def client(port, duration, paths, results):
+    """客戶端程序：在 duration 秒內不斷依序請求 paths，回報 (成功數, 錯誤數, 延遲列表)"""
+    ok = errors = 0
+    latencies = []
+    deadline = time.perf_counter() + duration
+    i = 0
+    while time.perf_counter() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        t0 = time.perf_counter()
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+        try:
+            conn.request('GET', path, headers={'Accept-Encoding': 'gzip'})
+            response = conn.getresponse()
+            response.read()
+            if response.status == 200:
+                ok += 1
+                latencies.append(time.perf_counter() - t0)
+            else:
+                errors += 1
+        except OSError:
+            errors += 1
+        finally:
+            conn.close()
+    results.put((ok, errors, latencies))
+
+
+def wait_ready(port, timeout=30):
+    """等工作程序開始回應"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/api/latest')
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("工作程序沒有回應")
+
+
+def run(ctx, path, workers, clients, duration, paths, written):
+    """
+    啟動 workers 個工作程序並以 clients 個客戶端施壓
+
+    Returns:
+        tuple: (每秒請求數, 錯誤數, p50 ms, p99 ms, 寫入程序每秒筆數)
+    """
+    listener = socket.create_server(('127.0.0.1', 0), backlog=1024)
+    port = listener.getsockname()[1]
+    procs = [ctx.Process(target=serve_worker, args=(listener.fileno(), path, 1), daemon=True)
+             for _ in range(workers)]
+    for proc in procs:
+        proc.start()
+    try:
+        wait_ready(port)
+        results = ctx.Queue()
+        clients_procs = [ctx.Process(target=client, args=(port, duration, paths, results))
+                         for _ in range(clients)]
+        written_before = written.value
+        t0 = time.perf_counter()
+        for proc in clients_procs:
+            proc.start()
+        collected = [results.get() for _ in clients_procs]
+        seconds = time.perf_counter() - t0
+        write_rate = (written.value - written_before) / seconds
+        for proc in clients_procs:
+            proc.join()
+    finally:
+        for proc in procs:
+            proc.terminate()
+            proc.join()
+        listener.close()
+
+    ok = sum(r[0] for r in collected)
+    errors = sum(r[1] for r in collected)
+    latencies = sorted(x for r in collected for x in r[2])
+    p50 = latencies[len(latencies) // 2] * 1000 if latencies else 0
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0
+    return ok / duration, errors, p50, p99, write_rate
+
+
+def main():
+    """主程式"""
+    parser = argparse.ArgumentParser(description='多程序讀取基準測試')
+    parser.add_argument('--workers', default='1,2,4', help='工作程序數，逗號分隔（預設 1,2,4）')
+    parser.add_argument('--clients', type=int, default=8, help='客戶端程序數（預設 8）')
+    parser.add_argument('--duration', type=float, default=5.0, help='每種設定的秒數（預設 5）')
+    parser.add_argument('--rate', type=float, default=100.0, help='寫入程序每秒筆數，0 為全速（預設 100）')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(" 多程序讀取基準測試")
+    print("=" * 60)
+    print(f" CPU 核心: {os.cpu_count()}，客戶端程序: {args.clients}，每種設定 {args.duration:g} 秒")
+    print(f" 共用環形緩衝區: {CAPACITY:,} 筆、{DEVICES} 個裝置，寫入速率 "
+          + (f"{args.rate:g} 筆/秒" if args.rate else "全速"))
+
+    ctx = multiprocessing.get_context('fork')
+    path = os.path.join(tempfile.mkdtemp(prefix='bench_workers_'), 'ring')
+    stop, ready = ctx.Event(), ctx.Event()
+    written = ctx.Value('q', 0)
+    writer_proc = ctx.Process(target=writer, args=(path, args.rate, stop, ready, written), daemon=True)
+    writer_proc.start()
+    ready.wait()
+
+    paths = ['/api/latest', '/api/history?limit=100',
+             '/api/history/' + quote('房間03') + '?limit=100', '/api/latest/' + quote('房間07')]
+    print(f" 請求: {', '.join(paths)}\n")
+    print(f" {'工作程序':>8} {'請求/秒':>10} {'倍數':>6} {'p50 ms':>8} {'p99 ms':>8} {'錯誤':>6} {'寫入筆/秒':>10}")
+    base = None
+    try:
+        for workers in (int(x) for x in args.workers.split(',')):
+            rps, errors, p50, p99, write_rate = run(ctx, path, workers, args.clients, args.duration, paths, written)
+            base = base or rps
+            print(f" {workers:>8} {rps:>10,.0f} {rps / base:>5.2f}x {p50:>8.2f} {p99:>8.2f} {errors:>6} "
+                  f"{write_rate:>10,.0f}")
+    finally:
+        stop.set()
+        writer_proc.join()
+        os.remove(path)
+    print("\n 寫入筆/秒維持在設定值表示讀取端沒有拖慢寫入端")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+感測器二進位負載格式（伺服器端解碼）
+Pico W 端的編碼器在 lesson7/sensor_codec.py，兩邊的格式必須一致
+
+格式（little-endian）:
+    標頭 v1  <BBH    版本, 筆數, 裝置編號                       4 bytes
+    標頭 v2  <BBHI   版本, 筆數, 裝置編號, 發送時間             8 bytes
+    每筆     <IIhHb  序號, 時間戳記, 溫度×100, 濕度×100, 電燈   13 bytes
+一筆數據的訊息為 17 bytes（JSON 約 70 bytes），一則訊息可以帶多筆數據；
+v2 多帶裝置的發送時間，斷線補傳的舊數據也能換算回正確的時間
+
+以主題後綴 /bin（例如 客廳/感測器/bin）或 MQTT 5 的 Content Type 辨識，
+沒有這兩者的訊息仍以 JSON 解析
+"""
+
+import struct
+
+from ring_buffer import LIGHT_UNKNOWN
+
+VERSION = 1
+VERSION_SENT_AT = 2
+CONTENT_TYPE = 'application/x-sensor-v1'
+TOPIC_SUFFIX = '/bin'
+
+HEADER = struct.Struct('<BBH')
+HEADER_SENT_AT = struct.Struct('<BBHI')
+RECORD = struct.Struct('<IIhHb')
+
+# 一則訊息最多幾筆（標頭的筆數欄位為 1 byte）
+MAX_RECORDS = 255
+
+
+def is_binary(topic, content_type=None):
+    """依 Content Type 或主題後綴判斷是否為二進位負載"""
+    if content_type is not None:
+        return content_type == CONTENT_TYPE
+    return topic.endswith(TOPIC_SUFFIX)
+
+
+def encode(device_id, records, sent_at=None):
+    """
+    編碼一則訊息（伺服器端測試與基準測試用；Pico 端使用 lesson7/sensor_codec.py）
+
+    Args:
+        device_id: 裝置編號（0~65535）
+        records: (序號, 時間戳記, 溫度, 濕度, 電燈狀態編碼) 的列表
+        sent_at: 發送時間（秒）；有值時使用 v2 標頭
+
+    Returns:
+        bytes: 編碼後的訊息
+    """
+    if len(records) > MAX_RECORDS:
+        raise ValueError(f"一則訊息最多 {MAX_RECORDS} 筆")
+    if sent_at is None:
+        parts = [HEADER.pack(VERSION, len(records), device_id)]
+    else:
+        parts = [HEADER_SENT_AT.pack(VERSION_SENT_AT, len(records), device_id, int(sent_at))]
+    for seq, timestamp, temperature, humidity, light in records:
+        parts.append(RECORD.pack(seq, int(timestamp), round(temperature * 100), round(humidity * 100), light))
+    return b''.join(parts)
+
+
+def unpack(payload):
+    """
+    檢查標頭與長度，回傳尚未展開的數據迭代器
+
+    伺服器端直接走訪迭代器組成數據，一則批次訊息只需要走訪一次；
+    v1 沒有發送時間，以最後一筆的時間戳記代替（由訊息尾端直接讀出，不必先展開整批）
+
+    Args:
+        payload: bytes
+
+    Returns:
+        tuple: (裝置編號, 筆數, 發送時間, (序號, 時間戳記, 溫度×100, 濕度×100, 電燈) 的迭代器)
+
+    Raises:
+        ValueError: 版本不支援或長度不符
+    """
+    if len(payload) < HEADER.size:
+        raise ValueError(f"二進位負載長度不足: {len(payload)} bytes")
+    version = payload[0]
+    if version == VERSION:
+        header = HEADER
+        _, count, device_id = HEADER.unpack_from(payload)
+        sent_at = None
+    elif version == VERSION_SENT_AT and len(payload) >= HEADER_SENT_AT.size:
+        header = HEADER_SENT_AT
+        _, count, device_id, sent_at = HEADER_SENT_AT.unpack_from(payload)
+    else:
+        raise ValueError(f"不支援的二進位負載版本: {version}")
+    body = memoryview(payload)[header.size:]
+    if len(body) != count * RECORD.size:
+        raise ValueError(f"二進位負載長度不符: 標頭 {count} 筆，實際 {len(body)} bytes")
+    if sent_at is None and count:
+        sent_at = RECORD.unpack_from(body, len(body) - RECORD.size)[1]
+    return device_id, count, sent_at, RECORD.iter_unpack(body)
+
+
+def decode(payload):
+    """
+    解碼一則訊息（以 struct.iter_unpack 一次解出所有數據）
+
+    Args:
+        payload: bytes
+
+    Returns:
+        tuple: (裝置編號, [(序號, 時間戳記, 溫度, 濕度, 電燈狀態編碼), ...])
+
+    Raises:
+        ValueError: 版本不支援或長度不符
+    """
+    device_id, _, _, raw_records = unpack(payload)
+    records = [
+        (seq, timestamp, temperature / 100, humidity / 100, light if light in (0, 1) else LIGHT_UNKNOWN)
+        for seq, timestamp, temperature, humidity, light in raw_records
+    ]
+    return device_id, records
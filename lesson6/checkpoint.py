@@ -0,0 +1,205 @@
+"""
+記憶體狀態檢查點（warm start）
+定期把環形緩衝區、各裝置的最新數據與序號位元圖、滾動統計寫成一個二進位檔，
+重新啟動時以 mmap 讀回（直接把陣列內容複製回緩衝區，不解析文字），
+只有檢查點不存在、損壞、設定不同或比歸檔舊時才從 CSV / SQLite 重新載入
+
+檔案格式（位元組順序與執行環境相同，讀取時檢查）:
+    MAGIC(4) | 版本 uint32 | 中繼資料長度 uint32 | 中繼資料 JSON | 數據區塊 ... | CRC32 uint32
+    中繼資料記錄每個區塊在數據區的 [位置, 長度]：
+        - 環形緩衝區：時間戳記 'd'、溫度 'f'、濕度 'f'、電燈 'b' 四個陣列的原始 bytes 依序串接
+        - 序號：計數欄位放在 JSON，位元圖為一個區塊
+        - 滾動統計：每個裝置一個 array('d') 區塊（aggregates.DeviceAggregates.dump_state）
+
+寫入時先寫到 .tmp、fsync 後以 os.replace 取代舊檔，任何時間點中斷都只會留下完整的舊檔或新檔；
+CRC32 涵蓋整個檔案，磁碟損壞或被截斷時讀取會失敗並改從歸檔載入
+
+各緩衝區分別在自己的鎖內複製，接收管線不需要暫停；
+不同結構之間可能相差幾筆，重新啟動時比較歸檔最新時間，歸檔較新就視為過期
+"""
+
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+import zlib
+
+from aggregates import SLOTS
+from devices import DEDUPE_WINDOW
+
+MAGIC = b'SCKP'
+VERSION = 1
+_HEADER = struct.Struct('<4sII')
+_CRC = struct.Struct('<I')
+
+
+class CheckpointError(ValueError):
+    """檢查點不存在、損壞、過期或與目前設定不符（呼叫端改從歸檔載入）"""
+
+
+def _ring_state(buffer, blocks):
+    """環形緩衝區的中繼資料，內容加入 blocks"""
+    total, data, order = buffer.dump_state()
+    return {'capacity': buffer.capacity, 'total': total, 'block': _add_block(blocks, data), 'order': order}
+
+
+def _add_block(blocks, data):
+    """加入一個數據區塊，回傳 [位置, 長度]"""
+    offset = blocks[-1][0] + len(blocks[-1][1]) if blocks else 0
+    blocks.append((offset, data))
+    return [offset, len(data)]
+
+
+def write_checkpoint(path, sensor_data, devices, rolling_stats, source=None):
+    """
+    寫入檢查點（先寫暫存檔再以 rename 取代）
+
+    Args:
+        path: 檢查點檔案
+        sensor_data: 所有裝置合併的 SensorRingBuffer
+        devices: DeviceRegistry
+        rolling_stats: RollingAggregates
+        source: 歸檔識別（例如 'csv:sensor_data.csv'），讀取時不同就不使用
+
+    Returns:
+        dict: 中繼資料（含檔案大小 bytes）
+    """
+    blocks = []
+    history = _ring_state(sensor_data, blocks)
+    meta = {
+        'created': time.time(),
+        'byteorder': sys.byteorder,
+        'source': source,
+        # 最大的時間戳記（裝置補傳的數據可能比最後寫入的一筆更早）
+        'last_epoch': history['order']['max_timestamp'] or 0.0,
+        'history': history,
+        'devices': [],
+        'windows': list(rolling_stats.windows.items()),
+        'slots': SLOTS,
+        'dedupe_window': DEDUPE_WINDOW,
+        'aggregates': {},
+    }
+    for name in devices.names():
+        state = devices.get(name)
+        fields, bits = state.sequence.dump_state()
+        meta['devices'].append({
+            'name': name,
+            'messages': state.messages,
+            'first_seen': state.first_seen,
+            'last_seen': state.last_seen,
+            'history': _ring_state(state.history, blocks),
+            'sequence': {**fields, 'block': _add_block(blocks, bits)},
+        })
+    for device, values in sorted(rolling_stats.dump_state().items()):
+        meta['aggregates'][device] = _add_block(blocks, values.tobytes())
+
+    body = json.dumps(meta, ensure_ascii=False).encode('utf-8')
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        header = _HEADER.pack(MAGIC, VERSION, len(body))
+        crc = zlib.crc32(header)
+        crc = zlib.crc32(body, crc)
+        f.write(header)
+        f.write(body)
+        for _, data in blocks:
+            crc = zlib.crc32(data, crc)
+            f.write(data)
+        f.write(_CRC.pack(crc))
+        f.flush()
+        os.fsync(f.fileno())
+        meta['bytes'] = f.tell()
+    os.replace(temp_path, path)
+    return meta
+
+
+def _read_meta(view):
+    """檢查檔頭與 CRC，回傳 (中繼資料, 數據區的起始位置)"""
+    if len(view) < _HEADER.size + _CRC.size:
+        raise CheckpointError("檔案太小")
+    magic, version, meta_len = _HEADER.unpack_from(view)
+    if magic != MAGIC:
+        raise CheckpointError("不是檢查點檔案")
+    if version != VERSION:
+        raise CheckpointError(f"版本 {version} 不支援")
+    (crc,) = _CRC.unpack_from(view, len(view) - _CRC.size)
+    if zlib.crc32(view[:-_CRC.size]) != crc:
+        raise CheckpointError("CRC 錯誤（檔案損壞或不完整）")
+    start = _HEADER.size + meta_len
+    return json.loads(bytes(view[_HEADER.size:start])), start
+
+
+def _check_compatible(meta, sensor_data, devices, rolling_stats, source):
+    """設定改變（容量、視窗、歸檔）時不使用檢查點"""
+    if meta['byteorder'] != sys.byteorder:
+        raise CheckpointError("位元組順序不同")
+    if source is not None and meta['source'] != source:
+        raise CheckpointError(f"歸檔不同（檢查點為 {meta['source']}）")
+    if meta['history']['capacity'] != sensor_data.capacity:
+        raise CheckpointError("歷史容量已改變")
+    if any(d['history']['capacity'] != devices.capacity for d in meta['devices']):
+        raise CheckpointError("裝置歷史容量已改變")
+    if len(meta['devices']) > devices.max_devices:
+        raise CheckpointError("裝置數超過上限")
+    if meta['windows'] != [list(item) for item in rolling_stats.windows.items()] or meta['slots'] != SLOTS:
+        raise CheckpointError("統計視窗已改變")
+    if meta['dedupe_window'] != DEDUPE_WINDOW:
+        raise CheckpointError("序號視窗已改變")
+
+
+def load_checkpoint(path, sensor_data, devices, rolling_stats, source=None, archive_latest=None):
+    """
+    以 mmap 讀取檢查點並還原到空的緩衝區、裝置表與滾動統計
+
+    先檢查完整性、設定與是否過期，全部通過才開始還原，失敗時不會留下一半的狀態
+
+    Args:
+        source: 目前的歸檔識別（與寫入時不同就不使用）
+        archive_latest: 歸檔最新一筆的時間（epoch 秒數，None 表示歸檔是空的）；
+            以秒為單位比較（CSV 只保存到秒），比檢查點新表示檢查點之後還有寫入，視為過期
+
+    Returns:
+        dict: 中繼資料
+
+    Raises:
+        CheckpointError: 不存在、損壞、設定不同或過期
+    """
+    if not os.path.exists(path):
+        raise CheckpointError("檢查點不存在")
+    with open(path, 'rb') as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise CheckpointError("檔案是空的") from None
+    view = memoryview(mm)
+    try:
+        meta, start = _read_meta(view)
+        _check_compatible(meta, sensor_data, devices, rolling_stats, source)
+        last_epoch = meta['last_epoch']
+        if archive_latest is None and meta['history']['total']:
+            raise CheckpointError("歸檔是空的（可能已被刪除）")
+        if archive_latest is not None and int(archive_latest) > int(last_epoch):
+            raise CheckpointError("歸檔比檢查點新")
+
+        def block(location):
+            offset, size = location
+            return view[start + offset:start + offset + size]
+
+        history = meta['history']
+        sensor_data.restore_state(history['total'], block(history['block']), history.get('order'))
+        for info in meta['devices']:
+            state = devices.get_or_create(info['name'])
+            state.history.restore_state(info['history']['total'], block(info['history']['block']),
+                                        info['history'].get('order'))
+            state.sequence.restore_state(info['sequence'], block(info['sequence']['block']))
+            state.messages = info['messages']
+            state.first_seen = info['first_seen']
+            state.last_seen = info['last_seen']
+        for device, location in meta['aggregates'].items():
+            rolling_stats.restore_state(device, block(location).cast('d'))
+        meta['bytes'] = len(view)
+        return meta
+    finally:
+        view.release()
+        mm.close()
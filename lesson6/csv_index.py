@@ -0,0 +1,373 @@
+"""
+CSV 歸檔的稀疏時間索引
+把時間切成固定長度的區間（bucket），只記錄每個區間第一列在檔案中的位元組位置，
+查詢某段時間時只需 seek 到對應位置再往後循序讀取，不必掃描整個檔案
+
+索引檔（預設為 <csv>.idx）格式：
+    第一筆：(MAGIC, bucket 秒數)
+    之後每筆：(bucket 編號, 位元組位置)，皆為 little-endian int64
+    bucket 編號為 LATENESS_MARK 的一筆記錄最大延遲秒數（取代位元組位置）
+
+裝置補傳的舊數據會晚於其他裝置較新的數據寫入，歸檔因此不是嚴格遞增：
+索引點依「目前為止最大的時間」所在的區間建立（時間早於 start 的數據不會出現在 start 的索引點之前），
+另記錄最大延遲（目前為止最大的時間 − 該列時間），查詢讀到超過 end + 最大延遲的數據才停止
+"""
+
+import csv
+import os
+import struct
+import threading
+from array import array
+from bisect import bisect_right
+
+from csv_tail import read_header, column_indices, row_device
+from ring_buffer import encode_light, parse_timestamp
+
+INDEX_MAGIC = 0x58444953   # 'SIDX'
+RECORD = struct.Struct('<qq')
+
+# 預設每 5 分鐘一個索引點（一年約 10 萬筆，索引檔約 1.7 MB）
+DEFAULT_BUCKET_SECONDS = 300
+
+# 補索引時每次讀取的區塊大小
+CATCH_UP_CHUNK = 1024 * 1024
+
+# 記錄最大延遲的索引紀錄（bucket 編號不會是負數）
+LATENESS_MARK = -1
+
+
+class SparseTimeIndex:
+    """
+    CSV 歸檔的稀疏時間索引
+
+    歸檔必須是只會往後追加的檔案；時間戳記大致遞增，較晚寫入的舊數據以最大延遲涵蓋
+
+    Args:
+        csv_path: CSV 檔案路徑
+        index_path: 索引檔路徑（預設為 csv_path + '.idx'）
+        bucket_seconds: 每個索引區間的秒數
+    """
+
+    def __init__(self, csv_path, index_path=None, bucket_seconds=DEFAULT_BUCKET_SECONDS):
+        self.csv_path = csv_path
+        self.index_path = index_path or csv_path + '.idx'
+        self.bucket_seconds = bucket_seconds
+
+        self._buckets = array('q')
+        self._offsets = array('q')
+        self._data_start = 0
+        self.lateness = 0              # 最大延遲（秒）
+        self._max_timestamp = None     # 已索引的數據中最大的時間
+        self._lock = threading.Lock()
+        self._index_file = None
+        self._catching_up = False
+        self._pending = []
+        self._pending_times = []
+        self._ready = threading.Event()
+
+    @property
+    def ready(self):
+        """索引是否已涵蓋整個檔案"""
+        return self._ready.is_set()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def open(self, background=True):
+        """
+        載入索引檔，並補上索引檔之後才寫入 CSV 的部分
+
+        必須在 CSV 寫入器開始寫入前呼叫：此時的檔案大小就是需要補索引的終點，
+        之後寫入器透過 observe() 回報的新列會先暫存，補完後再加入索引
+
+        Args:
+            background: 是否在背景執行緒補索引（大型檔案第一次建立索引可能需要數十秒）
+        """
+        if not os.path.exists(self.csv_path) or os.path.getsize(self.csv_path) == 0:
+            self._open_index_file(rebuild=True)
+            self._ready.set()
+            return self
+
+        self._data_start = self._header_length()
+        csv_size = os.path.getsize(self.csv_path)
+        rebuild = not self._load_index(csv_size)
+        self._open_index_file(rebuild)
+
+        scan_from = self._offsets[-1] if self._offsets else self._data_start
+        self._catching_up = True
+        if background:
+            threading.Thread(target=self._catch_up, args=(scan_from, csv_size),
+                             name='csv-index', daemon=True).start()
+        else:
+            self._catch_up(scan_from, csv_size)
+        return self
+
+    def close(self):
+        """關閉索引檔"""
+        with self._lock:
+            if self._index_file is not None:
+                self._index_file.close()
+                self._index_file = None
+
+    def observe(self, timestamp, offset):
+        """
+        回報一列已寫入 CSV（由寫入器在寫入後呼叫）
+
+        Args:
+            timestamp: 該列的 epoch 秒數
+            offset: 該列在檔案中的起始位元組位置
+        """
+        with self._lock:
+            if self._catching_up:
+                self._pending.append((timestamp, offset))
+                return
+            if not self._offsets and self._data_start == 0:
+                self._data_start = offset
+            self._add(timestamp, offset)
+
+    def on_flush(self, batch, offsets):
+        """BatchCSVWriter 的 on_flush 回調：只在進入新區間時更新索引，比最大時間早的數據更新最大延遲"""
+        last_bucket = self._buckets[-1] if self._buckets else None
+        timestamps = []
+        for row, offset in zip(batch, offsets):
+            try:
+                timestamp = parse_timestamp(row['時間戳記'])
+            except (KeyError, ValueError):
+                continue
+            timestamps.append(timestamp)
+            if last_bucket is None or int(timestamp // self.bucket_seconds) > last_bucket:
+                self.observe(timestamp, offset)
+                last_bucket = int(timestamp // self.bucket_seconds)
+        with self._lock:
+            if self._catching_up:
+                # 補索引還沒掃描到的舊數據要先計算，新寫入的列等補完再依序計算
+                self._pending_times.extend(timestamps)
+                return
+            for timestamp in timestamps:
+                self._update_lateness(timestamp, 0)
+
+    def _update_lateness(self, timestamp, margin):
+        """
+        （持有鎖時呼叫）更新最大時間與最大延遲，延遲變大時追加到索引檔
+
+        Args:
+            margin: 額外加上的秒數（補索引時同一分鐘的列不逐列解析，最大時間最多少算 59 秒）
+        """
+        if self._max_timestamp is None or timestamp >= self._max_timestamp:
+            self._max_timestamp = timestamp
+            return
+        lateness = int(self._max_timestamp - timestamp) + 1 + margin
+        if lateness <= self.lateness:
+            return
+        self.lateness = lateness
+        if self._index_file is not None:
+            self._index_file.write(RECORD.pack(LATENESS_MARK, lateness))
+            self._index_file.flush()
+
+    def lookup(self, start):
+        """
+        取得開始讀取的位元組位置
+
+        Args:
+            start: 起始 epoch 秒數，None 表示從頭開始
+
+        Returns:
+            int: 不晚於 start 所在區間的第一列位置
+        """
+        with self._lock:
+            if start is None or not self._buckets:
+                return self._data_start
+            i = bisect_right(self._buckets, int(start // self.bucket_seconds)) - 1
+            return self._offsets[i] if i >= 0 else self._data_start
+
+    def query(self, start=None, end=None, limit=None, device=None):
+        """
+        查詢時間範圍內的數據：一次 seek 加上一段循序讀取
+
+        Args:
+            start: 起始 epoch 秒數（含），None 表示不限
+            end: 結束 epoch 秒數（含），None 表示不限
+            limit: 最多回傳幾筆，None 表示不限
+            device: 只回傳此裝置的數據，None 表示全部
+
+        Returns:
+            list: (epoch 秒數, 溫度, 濕度, 電燈狀態編碼) 的列表，依寫入順序排列
+                  （一般由舊到新，裝置補傳的數據可能在較新的數據之後）
+        """
+        return list(self.iter_range(start, end, limit, device))
+
+    def iter_range(self, start=None, end=None, limit=None, device=None, with_device=False):
+        """
+        query() 的產生器版本，逐列讀取不佔記憶體
+
+        Args:
+            device: 只回傳此裝置的數據，None 表示全部
+            with_device: 是否在每筆數據最後附上裝置名稱
+        """
+        if not os.path.exists(self.csv_path):
+            return
+        header = read_header(self.csv_path)
+        if not header:
+            return
+        i_ts, i_temp, i_humi, i_light, i_dev = column_indices(header)
+
+        count = 0
+        # 補傳的數據最多比已寫入的最大時間早 lateness 秒：讀到超過 end + lateness 的數據才停止
+        stop = None if end is None else end + self.lateness
+        with open(self.csv_path, 'rb') as f:
+            f.seek(max(self.lookup(start), self._header_length()))
+            for fields in csv.reader(line.decode('utf-8') for line in f):
+                try:
+                    ts = parse_timestamp(fields[i_ts])
+                    if start is not None and ts < start:
+                        continue
+                    if end is not None and ts > end:
+                        if ts > stop:
+                            break
+                        continue
+                    name = row_device(fields, i_dev) if device is not None or with_device else None
+                    if device is not None and name != device:
+                        continue
+                    row = (ts, float(fields[i_temp]), float(fields[i_humi]), encode_light(fields[i_light]))
+                    if with_device:
+                        row += (name,)
+                except (ValueError, IndexError):
+                    continue
+                yield row
+                count += 1
+                if limit is not None and count >= limit:
+                    break
+
+    def _add(self, timestamp, offset):
+        """（持有鎖時呼叫）時間進入新區間時新增索引點並追加到索引檔"""
+        bucket = int(timestamp // self.bucket_seconds)
+        if self._buckets and bucket <= self._buckets[-1]:
+            return
+        self._buckets.append(bucket)
+        self._offsets.append(offset)
+        if self._index_file is not None:
+            self._index_file.write(RECORD.pack(bucket, offset))
+            self._index_file.flush()
+
+    def _catch_up(self, scan_from, scan_end):
+        """
+        掃描 CSV 從 scan_from 到 scan_end 的部分，補上缺少的索引點
+
+        以 1 MB 區塊讀取並切成行，只有「到分鐘為止的前綴」改變時才解析時間，
+        第一次為數 GB 的舊檔案建立索引也只需數秒
+        """
+        added = 0
+        try:
+            with open(self.csv_path, 'rb') as f:
+                f.seek(scan_from)
+                offset = scan_from
+                last_bucket = self._buckets[-1] if self._buckets else None
+                last_prefix = None
+                remainder = b''
+                while offset < scan_end:
+                    chunk = f.read(min(CATCH_UP_CHUNK, scan_end - offset - len(remainder)))
+                    if not chunk:
+                        break
+                    lines = (remainder + chunk).split(b'\n')
+                    remainder = lines.pop()
+                    for line in lines:
+                        prefix = line[:16]
+                        if prefix != last_prefix:
+                            last_prefix = prefix
+                            try:
+                                ts = parse_timestamp(line[:19].decode('ascii'))
+                            except (ValueError, UnicodeDecodeError):
+                                ts = None
+                            if ts is not None:
+                                with self._lock:
+                                    self._update_lateness(ts, 60)
+                                bucket = int(ts // self.bucket_seconds)
+                                if last_bucket is None or bucket > last_bucket:
+                                    with self._lock:
+                                        self._add(ts, offset)
+                                    last_bucket = bucket
+                                    added += 1
+                        offset += len(line) + 1
+        except Exception as e:
+            print(f"⚠️  建立 CSV 索引時發生錯誤: {e}")
+        finally:
+            with self._lock:
+                self._catching_up = False
+                for ts, offset in self._pending:
+                    self._add(ts, offset)
+                self._pending = []
+                for ts in self._pending_times:
+                    self._update_lateness(ts, 0)
+                self._pending_times = []
+            self._ready.set()
+        if added:
+            print(f"🗂️  CSV 索引已更新: 新增 {added} 個索引點，共 {len(self)} 個")
+
+    def _header_length(self):
+        """標題列的位元組長度（資料從這裡開始）"""
+        with open(self.csv_path, 'rb') as f:
+            return len(f.readline())
+
+    def _load_index(self, csv_size):
+        """
+        載入索引檔
+
+        Returns:
+            bool: 索引檔有效則回傳 True，否則需要重建
+        """
+        if not os.path.exists(self.index_path):
+            return False
+        with open(self.index_path, 'rb') as f:
+            data = f.read()
+        usable = len(data) - len(data) % RECORD.size
+        if usable < RECORD.size:
+            return False
+        magic, bucket_seconds = RECORD.unpack_from(data, 0)
+        if magic != INDEX_MAGIC or bucket_seconds != self.bucket_seconds:
+            return False
+
+        buckets = array('q')
+        offsets = array('q')
+        lateness = 0
+        for bucket, offset in RECORD.iter_unpack(data[RECORD.size:usable]):
+            if bucket == LATENESS_MARK:
+                lateness = max(lateness, offset)
+                continue
+            if offset >= csv_size or (buckets and bucket <= buckets[-1]):
+                # CSV 被截斷或替換，索引已不可信
+                return False
+            buckets.append(bucket)
+            offsets.append(offset)
+        if buckets and not (self._verify(buckets[0], offsets[0]) and self._verify(buckets[-1], offsets[-1])):
+            # CSV 被重新產生（例如執行 generate_test_data.py），索引位置已對不上
+            return False
+        self._buckets = buckets
+        self._offsets = offsets
+        self.lateness = lateness
+        # 截掉寫到一半的最後一筆
+        if usable != len(data):
+            with open(self.index_path, 'r+b') as f:
+                f.truncate(usable)
+        return True
+
+    def _verify(self, bucket, offset):
+        """檢查索引點指向的列是否確實屬於該區間"""
+        with open(self.csv_path, 'rb') as f:
+            f.seek(offset)
+            line = f.readline()
+        try:
+            return int(parse_timestamp(line[:19].decode('ascii')) // self.bucket_seconds) == bucket
+        except (ValueError, UnicodeDecodeError):
+            return False
+
+    def _open_index_file(self, rebuild):
+        """開啟索引檔（追加模式），rebuild 時清空並寫入檔頭"""
+        if rebuild:
+            self._buckets = array('q')
+            self._offsets = array('q')
+            self.lateness = 0
+            self._index_file = open(self.index_path, 'wb')
+            self._index_file.write(RECORD.pack(INDEX_MAGIC, self.bucket_seconds))
+            self._index_file.flush()
+        else:
+            self._index_file = open(self.index_path, 'ab')
@@ -0,0 +1,126 @@
+"""
+從 CSV 檔案尾端讀取最後 N 筆數據
+由檔尾往回以區塊方式 seek，只解析需要的列，
+啟動時間與檔案大小無關（只與 N 有關）
+"""
+
+import csv
+import os
+
+from ring_buffer import encode_light, parse_timestamp
+
+# 往回讀取時每次讀取的區塊大小
+BLOCK_SIZE = 256 * 1024
+
+# 裝置欄位；舊版 CSV 的標題列沒有這個欄位時，新數據的裝置寫在最後多出的一欄（storage.CSVStorage），
+# 該列沒有這一欄（舊數據）或沒有值時視為預設裝置
+DEVICE_COLUMN = '裝置'
+DEFAULT_DEVICE = '客廳'
+
+
+def read_header(path):
+    """
+    讀取 CSV 標題列
+
+    Returns:
+        list: 欄位名稱列表，檔案為空時回傳空列表
+    """
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        line = f.readline()
+    return next(csv.reader([line]), []) if line else []
+
+
+def column_indices(header):
+    """
+    取得各欄位在標題列中的位置
+
+    Returns:
+        tuple: (時間戳記, 溫度, 濕度, 電燈狀態, 裝置) 的索引，
+               沒有裝置欄位時裝置為標題列之後多出的一欄
+    """
+    return (
+        header.index('時間戳記'),
+        header.index('溫度'),
+        header.index('濕度'),
+        header.index('電燈狀態'),
+        header.index(DEVICE_COLUMN) if DEVICE_COLUMN in header else len(header),
+    )
+
+
+def row_device(fields, i_dev):
+    """取得一列的裝置名稱，沒有裝置欄位或值為空時回傳 DEFAULT_DEVICE"""
+    if i_dev is None or i_dev >= len(fields) or not fields[i_dev]:
+        return DEFAULT_DEVICE
+    return fields[i_dev]
+
+
+def read_tail_lines(path, n, block_size=BLOCK_SIZE):
+    """
+    從檔案尾端往回讀取最後 n 行（不含標題列）
+
+    假設欄位內沒有換行字元（本專案寫入的 CSV 都符合）
+
+    Args:
+        path: 檔案路徑
+        n: 行數
+        block_size: 每次往回讀取的位元組數
+
+    Returns:
+        list: 由舊到新排列的行（bytes，不含換行字元）
+    """
+    if n <= 0:
+        return []
+
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        chunks = []
+        newlines = 0
+
+        # 多讀一行：最前面那行可能不完整（或是標題列），之後會丟掉
+        while pos > 0 and newlines <= n:
+            size = min(block_size, pos)
+            pos -= size
+            f.seek(pos)
+            chunk = f.read(size)
+            chunks.append(chunk)
+            newlines += chunk.count(b'\n')
+
+    lines = b''.join(reversed(chunks)).splitlines()
+    # pos > 0：第一行是被切斷的半行；pos == 0：第一行是標題列
+    lines = [line for line in lines[1:] if line]
+    return lines[-n:]
+
+
+def read_tail_rows(path, n, block_size=BLOCK_SIZE, with_device=False):
+    """
+    讀取 CSV 最後 n 筆數據並轉為數值
+
+    Args:
+        path: 檔案路徑
+        n: 筆數
+        with_device: 是否在每筆數據最後附上裝置名稱
+
+    Returns:
+        list: (epoch 秒數, 溫度, 濕度, 電燈狀態編碼[, 裝置]) 的列表，由舊到新排列
+    """
+    header = read_header(path)
+    if not header:
+        return []
+    i_ts, i_temp, i_humi, i_light, i_dev = column_indices(header)
+
+    lines = read_tail_lines(path, n, block_size)
+    rows = []
+    for fields in csv.reader(line.decode('utf-8') for line in lines):
+        try:
+            row = (
+                parse_timestamp(fields[i_ts]),
+                float(fields[i_temp]),
+                float(fields[i_humi]),
+                encode_light(fields[i_light]),
+            )
+        except (ValueError, IndexError):
+            # 略過損壞的列（例如斷電時寫到一半的最後一列）
+            continue
+        rows.append(row + (row_device(fields, i_dev),) if with_device else row)
+    return rows
@@ -0,0 +1,396 @@
+"""
+批次寫入 CSV 的背景寫入器
+MQTT 回調只負責把資料放進佇列，由背景執行緒累積成批次後一次寫入，
+避免每筆訊息都開關檔案，降低 Raspberry Pi SD 卡的 I/O 負擔
+
+BatchWriter 負責佇列、批次觸發、失敗重試與統計，子類別只需實作 _open / _write_batch / _close
+寫入失敗時保留整個批次，以遞增的間隔（RETRY_DELAY 起每次加倍，最長 RETRY_MAX_DELAY）重試，
+期間收到的數據併入同一個批次，不會遺失
+"""
+
+import csv
+import io
+import logging
+import os
+import queue
+import threading
+import time
+
+logger = logging.getLogger('csv_writer')
+
+# fsync 策略
+FSYNC_NONE = 'none'          # 不主動 fsync，交給作業系統決定何時寫回
+FSYNC_BATCH = 'batch'        # 每次批次寫入後都 fsync（最安全，最慢）
+FSYNC_INTERVAL = 'interval'  # 距離上次 fsync 超過 fsync_interval 秒才 fsync
+
+FSYNC_POLICIES = (FSYNC_NONE, FSYNC_BATCH, FSYNC_INTERVAL)
+
+# 寫入失敗後的重試間隔（秒）：從 RETRY_DELAY 開始每次加倍，最長 RETRY_MAX_DELAY
+RETRY_DELAY = 0.5
+RETRY_MAX_DELAY = 30.0
+# 關閉時仍寫入失敗，最多再重試幾次
+CLOSE_RETRIES = 3
+
+# 佇列中的控制訊號
+_STOP = object()
+_FLUSH = object()
+
+
+class BatchWriter:
+    """
+    背景批次寫入器（基底類別）
+
+    Args:
+        batch_size: 累積幾筆就寫入一次
+        flush_interval: 第一筆資料進入批次後最多等待幾秒就寫入
+        report_interval: 每隔幾秒印出一次寫入統計，0 表示不印
+        name: 執行緒與統計訊息使用的名稱
+    """
+
+    def __init__(self, batch_size=200, flush_interval=1.0, report_interval=60, name='writer'):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.report_interval = report_interval
+        self.name = name
+
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._closed = False
+
+        # 每次批次寫入後呼叫 flush_observer(秒數, 筆數)（供 Prometheus 指標使用）
+        self.flush_observer = None
+
+        # 統計數據
+        self._lock = threading.Lock()
+        self._started_at = time.monotonic()
+        self._total_rows = 0
+        self._total_flushes = 0
+        self._total_flush_time = 0.0
+        self._max_flush_time = 0.0
+        self._last_flush_time = 0.0
+        self._failed_flushes = 0     # 寫入失敗次數（每次重試失敗都算一次）
+        self._failed_rows = 0        # 寫入失敗的累計筆數（同一筆重試多次會重複計算）
+        self._retry_rows = 0         # 目前保留等待重試的筆數
+        self._lost_rows = 0          # 關閉時重試仍失敗而遺失的筆數
+        self._report_at = time.monotonic()
+        self._report_rows = 0
+
+    def start(self):
+        """開啟輸出並啟動背景寫入執行緒"""
+        self._open()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+        return self
+
+    def write(self, row):
+        """將一筆資料放入佇列，立即返回"""
+        if self._closed:
+            raise RuntimeError(f"{self.name} 已關閉")
+        self._queue.put(row)
+
+    def flush(self, timeout=None):
+        """
+        要求背景執行緒立即寫入目前累積的資料（包含等待重試的批次），並等待完成
+
+        Returns:
+            bool: 寫入成功為 True；逾時或寫入失敗（數據仍保留等待重試）為 False
+        """
+        if self._thread is None or not self._thread.is_alive():
+            return False
+        done = threading.Event()
+        result = []
+        self._queue.put((_FLUSH, done, result))
+        return done.wait(timeout) and bool(result) and result[0]
+
+    def close(self, timeout=10):
+        """寫入剩餘資料後關閉輸出"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+        self._close()
+
+        stats = self.stats()
+        print(f"💾 {self.name}已關閉: 共 {stats['total_rows']} 筆，"
+              f"{stats['total_flushes']} 次寫入，平均 {stats['avg_flush_ms']:.2f} ms")
+        if stats['failed_flushes']:
+            print(f"⚠️  {self.name}: 寫入失敗 {stats['failed_flushes']} 次，遺失 {stats['lost_rows']} 筆")
+
+    def stats(self):
+        """
+        取得寫入統計
+
+        Returns:
+            dict: 總筆數、寫入次數、每秒筆數、flush 延遲（毫秒）、佇列長度、
+                寫入失敗次數與筆數、等待重試與遺失的筆數
+        """
+        with self._lock:
+            elapsed = max(time.monotonic() - self._started_at, 1e-9)
+            flushes = self._total_flushes
+            return {
+                'total_rows': self._total_rows,
+                'total_flushes': flushes,
+                'rows_per_sec': self._total_rows / elapsed,
+                'avg_flush_ms': (self._total_flush_time / flushes * 1000) if flushes else 0.0,
+                'max_flush_ms': self._max_flush_time * 1000,
+                'last_flush_ms': self._last_flush_time * 1000,
+                'pending': self._queue.qsize(),
+                'failed_flushes': self._failed_flushes,
+                'failed_rows': self._failed_rows,
+                'retry_rows': self._retry_rows,
+                'lost_rows': self._lost_rows,
+            }
+
+    def _open(self):
+        """（子類別實作）開啟輸出"""
+
+    def _write_batch(self, batch):
+        """（子類別實作）寫入一個批次"""
+        raise NotImplementedError
+
+    def _close(self):
+        """（子類別實作）關閉輸出"""
+
+    def _run(self):
+        """背景執行緒：依筆數或時間觸發批次寫入，失敗時保留批次並延後重試"""
+        batch = []
+        deadline = None
+        retry_delay = 0.0   # 大於 0 表示 batch 中有寫入失敗、等待重試的數據
+
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                break
+
+            if isinstance(item, tuple) and item and item[0] is _FLUSH:
+                # 明確要求的 flush 不等待重試間隔
+                ok = self._flush(batch)
+                if ok:
+                    batch, deadline, retry_delay = [], None, 0.0
+                else:
+                    retry_delay, deadline = self._backoff(retry_delay)
+                item[2].append(ok)
+                item[1].set()
+                continue
+
+            if item is not None:
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+
+            # 等待重試期間筆數到達 batch_size 也不提早寫入
+            if batch and ((len(batch) >= self.batch_size and not retry_delay) or time.monotonic() >= deadline):
+                if self._flush(batch):
+                    batch, deadline, retry_delay = [], None, 0.0
+                else:
+                    retry_delay, deadline = self._backoff(retry_delay)
+
+        # 關閉前寫入剩餘資料（包含 STOP 之後仍在佇列中的資料）
+        waiting = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(item, tuple) and item and item[0] is _FLUSH:
+                waiting.append(item)
+            elif item is not _STOP:
+                batch.append(item)
+        ok = self._flush(batch)
+        for _ in range(CLOSE_RETRIES):
+            if ok:
+                break
+            retry_delay, _ = self._backoff(retry_delay)
+            time.sleep(min(retry_delay, 1.0))
+            ok = self._flush(batch)
+        if not ok:
+            with self._lock:
+                self._lost_rows += len(batch)
+                self._retry_rows = 0
+            logger.error("%s 關閉時仍無法寫入，遺失 %d 筆數據", self.name, len(batch))
+        for item in waiting:
+            item[2].append(ok)
+            item[1].set()
+
+    @staticmethod
+    def _backoff(retry_delay):
+        """
+        計算下一次重試的間隔
+
+        Returns:
+            tuple: (新的重試間隔, 重試時間 time.monotonic())
+        """
+        retry_delay = min(RETRY_MAX_DELAY, retry_delay * 2 if retry_delay else RETRY_DELAY)
+        return retry_delay, time.monotonic() + retry_delay
+
+    def _flush(self, batch):
+        """
+        寫入一個批次並更新統計
+
+        Returns:
+            bool: 寫入成功（或沒有數據）為 True；失敗為 False，呼叫端保留 batch 稍後重試
+        """
+        if not batch:
+            return True
+
+        started = time.perf_counter()
+        try:
+            self._write_batch(batch)
+        except Exception as e:
+            with self._lock:
+                self._failed_flushes += 1
+                self._failed_rows += len(batch)
+                self._retry_rows = len(batch)
+            logger.warning("%s 寫入失敗（%d 筆保留待重試）: %s", self.name, len(batch), e)
+            return False
+        duration = time.perf_counter() - started
+
+        with self._lock:
+            self._total_rows += len(batch)
+            self._total_flushes += 1
+            self._total_flush_time += duration
+            self._last_flush_time = duration
+            self._max_flush_time = max(self._max_flush_time, duration)
+            self._retry_rows = 0
+
+        if self.flush_observer is not None:
+            self.flush_observer(duration, len(batch))
+        self._report(time.monotonic())
+        return True
+
+    def _report(self, now):
+        """定期印出每秒寫入筆數與 flush 延遲"""
+        if not self.report_interval or now - self._report_at < self.report_interval:
+            return
+        stats = self.stats()
+        rows = stats['total_rows'] - self._report_rows
+        rate = rows / (now - self._report_at)
+        print(f"💾 {self.name}: {rate:.1f} 筆/秒, 平均 flush {stats['avg_flush_ms']:.2f} ms, "
+              f"最長 {stats['max_flush_ms']:.2f} ms, 佇列 {stats['pending']} 筆")
+        self._report_at = now
+        self._report_rows = stats['total_rows']
+
+
+class BatchCSVWriter(BatchWriter):
+    """
+    背景批次 CSV 寫入器
+
+    Args:
+        filename: CSV 檔案路徑
+        fieldnames: 欄位名稱（檔案不存在或為空時寫入標題列）
+        batch_size: 累積幾筆就寫入一次
+        flush_interval: 第一筆資料進入批次後最多等待幾秒就寫入
+        fsync_policy: fsync 策略（none / batch / interval）
+        fsync_interval: interval 策略下兩次 fsync 的最短間隔（秒）
+        report_interval: 每隔幾秒印出一次寫入統計，0 表示不印
+        on_flush: 每次批次寫入後呼叫 on_flush(batch, offsets)，
+            offsets 為每一列在檔案中的起始位元組位置（供索引使用）
+        name: 執行緒與統計訊息使用的名稱
+    """
+
+    def __init__(self, filename, fieldnames, batch_size=200, flush_interval=1.0,
+                 fsync_policy=FSYNC_INTERVAL, fsync_interval=5.0, report_interval=60,
+                 on_flush=None, name='CSV 寫入器'):
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"未知的 fsync 策略: {fsync_policy}")
+        super().__init__(batch_size, flush_interval, report_interval, name=name)
+
+        self.filename = filename
+        self.fieldnames = list(fieldnames)
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+        self.on_flush = on_flush
+
+        self._file = None
+        self._last_fsync = time.monotonic()
+
+    def _open(self):
+        """開啟檔案（追加模式），空檔案先寫入標題列"""
+        self._file = open(self.filename, 'ab')
+        if self._file.tell() == 0:
+            buffer = io.StringIO()
+            csv.writer(buffer).writerow(self.fieldnames)
+            self._file.write(buffer.getvalue().encode('utf-8'))
+            self._file.flush()
+
+    def _close(self):
+        """fsync 後關閉檔案"""
+        if self._file is not None:
+            self._file.flush()
+            if self.fsync_policy != FSYNC_NONE:
+                os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
+
+    def _write_batch(self, batch):
+        """將一個批次編碼後一次寫入檔案"""
+        if self._file is None:
+            # 上一次失敗後無法重新開啟檔案
+            self._open()
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=self.fieldnames)
+        offsets = None
+        if self.on_flush is None:
+            writer.writerows(batch)
+            data = buffer.getvalue().encode('utf-8')
+        else:
+            # 逐列編碼以取得每列的位元組位置（中文字元的位元組長度與字元數不同）
+            offsets = []
+            position = self._file.tell()
+            parts = []
+            for row in batch:
+                writer.writerow(row)
+                encoded = buffer.getvalue().encode('utf-8')
+                buffer.seek(0)
+                buffer.truncate()
+                offsets.append(position)
+                position += len(encoded)
+                parts.append(encoded)
+            data = b''.join(parts)
+        start = self._file.tell()
+        try:
+            self._file.write(data)
+            self._file.flush()
+        except OSError:
+            self._rollback(start)
+            raise
+
+        # 數據已交給作業系統，fsync 失敗時不重試（重試會讓這個批次重複寫入）
+        now = time.monotonic()
+        if self.fsync_policy == FSYNC_BATCH or (
+                self.fsync_policy == FSYNC_INTERVAL and now - self._last_fsync >= self.fsync_interval):
+            try:
+                os.fsync(self._file.fileno())
+            except OSError as e:
+                logger.warning("%s fsync 失敗: %s", self.name, e)
+            self._last_fsync = now
+
+        if offsets is not None:
+            try:
+                self.on_flush(batch, offsets)
+            except Exception as e:
+                print(f"⚠️  CSV on_flush 回調錯誤: {e}")
+
+    def _rollback(self, position):
+        """
+        寫入失敗時截斷到批次開始前的位置並重新開啟檔案，
+        避免只寫入一半的批次在重試後重複出現
+        """
+        try:
+            self._file.close()
+        except OSError:
+            pass
+        self._file = None
+        try:
+            if os.path.getsize(self.filename) > position:
+                os.truncate(self.filename, position)
+            self._file = open(self.filename, 'ab')
+        except OSError as e:
+            logger.warning("%s 無法重新開啟檔案（下次重試時再開啟）: %s", self.name, e)
@@ -0,0 +1,344 @@
+"""
+多裝置狀態登錄表
+每個裝置（例如每個房間一塊 Pico W）各自保留最新數據與歷史環形緩衝區
+
+讀取不需要鎖：裝置表採「寫入時複製」，新增裝置時建立新的 dict 再整個替換，
+讀取端拿到的永遠是完整的 dict；只有第一次看到新裝置時才需要取得鎖，
+各裝置的環形緩衝區互相獨立，多個裝置同時寫入也不會互相等待
+"""
+
+import threading
+import time
+
+from ring_buffer import SensorRingBuffer, format_timestamp
+
+# 每個裝置在記憶體中保留的歷史筆數（每筆約 17 bytes，1 萬筆約 170 KB）
+DEFAULT_DEVICE_CAPACITY = 10_000
+
+# 每個裝置記住最近幾個序號來判斷重複（大於 Pico 快閃記憶體日誌的容量 4096 筆），每個裝置 2 KB
+DEDUPE_WINDOW = 16_384
+
+# 發布端重新開始計數時的第一個序號（test_mqtt_publish.py 每次執行的 message_id 從 1 開始）
+FIRST_SEQ = 1
+
+
+class SequenceTracker:
+    """
+    依裝置序號去除重複數據，並統計缺號與亂序
+
+    MQTT QoS 1 重新連線後 Broker 可能重送、Pico 斷線補傳或重新開機時可能重送已送過的部分；
+    以環狀位元圖記住最近 window 個序號是否已收到（記憶體固定 window / 8 bytes）：
+        - 序號剛好是最大序號 + 1（依序到達）：只設定一個位元
+        - 跳號：中間的序號記為缺號（missing），之後補到時改記為亂序（reordered）
+        - 已收到的序號：重複，丟棄
+        - 比視窗更舊的序號無法判斷，一律接受（stale）
+    只有確實的訊號才視為發布端重新開始並清除記錄：
+        - 數據帶的 session（每次執行或開機不同的識別碼）與之前不同，或之前的數據沒有帶 session
+        - 序號回到 FIRST_SEQ，而且最大序號已超出視窗（FIRST_SEQ 已無法判斷，重送不會晚這麼多）
+    視窗內回到 FIRST_SEQ 照一般規則判斷：QoS 1 從頭重送的 1、2、3… 記為重複
+
+    Pico 重新開機後序號會跳過預留但沒用到的部分（flash_log.SequenceStore），這段也會記為缺號
+
+    Args:
+        window: 記住幾個序號（進位到 8 的倍數）
+    """
+
+    __slots__ = ('window', 'highest', 'base', 'accepted', 'duplicates', 'missing', 'gaps', 'reordered',
+                 'stale', 'restarts', 'session', '_bits', '_lock')
+
+    def __init__(self, window=DEDUPE_WINDOW):
+        self.window = (window + 7) // 8 * 8
+        self._bits = bytearray(self.window // 8)
+        self.highest = None
+        self.base = None          # 收到過的最小序號（缺號從這裡開始計算）
+        self.accepted = 0
+        self.duplicates = 0
+        self.missing = 0          # 跳過且尚未補到的序號數
+        self.gaps = 0             # 跳號次數
+        self.reordered = 0        # 比最大序號小、晚到的序號數
+        self.stale = 0            # 比視窗更舊而無法判斷的序號數
+        self.restarts = 0
+        self.session = None       # 最後看到的發布端 session（沒有帶時為 None）
+        self._lock = threading.Lock()
+
+    def accept(self, seq, session=None):
+        """
+        記錄一個序號
+
+        Args:
+            seq: 裝置序號
+            session: 發布端的 session 識別碼（None 為沒有帶）
+
+        Returns:
+            bool: 第一次看到回傳 True，重複回傳 False
+        """
+        with self._lock:
+            # 快速路徑：依序到達（session 沒有改變）
+            highest = self.highest
+            if highest is not None and seq == highest + 1 and (session is None or session == self.session):
+                i = seq % self.window
+                self._bits[i >> 3] |= 1 << (i & 7)
+                self.highest = seq
+                self.accepted += 1
+                return True
+            return self._accept_slow(seq, session)
+
+    def _accept_slow(self, seq, session):
+        """（持有鎖時呼叫）第一筆、跳號、晚到、重複或重新開始"""
+        highest = self.highest
+        if session is not None and session != self.session:
+            # 第一次帶 session 或 session 改變：之前的序號屬於上一次執行
+            highest = None
+            self.session = session
+        if highest is not None and seq == FIRST_SEQ and highest - FIRST_SEQ >= self.window:
+            highest = None
+        if highest is None and self.highest is not None:
+            self._reset()
+            self.restarts += 1
+
+        if highest is None:
+            self.highest = self.base = seq
+        elif seq > highest:
+            skipped = seq - highest - 1
+            self._clear(highest + 1, skipped)
+            self.missing += skipped
+            self.gaps += 1
+            self.highest = seq
+        elif highest - seq >= self.window:
+            self.stale += 1
+            self.accepted += 1
+            return True
+        else:
+            i = seq % self.window
+            if self._bits[i >> 3] & (1 << (i & 7)):
+                self.duplicates += 1
+                return False
+            self.reordered += 1
+            if seq > self.base:
+                self.missing -= 1
+            else:
+                # 比第一個序號更早：中間的序號也算缺號
+                self.missing += self.base - seq - 1
+                self.base = seq
+
+        i = seq % self.window
+        self._bits[i >> 3] |= 1 << (i & 7)
+        self.accepted += 1
+        return True
+
+    def _clear(self, first, count):
+        """清除從 first 開始 count 個序號的位元（環狀，中間整段以位元組清除）"""
+        bits = self._bits
+        if count >= self.window:
+            bits[:] = bytes(len(bits))
+            return
+        i = first % self.window
+        while count and i & 7:
+            bits[i >> 3] &= ~(1 << (i & 7))
+            i = (i + 1) % self.window
+            count -= 1
+        while count >= 8:
+            n = min(count >> 3, (self.window - i) >> 3)
+            bits[i >> 3:(i >> 3) + n] = bytes(n)
+            i = (i + n * 8) % self.window
+            count -= n * 8
+        while count:
+            bits[i >> 3] &= ~(1 << (i & 7))
+            i += 1
+            count -= 1
+
+    def _reset(self):
+        self._bits[:] = bytes(len(self._bits))
+        self.highest = self.base = None
+
+    # dump_state() / restore_state() 保存的計數欄位
+    STATE_FIELDS = ('highest', 'base', 'accepted', 'duplicates', 'missing', 'gaps', 'reordered',
+                    'stale', 'restarts', 'session')
+
+    def dump_state(self):
+        """
+        複製目前的狀態（供 checkpoint.py 寫入檢查點）
+
+        Returns:
+            tuple: ({欄位: 值}, 位元圖 bytes)
+        """
+        with self._lock:
+            return {key: getattr(self, key) for key in self.STATE_FIELDS}, bytes(self._bits)
+
+    def restore_state(self, fields, bits):
+        """還原 dump_state() 的內容（視窗大小必須相同）"""
+        if len(bits) != len(self._bits):
+            raise ValueError(f"位元圖大小 {len(bits)} 與視窗 {self.window} 不符")
+        with self._lock:
+            self._bits[:] = bits
+            for key in self.STATE_FIELDS:
+                # 舊版檢查點沒有 session
+                setattr(self, key, fields.get(key) if key == 'session' else fields[key])
+
+    def as_dict(self):
+        expected = self.accepted + self.missing
+        return {
+            'highest': self.highest,
+            'accepted': self.accepted,
+            'duplicates': self.duplicates,
+            'missing': self.missing,
+            'gaps': self.gaps,
+            'reordered': self.reordered,
+            'stale': self.stale,
+            'restarts': self.restarts,
+            'loss_ratio': round(self.missing / expected, 6) if expected else 0.0,
+        }
+
+
+class DeviceState:
+    """
+    單一裝置的狀態
+
+    Args:
+        name: 裝置名稱
+        capacity: 歷史環形緩衝區容量
+    """
+
+    __slots__ = ('name', 'history', 'sequence', 'messages', 'first_seen', 'last_seen')
+
+    def __init__(self, name, capacity):
+        self.name = name
+        self.history = SensorRingBuffer(capacity)
+        self.sequence = SequenceTracker()
+        self.messages = 0
+        self.first_seen = None
+        self.last_seen = None
+
+    def latest(self):
+        """最新一筆數據（dict），尚無數據時回傳 None"""
+        return self.history.latest()
+
+    def summary(self):
+        """裝置摘要（供 /api/devices 使用）"""
+        return {
+            'device': self.name,
+            'messages': self.messages,
+            'records': len(self.history),
+            'first_seen': format_timestamp(self.first_seen) if self.first_seen else None,
+            'last_seen': format_timestamp(self.last_seen) if self.last_seen else None,
+            'seconds_since_last': round(time.time() - self.last_seen, 1) if self.last_seen else None,
+            'sequence': self.sequence.as_dict(),
+            'latest': self.latest(),
+        }
+
+
+class DeviceRegistry:
+    """
+    以裝置名稱為鍵的狀態登錄表
+
+    Args:
+        capacity: 每個裝置的歷史環形緩衝區容量
+        max_devices: 最多登錄幾個裝置（避免錯誤的主題無限制地建立裝置）
+    """
+
+    def __init__(self, capacity=DEFAULT_DEVICE_CAPACITY, max_devices=256):
+        self.capacity = capacity
+        self.max_devices = max_devices
+        self._devices = {}
+        self._create_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._devices)
+
+    def __contains__(self, name):
+        return name in self._devices
+
+    def get(self, name):
+        """取得裝置狀態，不存在時回傳 None（不需要鎖）"""
+        return self._devices.get(name)
+
+    def names(self):
+        """所有裝置名稱（依名稱排序）"""
+        return sorted(self._devices)
+
+    def get_or_create(self, name):
+        """
+        取得裝置狀態，第一次出現的裝置會建立新的狀態
+
+        Returns:
+            DeviceState: 裝置狀態；超過 max_devices 時回傳 None
+        """
+        state = self._devices.get(name)
+        if state is not None:
+            return state
+        with self._create_lock:
+            state = self._devices.get(name)
+            if state is None:
+                if len(self._devices) >= self.max_devices:
+                    return None
+                state = DeviceState(name, self.capacity)
+                # 寫入時複製：讀取端不會看到修改中的 dict
+                devices = dict(self._devices)
+                devices[name] = state
+                self._devices = devices
+                print(f"🆕 新裝置: {name}")
+            return state
+
+    def accept(self, name, seq, session=None):
+        """
+        依裝置序號（與發布端 session）判斷是否為重複數據
+
+        Returns:
+            bool: 應該處理回傳 True；重複回傳 False（裝置數量已達上限時回傳 True，由 record() 決定）
+        """
+        state = self.get_or_create(name)
+        if state is None:
+            return True
+        return state.sequence.accept(seq, session)
+
+    def clamp_timestamp(self, name, timestamp):
+        """
+        同一個裝置的時間不早於它的上一筆（裝置時鐘往回調時），其他裝置的時間不影響
+
+        Returns:
+            float: 調整後的 epoch 秒數
+        """
+        state = self._devices.get(name)
+        if state is None or state.last_seen is None or timestamp >= state.last_seen:
+            return timestamp
+        return state.last_seen
+
+    def record(self, name, timestamp, temperature, humidity, light):
+        """
+        記錄一筆裝置數據
+
+        Args:
+            name: 裝置名稱
+            timestamp: epoch 秒數
+            temperature / humidity: 溫度 / 濕度
+            light: 電燈狀態編碼
+
+        Returns:
+            DeviceState: 裝置狀態；裝置數量已達上限時回傳 None（數據不記錄）
+        """
+        state = self.get_or_create(name)
+        if state is None:
+            return None
+        state.history.append(timestamp, temperature, humidity, light)
+        state.messages += 1
+        if state.first_seen is None:
+            state.first_seen = timestamp
+        state.last_seen = timestamp
+        return state
+
+    def sequence_totals(self):
+        """所有裝置的序號統計加總（收到、重複、缺號、跳號、亂序筆數）"""
+        keys = ('accepted', 'duplicates', 'missing', 'gaps', 'reordered', 'stale', 'restarts')
+        totals = dict.fromkeys(keys, 0)
+        for state in self._devices.values():
+            tracker = state.sequence
+            for key in keys:
+                totals[key] += getattr(tracker, key)
+        expected = totals['accepted'] + totals['missing']
+        totals['loss_ratio'] = round(totals['missing'] / expected, 6) if expected else 0.0
+        return totals
+
+    def summaries(self):
+        """所有裝置的摘要列表"""
+        devices = self._devices
+        return [devices[name].summary() for name in sorted(devices)]
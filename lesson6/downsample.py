@@ -0,0 +1,226 @@
+"""
+歷史數據降採樣
+提供 Largest-Triangle-Three-Buckets（LTTB）與 min/max 分桶兩種方法，
+把數萬筆數據縮減成圖表需要的數百個點，同時保留曲線形狀（高峰與低谷）
+
+有安裝 numpy 時以向量化運算處理，否則使用純 Python 版本
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict
+
+# 嘗試導入 numpy（Raspberry Pi 上可能未安裝）
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+METHOD_LTTB = 'lttb'
+METHOD_MINMAX = 'minmax'
+METHODS = (METHOD_LTTB, METHOD_MINMAX)
+
+
+def _bucket_edges(size, n):
+    """
+    LTTB 中間 n - 2 個分桶的邊界（兩種實作共用同一組邊界，選出的點才會相同）
+
+    浮點數截斷可能讓最後一個邊界停在 size - 2，因此固定為 size - 1（最後一個點自成一桶）
+
+    Returns:
+        list: n - 1 個邊界，第 i 個分桶為 [edges[i], edges[i + 1])
+    """
+    every = (size - 2) / (n - 2)
+    edges = [int(i * every) + 1 for i in range(n - 1)]
+    edges[-1] = size - 1
+    return edges
+
+
+def _lttb_python(x, y, n):
+    """LTTB 純 Python 版本，回傳選中的索引"""
+    size = len(x)
+    edges = _bucket_edges(size, n)
+    selected = [0]
+    a = 0
+    for i in range(n - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # 下一個分桶的平均點；最後一桶的「下一桶」是最後一個點
+        if i + 2 < len(edges):
+            next_lo, next_hi = hi, edges[i + 2]
+        else:
+            next_lo, next_hi = size - 1, size
+        count = next_hi - next_lo
+        avg_x = sum(x[next_lo:next_hi]) / count
+        avg_y = sum(y[next_lo:next_hi]) / count
+
+        ax, ay = x[a], y[a]
+        best, best_area = lo, -1.0
+        for j in range(lo, hi):
+            area = abs((ax - avg_x) * (y[j] - ay) - (ax - x[j]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        selected.append(best)
+        a = best
+    selected.append(size - 1)
+    return selected
+
+
+def _lttb_numpy(x, y, n):
+    """LTTB numpy 版本：每個分桶內的三角形面積以向量運算求得"""
+    size = len(x)
+    edges = np.array(_bucket_edges(size, n), dtype=np.int64)
+
+    # 預先算好每個分桶的平均值（下一個分桶的平均點），最後一桶的「下一桶」是最後一個點
+    sums_x = np.add.reduceat(x[:size - 1], edges[:-1])
+    sums_y = np.add.reduceat(y[:size - 1], edges[:-1])
+    counts = np.diff(edges)
+    avg_x = np.append(sums_x / counts, x[-1])
+    avg_y = np.append(sums_y / counts, y[-1])
+
+    selected = np.empty(n, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = size - 1
+    a = 0
+    for i in range(n - 2):
+        lo, hi = edges[i], edges[i + 1]
+        ax, ay = x[a], y[a]
+        area = np.abs((ax - avg_x[i + 1]) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (avg_y[i + 1] - ay))
+        a = lo + int(area.argmax())
+        selected[i + 1] = a
+    return selected.tolist()
+
+
+def lttb(x, y, n):
+    """
+    Largest-Triangle-Three-Buckets 降採樣
+
+    Args:
+        x: 時間序列（遞增）
+        y: 數值序列
+        n: 目標點數
+
+    Returns:
+        list: 選中的索引（遞增，包含第一個與最後一個點）
+    """
+    size = len(x)
+    if n >= size or n < 3:
+        return list(range(size))
+    if HAS_NUMPY:
+        return _lttb_numpy(np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64), n)
+    return _lttb_python(x, y, n)
+
+
+def minmax(y, n):
+    """
+    min/max 分桶降採樣：每個分桶保留最小值與最大值的索引
+
+    Args:
+        y: 數值序列
+        n: 目標點數（分桶數為 n // 2）
+
+    Returns:
+        list: 選中的索引（遞增）
+    """
+    size = len(y)
+    buckets = max(1, n // 2)
+    if n >= size:
+        return list(range(size))
+
+    width = math.ceil(size / buckets)
+    if HAS_NUMPY:
+        values = np.asarray(y, dtype=np.float64)
+        # 補齊成 buckets x width 的矩陣，一次求出每列的 argmin / argmax；
+        # 補上的格子求最小值時填 +inf、求最大值時填 -inf，永遠不會被選中（相同數值時與純 Python 版本一樣選第一個）
+        pad = buckets * width - size
+        base = np.arange(buckets) * width
+        low = np.pad(values, (0, pad), constant_values=np.inf).reshape(buckets, width)
+        high = np.pad(values, (0, pad), constant_values=-np.inf).reshape(buckets, width)
+        picks = np.concatenate((base + low.argmin(axis=1), base + high.argmax(axis=1)))
+        # 最後幾列可能整列都是補上的格子（size 不足 buckets 列），這些列不屬於任何數據
+        return np.unique(picks[picks < size]).tolist()
+
+    selected = set()
+    for lo in range(0, size, width):
+        chunk = y[lo:lo + width]
+        selected.add(lo + min(range(len(chunk)), key=chunk.__getitem__))
+        selected.add(lo + max(range(len(chunk)), key=chunk.__getitem__))
+    return sorted(selected)
+
+
+def downsample_indices(x, series, points, method=METHOD_LTTB):
+    """
+    對多個數值序列降採樣，回傳共用的索引（各序列選中點的聯集）
+
+    每個序列分到 points / len(series) 個點，聯集後總點數不超過 points
+
+    Args:
+        x: 時間序列
+        series: 數值序列列表（例如 [溫度, 濕度]）
+        points: 目標點數
+        method: 'lttb' 或 'minmax'
+    """
+    if method not in METHODS:
+        raise ValueError(f"未知的降採樣方法: {method}")
+    if len(x) <= points:
+        return list(range(len(x)))
+
+    per_series = max(3, points // len(series))
+    selected = set()
+    for y in series:
+        if method == METHOD_LTTB:
+            selected.update(lttb(x, y, per_series))
+        else:
+            selected.update(minmax(y, per_series))
+    return sorted(selected)
+
+
+class DownsampleCache:
+    """
+    降採樣結果快取（LRU）
+
+    以（範圍, 點數, 方法）為鍵，另外記錄產生結果時的資料版本；
+    版本相同時直接回傳，版本不同但結果產生未滿 ttl 秒也直接回傳，
+    因此多個儀表板重複輪詢時每秒最多只重新計算一次
+
+    Args:
+        max_entries: 最多保留幾個結果
+        ttl: 資料版本改變後，舊結果仍可使用的秒數
+    """
+
+    def __init__(self, max_entries=64, ttl=1.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compute(self, key, version, compute):
+        """
+        取得快取結果，不存在或過期時呼叫 compute() 重新計算
+
+        Args:
+            key: 快取鍵（範圍、點數、方法）
+            version: 目前的資料版本（例如累計寫入筆數）
+            compute: 無參數函式，回傳要快取的結果
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                cached_version, created, value = entry
+                if cached_version == version or now - created < self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+            self.misses += 1
+
+        value = compute()
+        with self._lock:
+            self._entries[key] = (version, now, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
@@ -0,0 +1,50 @@
+"""
+Excel 工作表格式（generate_test_data.py 與 export.py 共用）
+以 openpyxl write_only 模式建立工作表，標題列樣式與欄寬在這裡統一設定，
+兩邊產生的 Excel 格式相同
+"""
+
+from storage import CSV_FIELDNAMES
+
+# 嘗試導入 openpyxl（用於 Excel）
+try:
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font, PatternFill
+    HAS_OPENPYXL = True
+except ImportError:
+    HAS_OPENPYXL = False
+
+# Excel 單一工作表的列數上限（含標題列）
+EXCEL_MAX_ROWS = 1_048_576
+
+# 工作表名稱（第 2 個之後加上編號）
+SHEET_TITLE = "感測器數據"
+
+# 各欄寬度（時間戳記, 電燈狀態, 溫度, 濕度, 裝置）
+COLUMN_WIDTHS = {'A': 20, 'B': 12, 'C': 10, 'D': 10, 'E': 10}
+
+
+def new_sheet(wb, index):
+    """
+    建立第 index 個工作表並寫入標題列
+
+    Args:
+        wb: write_only 模式的 Workbook
+        index: 工作表編號（從 1 開始）
+
+    Returns:
+        工作表（之後以 ws.append 逐列寫入）
+    """
+    ws = wb.create_sheet(SHEET_TITLE if index == 1 else f"{SHEET_TITLE} {index}")
+    for column, width in COLUMN_WIDTHS.items():
+        ws.column_dimensions[column].width = width
+
+    # 設定標題樣式（write_only 模式需要以 WriteOnlyCell 指定樣式）
+    header = []
+    for name in CSV_FIELDNAMES:
+        cell = WriteOnlyCell(ws, value=name)
+        cell.font = Font(color="FFFFFF", bold=True)
+        cell.fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+        header.append(cell)
+    ws.append(header)
+    return ws
@@ -0,0 +1,134 @@
+"""
+歷史數據匯出（/api/export）
+從儲存後端逐筆讀取，每 EXPORT_CHUNK_ROWS 筆編碼成一段輸出，整個範圍不會同時放在記憶體中
+    CSV  - 每段編碼完直接串流給客戶端
+    XLSX - 以 openpyxl write_only 模式寫入 SpooledTemporaryFile（小檔在記憶體、大檔自動改存磁碟），
+           寫完後再分段串流（xlsx 是 zip 格式，必須整個檔案寫完才能送出）
+"""
+
+import csv
+import io
+import tempfile
+
+from ring_buffer import decode_light, format_timestamp
+from storage import CSV_FIELDNAMES
+from excel_sheet import EXCEL_MAX_ROWS, HAS_OPENPYXL, new_sheet
+
+if HAS_OPENPYXL:
+    from openpyxl import Workbook
+
+FORMAT_CSV = 'csv'
+FORMAT_XLSX = 'xlsx'
+FORMATS = (FORMAT_CSV, FORMAT_XLSX)
+
+CONTENT_TYPES = {
+    FORMAT_CSV: 'text/csv; charset=utf-8',
+    FORMAT_XLSX: 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+# 每次讀取並編碼的筆數（約 250 KB 的 CSV）
+EXPORT_CHUNK_ROWS = 5000
+# XLSX 暫存檔超過這個大小就改存磁碟
+XLSX_SPOOL_SIZE = 8 * 1024 * 1024
+# XLSX 分段送出的大小
+XLSX_READ_SIZE = 256 * 1024
+
+
+def export_row(timestamp, temperature, humidity, light, device):
+    """將 iter_range(with_device=True) 的一筆數據轉為 CSV_FIELDNAMES 順序的欄位"""
+    return (format_timestamp(timestamp), decode_light(light), round(temperature, 2), round(humidity, 2), device)
+
+
+def _chunks(rows, chunk_rows):
+    """將逐筆的數據切成每 chunk_rows 筆一段"""
+    chunk = []
+    for row in rows:
+        chunk.append(export_row(*row))
+        if len(chunk) >= chunk_rows:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def iter_csv(rows, chunk_rows=EXPORT_CHUNK_ROWS, progress=None):
+    """
+    逐段產生 CSV 內容
+
+    Args:
+        rows: storage.iter_range(..., with_device=True) 的產生器
+        chunk_rows: 每段筆數
+        progress: 每段寫完後以筆數呼叫（可選，用於統計）
+
+    Yields:
+        bytes: UTF-8 編碼的 CSV 片段（第一段為標題列）
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_FIELDNAMES)
+    yield buffer.getvalue().encode('utf-8')
+    for chunk in _chunks(rows, chunk_rows):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(chunk)
+        yield buffer.getvalue().encode('utf-8')
+        if progress is not None:
+            progress(len(chunk))
+
+
+def write_xlsx(rows, fileobj, chunk_rows=EXPORT_CHUNK_ROWS, sheet_rows=EXCEL_MAX_ROWS, progress=None):
+    """
+    以 write_only 模式寫入 XLSX（超過 sheet_rows 列時換到下一個工作表）
+
+    Args:
+        rows: storage.iter_range(..., with_device=True) 的產生器
+        fileobj: 寫入的檔案物件
+        sheet_rows: 每個工作表最多幾列（含標題列）
+
+    Returns:
+        int: 寫入筆數
+    """
+    sheet_rows = min(sheet_rows, EXCEL_MAX_ROWS)
+    wb = Workbook(write_only=True)
+    sheets = 0
+    used = sheet_rows
+    total = 0
+    for chunk in _chunks(rows, chunk_rows):
+        for row in chunk:
+            if used >= sheet_rows:
+                sheets += 1
+                ws = new_sheet(wb, sheets)
+                used = 1
+            ws.append(row)
+            used += 1
+        total += len(chunk)
+        if progress is not None:
+            progress(len(chunk))
+    if not sheets:
+        new_sheet(wb, 1)
+    wb.save(fileobj)
+    return total
+
+
+def iter_xlsx(rows, chunk_rows=EXPORT_CHUNK_ROWS, progress=None):
+    """
+    寫入暫存檔後逐段產生 XLSX 內容（參數同 iter_csv）
+
+    Yields:
+        bytes: XLSX 檔案片段
+    """
+    with tempfile.SpooledTemporaryFile(max_size=XLSX_SPOOL_SIZE) as f:
+        write_xlsx(rows, f, chunk_rows, progress=progress)
+        f.seek(0)
+        while True:
+            data = f.read(XLSX_READ_SIZE)
+            if not data:
+                break
+            yield data
+
+
+def iter_export(fmt, rows, chunk_rows=EXPORT_CHUNK_ROWS, progress=None):
+    """依格式產生匯出內容（fmt 為 FORMATS 其中之一）"""
+    if fmt == FORMAT_XLSX:
+        return iter_xlsx(rows, chunk_rows, progress)
+    return iter_csv(rows, chunk_rows, progress)
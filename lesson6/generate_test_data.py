@@ -1,147 +1,363 @@
 """
 生成測試數據檔案
 同時建立 CSV 和 Excel 格式
+
+數據以固定大小的區塊產生並逐塊寫入，不論幾百萬筆，記憶體用量都維持固定：
+    CSV   - 每個區塊以 csv.writer.writerows 寫入
+    Excel - openpyxl 的 write_only 模式（邊寫邊存到暫存檔），
+            每個工作表最多 1,048,576 列，超過時自動分到下一個工作表
+
+訊號模型（多個裝置各自不同的參數）:
+    溫度 - 每日週期（下午最熱）+ 數天週期的天氣變化 + 雜訊
+    濕度 - 與溫度的日週期相反 + 天氣變化 + 雜訊
+    電燈 - 早上與傍晚到深夜開燈的作息，偶爾例外
+
+有安裝 numpy 時以向量化運算產生，否則使用純 Python 版本。
+兩種實作的亂數產生器不同，同一個 --seed 只有在同一種實作下才會產生相同的數據；
+numpy 不在專案的相依套件中（uv pip install numpy 後才會使用），
+需要在不同機器上重現同一份數據時請加上 --pure-python
+
+使用方式:
+    uv run python generate_test_data.py                                  # 50 筆，CSV + Excel
+    uv run python generate_test_data.py --rows 5000000 --devices 4 --interval 10 --format csv
+    uv run python generate_test_data.py --rows 3000000 --format xlsx --xlsx big.xlsx --seed 7
+    uv run python generate_test_data.py --seed 7 --pure-python                # 不論是否安裝 numpy 都相同
 """
 
+import argparse
 import csv
-from datetime import datetime, timedelta
+import math
 import random
+import time
+from datetime import datetime, timedelta
 
-# 嘗試導入 openpyxl（用於 Excel）
-try:
+from ring_buffer import TIMESTAMP_FORMAT
+from storage import CSV_FIELDNAMES
+from csv_tail import DEFAULT_DEVICE
+from excel_sheet import EXCEL_MAX_ROWS, HAS_OPENPYXL, new_sheet
+
+if HAS_OPENPYXL:
     from openpyxl import Workbook
-    HAS_OPENPYXL = True
-except ImportError:
-    HAS_OPENPYXL = False
+else:
     print("⚠️  未安裝 openpyxl，將只生成 CSV 檔案")
 
-def generate_test_data(count=50):
+# 嘗試導入 numpy（Raspberry Pi 上可能未安裝）
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+# 裝置名稱（超過時依序命名為 裝置7、裝置8 ...）
+DEVICE_NAMES = [DEFAULT_DEVICE, '臥室', '書房', '廚房', '浴室', '車庫']
+
+# 每個區塊幾個時間點（每個時間點每個裝置一筆）
+CHUNK_STEPS = 10_000
+
+DAY = 86400
+
+
+def device_names(count):
+    """前 count 個裝置名稱"""
+    return [DEVICE_NAMES[i] if i < len(DEVICE_NAMES) else f'裝置{i + 1}' for i in range(count)]
+
+
+def device_profiles(count, seed):
+    """
+    每個裝置的訊號參數（以種子決定）
+
+    Returns:
+        list: 每個裝置一個 dict
+    """
+    rng = random.Random(seed)
+    return [{
+        'base_temp': rng.uniform(23.0, 27.0),      # 平均溫度
+        'temp_swing': rng.uniform(1.5, 4.0),       # 日週期振幅
+        'peak_hour': rng.uniform(14.0, 16.0),      # 最熱的時刻
+        'base_humi': rng.uniform(55.0, 65.0),      # 平均濕度
+        'humi_swing': rng.uniform(4.0, 10.0),      # 日週期振幅（與溫度相反）
+        'weather_period': rng.uniform(3.0, 7.0) * DAY,  # 天氣變化週期
+        'weather_phase': rng.uniform(0.0, 2 * math.pi),
+        'weather_temp': rng.uniform(1.0, 3.0),
+        'weather_humi': rng.uniform(5.0, 12.0),
+        'morning_on': rng.uniform(6.0, 7.0),       # 早上開燈
+        'morning_off': rng.uniform(7.5, 8.5),
+        'evening_on': rng.uniform(17.5, 19.0),     # 傍晚開燈
+        'evening_off': rng.uniform(22.0, 24.0),    # 睡覺關燈
+        'exception': rng.uniform(0.03, 0.1),       # 不照作息的機率
+    } for _ in range(count)]
+
+
+def _chunks_numpy(steps, start, interval, profiles, names, seed, chunk_steps):
+    """numpy 向量化版本：每個區塊一次算出 (時間點 × 裝置) 的矩陣"""
+    rng = np.random.default_rng(seed)
+    offset = time.localtime(start).tm_gmtoff
+    base = np.datetime64(datetime.fromtimestamp(start).replace(microsecond=0), 's')
+    columns = {key: np.array([p[key] for p in profiles])[None, :] for key in profiles[0]}
+    count = len(profiles)
+
+    for first in range(0, steps, chunk_steps):
+        n = min(chunk_steps, steps - first)
+        offsets = (first + np.arange(n)) * interval
+        epoch = (start + offsets)[:, None]
+        hour = ((epoch + offset) % DAY) / 3600
+
+        daily = np.cos(2 * np.pi * (hour - columns['peak_hour']) / 24)
+        weather = np.sin(2 * np.pi * epoch / columns['weather_period'] + columns['weather_phase'])
+        temperature = (columns['base_temp'] + columns['temp_swing'] * daily + columns['weather_temp'] * weather
+                       + rng.normal(0.0, 0.2, (n, count)))
+        humidity = (columns['base_humi'] - columns['humi_swing'] * daily + columns['weather_humi'] * weather
+                    + rng.normal(0.0, 1.0, (n, count)))
+        humidity = np.clip(humidity, 5.0, 99.0)
+
+        scheduled = (((hour >= columns['morning_on']) & (hour < columns['morning_off']))
+                     | ((hour >= columns['evening_on']) & (hour < columns['evening_off'])))
+        light_on = scheduled ^ (rng.random((n, count)) < columns['exception'])
+
+        stamps = np.char.replace((base + offsets.astype('timedelta64[s]')).astype(str), 'T', ' ').tolist()
+        temperature = np.round(temperature, 2).tolist()
+        humidity = np.round(humidity, 2).tolist()
+        light_on = light_on.tolist()
+        yield [
+            (stamp, '開' if on[d] else '關', temps[d], humis[d], names[d])
+            for stamp, on, temps, humis in zip(stamps, light_on, temperature, humidity)
+            for d in range(count)
+        ]
+
+
+def _chunks_python(steps, start, interval, profiles, names, seed, chunk_steps):
+    """純 Python 版本（沒有 numpy 時使用，模型與 numpy 版本相同）"""
+    rng = random.Random(seed)
+    offset = time.localtime(start).tm_gmtoff
+    base = datetime.fromtimestamp(start).replace(microsecond=0)
+
+    for first in range(0, steps, chunk_steps):
+        rows = []
+        for step in range(first, min(first + chunk_steps, steps)):
+            epoch = start + step * interval
+            hour = ((epoch + offset) % DAY) / 3600
+            stamp = (base + timedelta(seconds=step * interval)).strftime(TIMESTAMP_FORMAT)
+            for p, name in zip(profiles, names):
+                daily = math.cos(2 * math.pi * (hour - p['peak_hour']) / 24)
+                weather = math.sin(2 * math.pi * epoch / p['weather_period'] + p['weather_phase'])
+                temperature = (p['base_temp'] + p['temp_swing'] * daily + p['weather_temp'] * weather
+                               + rng.gauss(0.0, 0.2))
+                humidity = (p['base_humi'] - p['humi_swing'] * daily + p['weather_humi'] * weather
+                            + rng.gauss(0.0, 1.0))
+                humidity = min(99.0, max(5.0, humidity))
+                scheduled = p['morning_on'] <= hour < p['morning_off'] or p['evening_on'] <= hour < p['evening_off']
+                light_on = scheduled != (rng.random() < p['exception'])
+                rows.append((stamp, '開' if light_on else '關', round(temperature, 2), round(humidity, 2), name))
+        yield rows
+
+
+def generate_chunks(rows, devices=1, interval=300, start=None, seed=0, chunk_steps=CHUNK_STEPS,
+                    use_numpy=None):
+    """
+    逐塊產生測試數據（依時間排序，同一個時間點每個裝置各一筆）
+
+    Args:
+        rows: 總筆數
+        devices: 裝置數量
+        interval: 每個時間點間隔幾秒
+        start: 第一筆的 epoch 秒數（預設讓最後一筆落在現在）
+        seed: 亂數種子
+        chunk_steps: 每個區塊幾個時間點
+        use_numpy: 是否使用 numpy 版本（預設有安裝就使用；兩種版本的數據不同）
+
+    Yields:
+        list: (時間戳記, 電燈狀態, 溫度, 濕度, 裝置) 的列表
     """
-    生成測試數據
-    
+    steps = -(-rows // devices)
+    if start is None:
+        start = time.time() - (steps - 1) * interval
+    start = int(start)
+    names = device_names(devices)
+    profiles = device_profiles(devices, seed)
+    if use_numpy is None:
+        use_numpy = HAS_NUMPY
+    make = _chunks_numpy if use_numpy else _chunks_python
+    remaining = rows
+    for chunk in make(steps, start, interval, profiles, names, seed, chunk_steps):
+        if len(chunk) > remaining:
+            chunk = chunk[:remaining]
+        remaining -= len(chunk)
+        yield chunk
+
+
+def generate_test_data(count=50, **kwargs):
+    """
+    生成測試數據（小量數據用；大量數據請使用 generate_chunks 逐塊處理）
+
     Args:
         count: 要生成的數據筆數
-        
+        **kwargs: 傳給 generate_chunks 的參數
+
     Returns:
         list: 包含測試數據的列表
     """
-    data = []
-    base_time = datetime.now() - timedelta(hours=count//2)  # 從幾小時前開始
-    
-    # 基礎溫度和濕度（會有變化）
-    base_temp = 25.0
-    base_humi = 60.0
-    
-    for i in range(count):
-        # 計算時間（每筆數據間隔幾分鐘）
-        timestamp = base_time + timedelta(minutes=i * 5)
-        timestamp_str = timestamp.strftime('%Y-%m-%d %H:%M:%S')
-        
-        # 生成溫度（帶有隨機波動）
-        temp_variation = random.uniform(-3, 3)
-        temperature = round(base_temp + temp_variation + (i % 10) * 0.5, 2)
-        
-        # 生成濕度（帶有隨機波動）
-        humi_variation = random.uniform(-5, 5)
-        humidity = round(base_humi + humi_variation + (i % 8) * 0.8, 2)
-        
-        # 電燈狀態（模擬白天關、晚上開）
-        hour = timestamp.hour
-        if 6 <= hour <= 18:
-            light_status = "關" if random.random() > 0.3 else "開"
-        else:
-            light_status = "開" if random.random() > 0.3 else "關"
-        
-        data.append({
-            '時間戳記': timestamp_str,
-            '電燈狀態': light_status,
-            '溫度': temperature,
-            '濕度': humidity
-        })
-    
-    return data
-
-def save_to_csv(data, filename='sensor_data.csv'):
-    """儲存為 CSV 檔案"""
+    return [
+        dict(zip(CSV_FIELDNAMES, row))
+        for chunk in generate_chunks(count, **kwargs)
+        for row in chunk
+    ]
+
+
+class RunningStats:
+    """逐塊累計的統計（不保留數據）"""
+
+    def __init__(self):
+        self.count = 0
+        self.lights_on = 0
+        self.first = None
+        self.last = None
+        self.temp = [math.inf, -math.inf]
+        self.humi = [math.inf, -math.inf]
+
+    def update(self, rows):
+        if not rows:
+            return
+        if self.first is None:
+            self.first = rows[0][0]
+        self.last = rows[-1][0]
+        self.count += len(rows)
+        for _, light, temperature, humidity, _ in rows:
+            if light == '開':
+                self.lights_on += 1
+            if temperature < self.temp[0]:
+                self.temp[0] = temperature
+            if temperature > self.temp[1]:
+                self.temp[1] = temperature
+            if humidity < self.humi[0]:
+                self.humi[0] = humidity
+            if humidity > self.humi[1]:
+                self.humi[1] = humidity
+
+
+def save_to_csv(chunks, filename='sensor_data.csv', stats=None):
+    """
+    逐塊儲存為 CSV 檔案
+
+    Args:
+        chunks: generate_chunks() 產生的區塊
+        filename: 輸出檔名
+        stats: RunningStats（可選，順便累計統計）
+
+    Returns:
+        int: 寫入筆數
+    """
+    total = 0
     with open(filename, 'w', newline='', encoding='utf-8') as f:
-        fieldnames = ['時間戳記', '電燈狀態', '溫度', '濕度']
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(data)
+        writer = csv.writer(f)
+        writer.writerow(CSV_FIELDNAMES)
+        for rows in chunks:
+            writer.writerows(rows)
+            total += len(rows)
+            if stats is not None:
+                stats.update(rows)
     print(f"✅ CSV 檔案已建立: {filename}")
-    print(f"   包含 {len(data)} 筆數據")
+    print(f"   包含 {total:,} 筆數據")
+    return total
 
-def save_to_excel(data, filename='sensor_data.xlsx'):
-    """儲存為 Excel 檔案"""
+
+def save_to_excel(chunks, filename='sensor_data.xlsx', sheet_rows=EXCEL_MAX_ROWS, stats=None):
+    """
+    逐塊儲存為 Excel 檔案（openpyxl write_only 模式）
+
+    Args:
+        chunks: generate_chunks() 產生的區塊
+        filename: 輸出檔名
+        sheet_rows: 每個工作表最多幾列（含標題列，上限 1,048,576）
+        stats: RunningStats（可選，順便累計統計）
+
+    Returns:
+        int: 寫入筆數
+    """
     if not HAS_OPENPYXL:
         print("❌ 無法建立 Excel 檔案（需要 openpyxl）")
-        return
-    
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "感測器數據"
-    
-    # 寫入標題
-    headers = ['時間戳記', '電燈狀態', '溫度', '濕度']
-    ws.append(headers)
-    
-    # 設定標題樣式
-    from openpyxl.styles import Font, PatternFill
-    for cell in ws[1]:
-        cell.font = Font(bold=True)
-        cell.fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-        cell.font = Font(color="FFFFFF", bold=True)
-    
-    # 寫入數據
-    for row in data:
-        ws.append([
-            row['時間戳記'],
-            row['電燈狀態'],
-            row['溫度'],
-            row['濕度']
-        ])
-    
-    # 調整欄寬
-    ws.column_dimensions['A'].width = 20
-    ws.column_dimensions['B'].width = 12
-    ws.column_dimensions['C'].width = 10
-    ws.column_dimensions['D'].width = 10
-    
+        return 0
+
+    sheet_rows = min(sheet_rows, EXCEL_MAX_ROWS)
+    wb = Workbook(write_only=True)
+    sheets = 0
+    used = sheet_rows
+    total = 0
+    for rows in chunks:
+        for row in rows:
+            if used >= sheet_rows:
+                sheets += 1
+                ws = new_sheet(wb, sheets)
+                used = 1
+            ws.append(row)
+            used += 1
+        total += len(rows)
+        if stats is not None:
+            stats.update(rows)
+    if not sheets:
+        new_sheet(wb, 1)
+        sheets = 1
+
     wb.save(filename)
     print(f"✅ Excel 檔案已建立: {filename}")
-    print(f"   包含 {len(data)} 筆數據")
+    print(f"   包含 {total:,} 筆數據（{sheets} 個工作表）")
+    return total
+
 
 def main():
     """主程式"""
+    parser = argparse.ArgumentParser(description='測試數據生成工具')
+    parser.add_argument('--rows', type=int, default=50, help='總筆數（預設 50）')
+    parser.add_argument('--devices', type=int, default=1, help='裝置數量（預設 1）')
+    parser.add_argument('--interval', type=float, default=300, help='每個時間點間隔秒數（預設 300）')
+    parser.add_argument('--start', help='第一筆的時間（YYYY-MM-DD HH:MM:SS，預設讓最後一筆落在現在）')
+    parser.add_argument('--seed', type=int, default=0, help='亂數種子（預設 0）')
+    parser.add_argument('--format', choices=['csv', 'xlsx', 'both'], default='both', help='輸出格式（預設 both）')
+    parser.add_argument('--csv', default='sensor_data.csv', help='CSV 檔名（預設 sensor_data.csv）')
+    parser.add_argument('--xlsx', default='sensor_data.xlsx', help='Excel 檔名（預設 sensor_data.xlsx）')
+    parser.add_argument('--sheet-rows', type=int, default=EXCEL_MAX_ROWS,
+                        help=f'每個工作表最多幾列（含標題列，預設 {EXCEL_MAX_ROWS:,}）')
+    parser.add_argument('--chunk', type=int, default=CHUNK_STEPS, help=f'每個區塊幾個時間點（預設 {CHUNK_STEPS:,}）')
+    parser.add_argument('--pure-python', action='store_true',
+                        help='不使用 numpy（同一個種子在任何機器上都產生相同數據）')
+    args = parser.parse_args()
+
     print("=" * 60)
     print(" 測試數據生成工具")
     print("=" * 60)
     print()
-    
-    # 生成測試數據
-    print("📊 生成測試數據...")
-    data = generate_test_data(count=50)
-    
-    # 顯示數據統計
-    temps = [d['溫度'] for d in data]
-    humis = [d['濕度'] for d in data]
-    lights_on = sum(1 for d in data if d['電燈狀態'] == '開')
-    
-    print(f"\n📈 數據統計:")
-    print(f"   總筆數: {len(data)}")
-    print(f"   時間範圍: {data[0]['時間戳記']} ~ {data[-1]['時間戳記']}")
-    print(f"   溫度範圍: {min(temps):.1f}°C ~ {max(temps):.1f}°C")
-    print(f"   濕度範圍: {min(humis):.1f}% ~ {max(humis):.1f}%")
-    print(f"   電燈開啟次數: {lights_on} / {len(data)} ({lights_on/len(data)*100:.1f}%)")
-    print()
-    
-    # 儲存檔案
+
+    start = None
+    if args.start:
+        start = datetime.strptime(args.start, TIMESTAMP_FORMAT).timestamp()
+    use_numpy = HAS_NUMPY and not args.pure_python
+    options = dict(devices=args.devices, interval=args.interval, start=start, seed=args.seed,
+                   chunk_steps=args.chunk, use_numpy=use_numpy)
+
+    print(f"📊 生成測試數據（{args.rows:,} 筆、{args.devices} 個裝置、"
+          f"{'numpy 向量化' if use_numpy else '純 Python'}、種子 {args.seed}）...")
+    if not HAS_NUMPY:
+        print("ℹ️  未安裝 numpy，使用純 Python 版本（同一個種子的數據與 numpy 版本不同）")
+    started = time.perf_counter()
+
+    # 兩種格式各自重新產生（同一個種子、同一種實作，內容相同），不需要保留數據
+    stats = RunningStats()
     print("💾 儲存檔案...")
-    save_to_csv(data, 'sensor_data.csv')
-    
-    if HAS_OPENPYXL:
-        save_to_excel(data, 'sensor_data.xlsx')
-    
+    if args.format in ('csv', 'both'):
+        save_to_csv(generate_chunks(args.rows, **options), args.csv, stats)
+    if args.format in ('xlsx', 'both') and HAS_OPENPYXL:
+        save_to_excel(generate_chunks(args.rows, **options), args.xlsx, args.sheet_rows,
+                      stats if stats.count == 0 else None)
+    elapsed = time.perf_counter() - started
+
+    if stats.count:
+        print(f"\n📈 數據統計:")
+        print(f"   總筆數: {stats.count:,}（{elapsed:.1f} 秒，每秒 {stats.count / elapsed:,.0f} 筆）")
+        print(f"   裝置: {', '.join(device_names(args.devices))}")
+        print(f"   時間範圍: {stats.first} ~ {stats.last}")
+        print(f"   溫度範圍: {stats.temp[0]:.1f}°C ~ {stats.temp[1]:.1f}°C")
+        print(f"   濕度範圍: {stats.humi[0]:.1f}% ~ {stats.humi[1]:.1f}%")
+        print(f"   電燈開啟次數: {stats.lights_on:,} / {stats.count:,} ({stats.lights_on / stats.count * 100:.1f}%)")
+
     print()
     print("=" * 60)
     print("✅ 完成！")
@@ -152,10 +368,11 @@ def main():
     print("   3. 或直接重新整理網頁")
     print()
     print("💡 提示:")
-    print("   - 修改腳本中的 count 參數可生成更多數據")
-    print("   - 兩個檔案的內容相同，僅格式不同")
+    print("   - --rows / --devices / --interval 可生成更多數據（例如 --rows 5000000 --devices 4）")
+    print("   - 這次產生的 CSV 與 Excel 內容相同，僅格式不同")
+    print("   - 同一個 --seed 只在同一種實作（numpy / 純 Python）下產生相同數據，")
+    print("     要在不同機器上重現請加上 --pure-python")
     print("=" * 60)
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,68 @@
+"""
+分級且限速的日誌設定
+每筆 MQTT 訊息都 print() 會讓 stdout 成為瓶頸；改用 logging 分級（逐筆訊息為 DEBUG），
+並以 RateLimitFilter 限制同一種訊息每秒最多輸出幾次，錯誤大量發生時也不會洗版
+"""
+
+import logging
+import threading
+import time
+
+LOG_FORMAT = '%(asctime)s %(levelname)-7s %(name)s: %(message)s'
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    依「logger 名稱 + 訊息樣板」限速（token bucket）
+
+    被略過的筆數會附加在下一次輸出的訊息後面
+
+    Args:
+        rate: 每秒補充幾次輸出額度
+        burst: 最多累積幾次額度
+    """
+
+    def __init__(self, rate=1.0, burst=5):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated, suppressed = self._buckets.get(key, (self.burst, now, 0))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now, suppressed + 1)
+                return False
+            self._buckets[key] = (tokens - 1, now, 0)
+            if len(self._buckets) > 1000:
+                self._buckets.clear()
+        if suppressed:
+            record.msg = f'{record.msg}（已略過 {suppressed} 筆相同訊息）'
+        return True
+
+
+def setup_logging(level='INFO', rate=1.0, burst=5):
+    """
+    設定根 logger：輸出到 stderr，並加上限速過濾器
+
+    Args:
+        level: 日誌等級（DEBUG / INFO / WARNING / ERROR）
+        rate / burst: RateLimitFilter 設定
+    """
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    handler.addFilter(RateLimitFilter(rate, burst))
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
+    return root
+
+
+def set_level(level):
+    """執行中調整日誌等級（例如暫時開啟 DEBUG 查看每筆訊息）"""
+    logging.getLogger().setLevel(level)
@@ -0,0 +1,185 @@
+"""
+將既有的 sensor_data.csv / sensor_data.xlsx 匯入 SQLite
+以串流方式讀取（CSV 逐列、Excel 使用 openpyxl 唯讀模式），
+每 batch 筆在一個交易中以 executemany 寫入，數百萬筆也不會佔用大量記憶體
+
+使用方式:
+    uv run python migrate_to_sqlite.py                           # 匯入 sensor_data.csv 與 sensor_data.xlsx
+    uv run python migrate_to_sqlite.py --csv data.csv --no-xlsx  # 只匯入指定的 CSV
+    uv run python migrate_to_sqlite.py --no-dedupe               # 不檢查重複（較快）
+"""
+
+import argparse
+import csv
+import os
+import time
+from datetime import datetime
+
+from ring_buffer import encode_light, parse_timestamp
+from storage import connect_sqlite, init_schema, INSERT_SQL, DEFAULT_DEVICE
+
+# 嘗試導入 openpyxl（用於 Excel）
+try:
+    from openpyxl import load_workbook
+    HAS_OPENPYXL = True
+except ImportError:
+    HAS_OPENPYXL = False
+
+# 同一裝置、同一時間的數據已存在時略過（CSV 與 Excel 通常是同一份數據）
+INSERT_DEDUPE_SQL = (
+    "INSERT INTO sensor_data (ts, device, light, temperature, humidity) "
+    "SELECT ?, ?, ?, ?, ? WHERE NOT EXISTS "
+    "(SELECT 1 FROM sensor_data WHERE device = ? AND ts = ?)"
+)
+
+
+def to_epoch(value):
+    """將 CSV 字串或 Excel 儲存格（datetime / 字串）轉為 epoch 秒數"""
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return parse_timestamp(str(value).strip())
+
+
+def iter_csv(path, device):
+    """逐列讀取 CSV，產生 (ts, device, light, temperature, humidity)"""
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        if not header:
+            return
+        i_ts = header.index('時間戳記')
+        i_light = header.index('電燈狀態')
+        i_temp = header.index('溫度')
+        i_humi = header.index('濕度')
+        # 舊版標題列沒有裝置欄位時，新數據的裝置在最後多出的一欄
+        i_dev = header.index('裝置') if '裝置' in header else len(header)
+        for fields in reader:
+            try:
+                yield (
+                    to_epoch(fields[i_ts]),
+                    fields[i_dev] if i_dev < len(fields) and fields[i_dev] else device,
+                    encode_light(fields[i_light]),
+                    float(fields[i_temp]),
+                    float(fields[i_humi]),
+                )
+            except (ValueError, IndexError):
+                continue
+
+
+def iter_xlsx(path, device):
+    """以 openpyxl 唯讀模式逐列讀取所有工作表，產生 (ts, device, light, temperature, humidity)"""
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for ws in wb.worksheets:
+            rows = ws.iter_rows(values_only=True)
+            header = next(rows, None)
+            if not header or '時間戳記' not in header:
+                continue
+            header = list(header)
+            i_ts = header.index('時間戳記')
+            i_light = header.index('電燈狀態')
+            i_temp = header.index('溫度')
+            i_humi = header.index('濕度')
+            i_dev = header.index('裝置') if '裝置' in header else None
+            for values in rows:
+                try:
+                    yield (
+                        to_epoch(values[i_ts]),
+                        values[i_dev] if i_dev is not None and values[i_dev] else device,
+                        encode_light(values[i_light]),
+                        float(values[i_temp]),
+                        float(values[i_humi]),
+                    )
+                except (ValueError, TypeError, IndexError):
+                    continue
+    finally:
+        wb.close()
+
+
+def import_rows(conn, rows, batch_size, dedupe):
+    """
+    分批匯入
+
+    Returns:
+        tuple: (讀取筆數, 實際寫入筆數)
+    """
+    read = written = 0
+    batch = []
+
+    def write(batch):
+        before = conn.total_changes
+        with conn:
+            if dedupe:
+                conn.executemany(INSERT_DEDUPE_SQL, (row + (row[1], row[0]) for row in batch))
+            else:
+                conn.executemany(INSERT_SQL, batch)
+        return conn.total_changes - before
+
+    for row in rows:
+        batch.append(row)
+        read += 1
+        if len(batch) >= batch_size:
+            written += write(batch)
+            batch = []
+            print(f"   已處理 {read:,} 筆...", end='\r')
+    if batch:
+        written += write(batch)
+    return read, written
+
+
+def main():
+    """主程式"""
+    parser = argparse.ArgumentParser(description='匯入 CSV / Excel 感測器數據到 SQLite')
+    parser.add_argument('--db', default='sensor_data.db', help='SQLite 資料庫（預設 sensor_data.db）')
+    parser.add_argument('--csv', default='sensor_data.csv', help='CSV 檔案（預設 sensor_data.csv）')
+    parser.add_argument('--xlsx', default='sensor_data.xlsx', help='Excel 檔案（預設 sensor_data.xlsx）')
+    parser.add_argument('--no-csv', action='store_true', help='不匯入 CSV')
+    parser.add_argument('--no-xlsx', action='store_true', help='不匯入 Excel')
+    parser.add_argument('--device', default=DEFAULT_DEVICE, help=f'檔案沒有裝置欄位時使用的名稱（預設 {DEFAULT_DEVICE}）')
+    parser.add_argument('--batch', type=int, default=50_000, help='每個交易寫入的筆數（預設 50000）')
+    parser.add_argument('--no-dedupe', action='store_true', help='不檢查重複數據（較快）')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(" 匯入感測器數據到 SQLite")
+    print("=" * 60)
+
+    conn = connect_sqlite(args.db)
+    init_schema(conn)
+    # 匯入期間不需要每個交易都寫回磁碟，結束後再 checkpoint
+    conn.execute('PRAGMA synchronous=OFF')
+
+    sources = []
+    if not args.no_csv:
+        sources.append(('CSV', args.csv, iter_csv))
+    if not args.no_xlsx:
+        if HAS_OPENPYXL:
+            sources.append(('Excel', args.xlsx, iter_xlsx))
+        else:
+            print("⚠️  未安裝 openpyxl，略過 Excel 檔案")
+
+    for label, path, reader in sources:
+        if not os.path.exists(path):
+            print(f"⚠️  找不到 {label} 檔案: {path}，略過")
+            continue
+        print(f"\n📂 匯入 {label}: {path}")
+        started = time.perf_counter()
+        read, written = import_rows(conn, reader(path, args.device), args.batch, not args.no_dedupe)
+        elapsed = time.perf_counter() - started
+        print(f"✅ 讀取 {read:,} 筆，寫入 {written:,} 筆"
+              f"（略過重複 {read - written:,} 筆），耗時 {elapsed:.1f} 秒"
+              f"，{read / max(elapsed, 1e-9):,.0f} 筆/秒")
+
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    total = conn.execute('SELECT COUNT(*) FROM sensor_data').fetchone()[0]
+    conn.close()
+
+    print()
+    print("=" * 60)
+    print(f"✅ 完成！資料庫 {args.db} 共 {total:,} 筆")
+    print("   將 app_flask.py 的 STORAGE_BACKEND 改為 'sqlite' 即可使用")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
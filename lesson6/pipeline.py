@@ -0,0 +1,290 @@
+"""
+MQTT 接收與處理分離的分段管線
+paho 的網路執行緒只把原始訊息放進有界佇列，由工作執行緒依序執行
+解析 → 儲存 → 推送 等階段，磁碟或 WebSocket 變慢時不會卡住 MQTT 迴圈
+
+佇列滿時的處理策略（背壓）:
+    drop_oldest - 丟棄佇列中最舊的訊息，放入新訊息（預設，儀表板以最新數據為主）
+    block       - 阻擋 MQTT 執行緒直到有空位（最多 block_timeout 秒，逾時則丟棄新訊息）
+    drop_new    - 直接丟棄新訊息
+所有丟棄都會計入 dropped 統計
+"""
+
+import cProfile
+import io
+import logging
+import pstats
+import random
+import threading
+import time
+from collections import deque
+
+BACKPRESSURE_DROP_OLDEST = 'drop_oldest'
+BACKPRESSURE_BLOCK = 'block'
+BACKPRESSURE_DROP_NEW = 'drop_new'
+BACKPRESSURE_POLICIES = (BACKPRESSURE_DROP_OLDEST, BACKPRESSURE_BLOCK, BACKPRESSURE_DROP_NEW)
+
+_STOP = object()
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyStats:
+    """單一階段的延遲統計（筆數、總和、最大值）"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'avg_ms': (self.total / self.count * 1000) if self.count else 0.0,
+            'max_ms': self.max * 1000,
+        }
+
+
+class IngestPipeline:
+    """
+    有界佇列加工作執行緒的分段管線
+
+    每個階段是 (名稱, 函式)，前一階段的回傳值是下一階段的輸入；
+    任一階段回傳 None 表示此訊息不需再往下處理（例如重複訊息）
+
+    workers 大於 1 時不同訊息可能以不同順序完成，
+    需要依序寫入（環形緩衝區、序號）的情況請維持 1 個工作執行緒
+
+    Args:
+        stages: [(名稱, 函式), ...]
+        maxsize: 佇列上限
+        workers: 工作執行緒數量
+        policy: 佇列滿時的策略（drop_oldest / block / drop_new）
+        block_timeout: block 策略最多等待幾秒，None 表示一直等
+        on_timing: 每筆訊息處理完後呼叫 on_timing(名稱, 秒數)，
+            名稱為各階段名稱或 'queue_wait'（供 Prometheus 分桶統計使用）
+    """
+
+    def __init__(self, stages, maxsize=10000, workers=1, policy=BACKPRESSURE_DROP_OLDEST,
+                 block_timeout=1.0, on_timing=None):
+        if policy not in BACKPRESSURE_POLICIES:
+            raise ValueError(f"未知的背壓策略: {policy}")
+        self.stages = list(stages)
+        self.maxsize = maxsize
+        self.workers = workers
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.on_timing = on_timing
+
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._threads = []
+        self._running = False
+
+        # 統計數據（在 _cond 保護下更新）
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self._queue_wait = LatencyStats()
+        self._stage_latency = {name: LatencyStats() for name, _ in self.stages}
+
+        # 抽樣 cProfile（執行中開關）
+        self._profiler = None
+        self._profile_rate = 0.0
+        self._profile_lock = threading.Lock()
+        self._profiled = 0
+
+    def start(self):
+        """啟動工作執行緒"""
+        self._running = True
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f'ingest-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def submit(self, item):
+        """
+        放入一筆原始訊息（由 MQTT 執行緒呼叫）
+
+        Returns:
+            bool: 是否成功放入（False 表示依背壓策略丟棄了這筆）
+        """
+        entry = (time.perf_counter(), item)
+        with self._cond:
+            if len(self._items) >= self.maxsize:
+                if self.policy == BACKPRESSURE_DROP_OLDEST:
+                    self._items.popleft()
+                    self.dropped += 1
+                elif self.policy == BACKPRESSURE_DROP_NEW:
+                    self.dropped += 1
+                    return False
+                else:
+                    deadline = None if self.block_timeout is None else time.monotonic() + self.block_timeout
+                    while len(self._items) >= self.maxsize and self._running:
+                        remaining = None if deadline is None else deadline - time.monotonic()
+                        if remaining is not None and remaining <= 0:
+                            self.dropped += 1
+                            return False
+                        self._cond.wait(remaining)
+            self._items.append(entry)
+            self.enqueued += 1
+            if len(self._items) > self.max_depth:
+                self.max_depth = len(self._items)
+            self._cond.notify_all()
+        return True
+
+    def stop(self, timeout=10):
+        """處理完佇列中剩餘的訊息後停止工作執行緒"""
+        if not self._running:
+            return
+        with self._cond:
+            for _ in self._threads:
+                self._items.append((None, _STOP))
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._running = False
+        self._threads = []
+
+    @property
+    def profiling(self):
+        """是否正在抽樣分析"""
+        return self._profiler is not None
+
+    def start_profile(self, sample_rate=0.1):
+        """
+        開始以 cProfile 抽樣分析工作執行緒
+
+        Args:
+            sample_rate: 分析的訊息比例（0~1），只有被抽中的訊息會在 profiler 下執行
+        """
+        with self._profile_lock:
+            self._profiler = cProfile.Profile()
+            self._profile_rate = max(0.0, min(1.0, sample_rate))
+            self._profiled = 0
+
+    def stop_profile(self, limit=30, sort='cumulative'):
+        """
+        停止抽樣分析
+
+        Returns:
+            str: pstats 報表（依 sort 排序的前 limit 個函式），沒有在分析時回傳 None
+        """
+        with self._profile_lock:
+            profiler, self._profiler = self._profiler, None
+            profiled = self._profiled
+        if profiler is None:
+            return None
+        out = io.StringIO()
+        out.write(f"抽樣比例 {self._profile_rate:.0%}，共分析 {profiled} 筆訊息\n\n")
+        if profiled:
+            pstats.Stats(profiler, stream=out).sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+    def depth(self):
+        """目前佇列長度"""
+        return len(self._items)
+
+    def stats(self):
+        """
+        取得管線統計
+
+        Returns:
+            dict: 佇列長度、進出筆數、丟棄與失敗筆數、排隊時間與各階段延遲
+        """
+        with self._cond:
+            return {
+                'policy': self.policy,
+                'depth': len(self._items),
+                'max_depth': self.max_depth,
+                'capacity': self.maxsize,
+                'enqueued': self.enqueued,
+                'processed': self.processed,
+                'failed': self.failed,
+                'dropped': self.dropped,
+                'queue_wait': self._queue_wait.as_dict(),
+                'stages': {name: stats.as_dict() for name, stats in self._stage_latency.items()},
+            }
+
+    def _worker(self):
+        """工作執行緒：取出訊息並依序執行各階段"""
+        while True:
+            with self._cond:
+                while not self._items:
+                    self._cond.wait()
+                enqueued_at, item = self._items.popleft()
+                # 通知 block 策略下等待空位的 MQTT 執行緒
+                self._cond.notify_all()
+            if item is _STOP:
+                return
+
+            started = time.perf_counter()
+            profiler = self._sample_profiler()
+            if profiler is not None:
+                profiler.enable()
+                try:
+                    ok, timings = self._run_stages(item)
+                finally:
+                    profiler.disable()
+                    self._profile_lock.release()
+            else:
+                ok, timings = self._run_stages(item)
+
+            with self._cond:
+                self._queue_wait.add(started - enqueued_at)
+                for name, seconds in timings:
+                    self._stage_latency[name].add(seconds)
+                if ok:
+                    self.processed += 1
+                else:
+                    self.failed += 1
+
+            if self.on_timing is not None:
+                self.on_timing('queue_wait', started - enqueued_at)
+                for name, seconds in timings:
+                    self.on_timing(name, seconds)
+
+    def _run_stages(self, item):
+        """
+        依序執行各階段
+
+        Returns:
+            tuple: (是否成功, [(階段名稱, 秒數), ...])
+        """
+        timings = []
+        value = item
+        for name, func in self.stages:
+            stage_started = time.perf_counter()
+            try:
+                value = func(value)
+            except Exception as e:
+                logger.warning("處理訊息錯誤（%s）: %s", name, e)
+                return False, timings + [(name, time.perf_counter() - stage_started)]
+            timings.append((name, time.perf_counter() - stage_started))
+            if value is None:
+                break
+        return True, timings
+
+    def _sample_profiler(self):
+        """
+        決定這筆訊息是否要分析；要分析時回傳 profiler 並持有 _profile_lock
+        （同一個 cProfile.Profile 一次只能在一個執行緒中啟用）
+        """
+        if self._profiler is None or random.random() >= self._profile_rate:
+            return None
+        if not self._profile_lock.acquire(blocking=False):
+            return None
+        if self._profiler is None:
+            self._profile_lock.release()
+            return None
+        self._profiled += 1
+        return self._profiler
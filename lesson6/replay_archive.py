@@ -0,0 +1,274 @@
+"""
+歸檔重播工具
+把 sensor_data.csv / sensor_data.xlsx / sensor_data.db 的數據依原本的時間間隔重新發布到 MQTT，
+每個裝置發布到自己的主題 <裝置>/感測器，可用來重現事件、回歸測試接收吞吐量與警報規則
+
+    - 逐列讀取（CSV 逐列、Excel 唯讀模式、SQLite 分批 fetchmany），大檔案也不會整個載入記憶體
+    - --speed 1 為實際速度、--speed 60 為 60 倍速、--speed 0 為全速發布
+    - --jitter 在每則訊息的發送時間加上隨機延遲（固定 --seed 時結果可重現）
+    - 每則訊息帶各裝置從 1 開始的 seq 與每次執行不同的 session，伺服器可依序號統計缺號與重複
+      （/api/latest 的 sequence），再次重播時依 session 改變重新計算，不會被當成重送
+    - 結束時輸出實際達到的發布速率與最大落後時間
+
+使用方式:
+    uv run python replay_archive.py sensor_data.csv                     # 實際速度
+    uv run python replay_archive.py sensor_data.xlsx --speed 60         # 60 倍速
+    uv run python replay_archive.py sensor_data.db --speed 0 --qos 1    # 全速（吞吐量測試）
+    uv run python replay_archive.py sensor_data.csv --device 客廳 --from "2025-01-01" --max-gap 60
+    uv run python replay_archive.py sensor_data.csv --speed 0 --dry-run # 不連線，只量測讀取速度
+"""
+
+import argparse
+import json
+import os
+import random
+import time
+from datetime import datetime
+
+import paho.mqtt.client as mqtt
+
+from migrate_to_sqlite import iter_csv, iter_xlsx, HAS_OPENPYXL
+from ring_buffer import decode_light
+from storage import connect_sqlite, DEFAULT_DEVICE
+
+# MQTT 設定（與 app_flask.py 相同）
+BROKER = "localhost"
+PORT = 1883
+TOPIC_FORMAT = "{device}/感測器"
+
+# 每幾秒輸出一次進度
+PROGRESS_INTERVAL = 5.0
+# SQLite 每次讀取的筆數
+FETCH_SIZE = 5000
+
+
+def iter_sqlite(path):
+    """依時間順序分批讀取 SQLite，產生 (ts, device, light, temperature, humidity)"""
+    conn = connect_sqlite(path, readonly=True)
+    try:
+        cursor = conn.execute('SELECT ts, device, light, temperature, humidity FROM sensor_data ORDER BY ts')
+        while True:
+            rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        conn.close()
+
+
+def iter_archive(path, default_device=DEFAULT_DEVICE):
+    """
+    依副檔名選擇讀取方式
+
+    Yields:
+        tuple: (epoch 秒數, 裝置, 電燈狀態編碼, 溫度, 濕度)
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.xlsx':
+        if not HAS_OPENPYXL:
+            raise SystemExit("❌ 讀取 Excel 需要 openpyxl")
+        return iter_xlsx(path, default_device)
+    if ext in ('.db', '.sqlite', '.sqlite3'):
+        return iter_sqlite(path)
+    return iter_csv(path, default_device)
+
+
+def select_rows(rows, start=None, end=None, device=None, limit=None):
+    """依時間範圍、裝置與筆數篩選"""
+    count = 0
+    for row in rows:
+        ts = row[0]
+        if start is not None and ts < start:
+            continue
+        if end is not None and ts > end:
+            continue
+        if device is not None and row[1] != device:
+            continue
+        yield row
+        count += 1
+        if limit is not None and count >= limit:
+            break
+
+
+class Schedule:
+    """
+    把數據時間換算為發送時間
+
+    Args:
+        speed: 倍速（0 為全速，不等待）
+        max_gap: 數據時間相鄰兩筆最多間隔幾秒（壓縮長時間沒有數據的空檔，None 為不壓縮）
+        jitter: 每則訊息額外延遲 0~jitter 秒（實際時間）
+        seed: jitter 的亂數種子
+    """
+
+    def __init__(self, speed=1.0, max_gap=None, jitter=0.0, seed=0):
+        self.speed = speed
+        self.max_gap = max_gap
+        self.jitter = jitter
+        self.rng = random.Random(seed)
+        self.started = None
+        self.elapsed = 0.0     # 已經過的數據時間（壓縮空檔後）
+        self.last_ts = None
+        self.max_lag = 0.0
+
+    def wait(self, ts):
+        """等到這筆數據的發送時間"""
+        if self.started is None:
+            self.started = time.perf_counter()
+        if self.last_ts is not None:
+            gap = max(0.0, ts - self.last_ts)
+            if self.max_gap is not None:
+                gap = min(gap, self.max_gap)
+            self.elapsed += gap
+        self.last_ts = ts
+        if not self.speed:
+            return
+        target = self.started + self.elapsed / self.speed
+        if self.jitter:
+            target += self.rng.uniform(0, self.jitter)
+        delay = target - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            self.max_lag = max(self.max_lag, -delay)
+
+
+def make_payload(ts, light, temperature, humidity, seq, session=None):
+    """與 lesson7/main.py 相同欄位的 JSON，另帶原始時間、序號與 session"""
+    data = {
+        'temperature': round(temperature, 2),
+        'humidity': round(humidity, 2),
+        'light_status': decode_light(light),
+        'timestamp': datetime.fromtimestamp(ts).isoformat(),
+    }
+    if seq is not None:
+        data['seq'] = seq
+        if session is not None:
+            data['session'] = session
+    return json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+
+def replay(rows, client, schedule, qos=0, with_seq=True):
+    """
+    依排程發布
+
+    Args:
+        client: paho MQTT 客戶端（None 為不發布，只量測讀取與排程）
+
+    Returns:
+        dict: 發布筆數、bytes、裝置數、耗時與最後一則訊息（結束前等待送出用）
+    """
+    seqs = {}
+    session = int(time.time())
+    info = None
+    published = sent_bytes = 0
+    started = time.perf_counter()
+    next_report = started + PROGRESS_INTERVAL
+    for ts, device, light, temperature, humidity in rows:
+        schedule.wait(ts)
+        seq = seqs[device] = seqs.get(device, 0) + 1
+        payload = make_payload(ts, light, temperature, humidity, seq if with_seq else None, session)
+        if client is not None:
+            info = client.publish(TOPIC_FORMAT.format(device=device), payload, qos=qos)
+        published += 1
+        sent_bytes += len(payload)
+        now = time.perf_counter()
+        if now >= next_report:
+            print(f"   已發布 {published:,} 筆，{published / (now - started):,.0f} 筆/秒，"
+                  f"數據時間 {datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S')}", end='\r')
+            next_report = now + PROGRESS_INTERVAL
+    return {
+        'published': published,
+        'bytes': sent_bytes,
+        'devices': len(seqs),
+        'seconds': time.perf_counter() - started,
+        'last': info,
+    }
+
+
+def parse_time(value):
+    """--from / --to：'YYYY-MM-DD HH:MM:SS'、'YYYY-MM-DD' 或 epoch 秒數"""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value.replace('T', ' ')).timestamp()
+
+
+def main():
+    """主程式"""
+    parser = argparse.ArgumentParser(description='把歸檔數據重新發布到 MQTT')
+    parser.add_argument('archive', nargs='?', default='sensor_data.csv',
+                        help='歸檔檔案：.csv / .xlsx / .db（預設 sensor_data.csv）')
+    parser.add_argument('--speed', type=float, default=1.0, help='倍速，0 為全速（預設 1，實際速度）')
+    parser.add_argument('--max-gap', type=float, help='數據間隔超過幾秒時壓縮為這個秒數（跳過長時間的空檔）')
+    parser.add_argument('--jitter', type=float, default=0.0, help='每則訊息額外延遲 0~N 秒（預設 0）')
+    parser.add_argument('--seed', type=int, default=0, help='jitter 的亂數種子（預設 0）')
+    parser.add_argument('--from', dest='start', help='起始時間（YYYY-MM-DD HH:MM:SS）')
+    parser.add_argument('--to', dest='end', help='結束時間（YYYY-MM-DD HH:MM:SS）')
+    parser.add_argument('--device', help='只重播這個裝置')
+    parser.add_argument('--default-device', default=DEFAULT_DEVICE,
+                        help=f'檔案沒有裝置欄位時使用的名稱（預設 {DEFAULT_DEVICE}）')
+    parser.add_argument('--limit', type=int, help='最多重播幾筆')
+    parser.add_argument('--qos', type=int, choices=[0, 1], default=0, help='MQTT QoS（預設 0）')
+    parser.add_argument('--no-seq', action='store_true', help='不帶 seq 欄位')
+    parser.add_argument('--broker', default=BROKER, help=f'MQTT Broker（預設 {BROKER}）')
+    parser.add_argument('--port', type=int, default=PORT, help=f'MQTT 連接埠（預設 {PORT}）')
+    parser.add_argument('--dry-run', action='store_true', help='不連線 MQTT，只讀取與排程')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(" 歸檔重播")
+    print("=" * 60)
+    if not os.path.exists(args.archive):
+        print(f"❌ 找不到檔案: {args.archive}")
+        return
+    speed = '全速' if not args.speed else f'{args.speed:g} 倍速'
+    print(f" 檔案: {args.archive}（{os.path.getsize(args.archive) / 1024 / 1024:.1f} MB）")
+    print(f" 速度: {speed}，jitter {args.jitter:g} 秒，QoS {args.qos}"
+          + (f"，空檔最多 {args.max_gap:g} 秒" if args.max_gap is not None else ""))
+
+    client = None
+    if not args.dry_run:
+        client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION2)
+        client.max_queued_messages_set(0)
+        client.max_inflight_messages_set(1000)
+        try:
+            client.connect(args.broker, args.port, 60)
+        except OSError as e:
+            print(f"❌ 無法連接 MQTT Broker {args.broker}:{args.port}: {e}")
+            return
+        client.loop_start()
+        print(f" MQTT Broker: {args.broker}:{args.port}")
+    print("=" * 60)
+
+    rows = select_rows(iter_archive(args.archive, args.default_device),
+                       parse_time(args.start), parse_time(args.end), args.device, args.limit)
+    schedule = Schedule(args.speed, args.max_gap, args.jitter, args.seed)
+    try:
+        result = replay(rows, client, schedule, args.qos, not args.no_seq)
+        # 全速發布時訊息可能還在 paho 的佇列中，等最後一則送出（QoS 1 為收到 PUBACK）再計算耗時
+        if result['last'] is not None:
+            result['last'].wait_for_publish(timeout=60)
+            result['seconds'] = time.perf_counter() - schedule.started
+    except KeyboardInterrupt:
+        print("\n⚠️  已中斷")
+        return
+    finally:
+        if client is not None:
+            client.disconnect()
+            client.loop_stop()
+
+    seconds = max(result['seconds'], 1e-9)
+    print(" " * 70, end='\r')
+    print(f"✅ 已發布 {result['published']:,} 筆（{result['devices']} 個裝置），"
+          f"{result['bytes'] / 1024:,.0f} KB，耗時 {seconds:.1f} 秒")
+    print(f"   實際速率 {result['published'] / seconds:,.0f} 筆/秒"
+          + (f"，目標 {result['published'] / max(schedule.elapsed / args.speed, 1e-9):,.0f} 筆/秒"
+             f"，最大落後 {schedule.max_lag:.2f} 秒" if args.speed else ""))
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
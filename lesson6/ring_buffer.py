@@ -0,0 +1,346 @@
+"""
+固定容量的欄式環形緩衝區
+以 array 模組的型別陣列儲存時間戳記、溫度、濕度與電燈狀態，
+每筆約 17 bytes，append 為 O(1)；讀取時在鎖內以 array 切片複製需要的範圍
+（只複製一次，之後的寫入不會改到已取出的數據）
+"""
+
+import math
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+
+# 電燈狀態編碼
+LIGHT_UNKNOWN = -1
+LIGHT_OFF = 0
+LIGHT_ON = 1
+
+_LIGHT_CODES = {
+    '開': LIGHT_ON, 'on': LIGHT_ON, 'ON': LIGHT_ON, 'On': LIGHT_ON, True: LIGHT_ON, 1: LIGHT_ON,
+    '關': LIGHT_OFF, 'off': LIGHT_OFF, 'OFF': LIGHT_OFF, 'Off': LIGHT_OFF, False: LIGHT_OFF, 0: LIGHT_OFF,
+}
+_LIGHT_NAMES = {LIGHT_ON: '開', LIGHT_OFF: '關', LIGHT_UNKNOWN: '未知'}
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def encode_light(status):
+    """將電燈狀態（開/關/on/off/1/0）轉為數字編碼"""
+    try:
+        return _LIGHT_CODES.get(status, LIGHT_UNKNOWN)
+    except TypeError:
+        return LIGHT_UNKNOWN
+
+
+def decode_light(code):
+    """將數字編碼轉回電燈狀態文字"""
+    return _LIGHT_NAMES.get(code, '未知')
+
+
+def format_timestamp(ts):
+    """將 epoch 秒數轉為 'YYYY-MM-DD HH:MM:SS' 字串"""
+    return datetime.fromtimestamp(ts).strftime(TIMESTAMP_FORMAT)
+
+
+def make_record(timestamp, temperature, humidity, light):
+    """將一筆數值數據轉為 API 使用的 dict"""
+    return {
+        'timestamp': format_timestamp(timestamp),
+        'light_status': decode_light(light),
+        'temperature': round(temperature, 2),
+        'humidity': round(humidity, 2),
+    }
+
+
+# 以「YYYY-MM-DD HH」為鍵快取整點的 epoch 秒數，避免每列都呼叫 strptime
+_hour_cache = {}
+
+
+def parse_timestamp(text):
+    """
+    將 'YYYY-MM-DD HH:MM:SS' 字串轉為 epoch 秒數（本地時間）
+
+    同一小時內的時間戳記只需做一次 strptime，其餘只做整數運算
+    """
+    hour_key = text[:13]
+    base = _hour_cache.get(hour_key)
+    if base is None:
+        base = datetime.strptime(hour_key, '%Y-%m-%d %H').timestamp()
+        if len(_hour_cache) > 10000:
+            _hour_cache.clear()
+        _hour_cache[hour_key] = base
+    if len(text) != 19 or text[13] != ':' or text[16] != ':':
+        raise ValueError(f"時間格式錯誤: {text}")
+    return base + int(text[14:16]) * 60 + int(text[17:19])
+
+
+class SensorRingBuffer:
+    """
+    欄式環形緩衝區
+
+    Args:
+        capacity: 最多保留幾筆（超過時覆蓋最舊的數據）
+    """
+
+    def __init__(self, capacity):
+        if capacity <= 0:
+            raise ValueError("capacity 必須大於 0")
+        self.capacity = capacity
+        self.timestamps = array('d', bytes(8 * capacity))
+        self.temperatures = array('f', bytes(4 * capacity))
+        self.humidities = array('f', bytes(4 * capacity))
+        self.lights = array('b', bytes(capacity))
+        self._total = 0
+        # 時間順序：多個裝置合併時，裝置補傳的舊數據會晚於其他裝置較新的數據寫入
+        self._max_timestamp = None     # 寫入過的最大時間戳記
+        self._evicted_max = None       # 已被覆蓋的數據中最大的時間戳記
+        self._unordered_at = None      # 最後一筆比前一筆早的數據的位置（累計筆數，從 0 開始）
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return min(self._total, self.capacity)
+
+    @property
+    def total(self):
+        """累計寫入筆數（包含已被覆蓋的數據）"""
+        return self._total
+
+    @property
+    def nbytes(self):
+        """緩衝區佔用的記憶體大小（bytes）"""
+        return sum(col.itemsize * len(col) for col in
+                   (self.timestamps, self.temperatures, self.humidities, self.lights))
+
+    def append(self, timestamp, temperature, humidity, light):
+        """
+        新增一筆數據，O(1)
+
+        Args:
+            timestamp: epoch 秒數
+            temperature: 溫度
+            humidity: 濕度
+            light: 電燈狀態編碼（LIGHT_ON / LIGHT_OFF / LIGHT_UNKNOWN）
+
+        Returns:
+            int: 這筆數據的序號（從 1 開始的累計筆數）
+        """
+        with self._lock:
+            total = self._total
+            i = total % self.capacity
+            if total >= self.capacity:
+                evicted = self.timestamps[i]
+                if self._evicted_max is None or evicted > self._evicted_max:
+                    self._evicted_max = evicted
+            if self._max_timestamp is None or timestamp >= self._max_timestamp:
+                self._max_timestamp = timestamp
+            elif timestamp < self.timestamps[(total - 1) % self.capacity]:
+                self._unordered_at = total
+            self.timestamps[i] = timestamp
+            self.temperatures[i] = temperature
+            self.humidities[i] = humidity
+            self.lights[i] = light
+            self._total += 1
+            return self._total
+
+    def _bounds(self, n=None):
+        """
+        最近 n 筆數據在陣列中的位置（呼叫端必須持有 self._lock）
+
+        環形緩衝區繞回時，最近 n 筆可能分成前後兩段
+
+        Returns:
+            list: 由舊到新排列的 (起點, 終點) 列表
+        """
+        size = min(self._total, self.capacity)
+        if n is None or n > size:
+            n = size
+        if n <= 0:
+            return []
+        end = self._total % self.capacity
+        start = (end - n) % self.capacity
+        if start < end:
+            return [(start, start + n)]
+        return [(lo, hi) for lo, hi in ((start, self.capacity), (0, end)) if hi > lo]
+
+    def _segments(self, n=None):
+        """segments() 的本體（呼叫端必須持有 self._lock）"""
+        columns = (self.timestamps, self.temperatures, self.humidities, self.lights)
+        return [tuple(col[lo:hi] for col in columns) for lo, hi in self._bounds(n)]
+
+    def segments(self, n=None):
+        """
+        取得最近 n 筆數據（在鎖內複製，之後的 append 不會覆蓋取出的內容）
+
+        環形緩衝區繞回時，最近 n 筆可能分成前後兩段，
+        因此回傳由舊到新排列的區段列表，每段為
+        (timestamps, temperatures, humidities, lights) 四個 array
+
+        Args:
+            n: 筆數，None 表示全部
+        """
+        with self._lock:
+            return self._segments(n)
+
+    @property
+    def ordered(self):
+        """緩衝區內的時間戳記是否遞增（比前一筆早的數據已被覆蓋時恢復為 True）"""
+        unordered_at = self._unordered_at
+        return unordered_at is None or unordered_at <= self._total - self.capacity
+
+    def columns(self, start=None, end=None):
+        """
+        取得時間範圍內的數據，複製成連續的陣列（供降採樣等向量運算使用）
+
+        時間戳記遞增時以二分搜尋找出範圍；有裝置補傳的舊數據夾在較新的數據之後時，
+        改為逐筆篩選並依時間排序（補傳的數據被覆蓋後自動回到二分搜尋）
+
+        Args:
+            start: 起始 epoch 秒數（含），None 表示不限
+            end: 結束 epoch 秒數（含），None 表示不限
+
+        Returns:
+            tuple: (timestamps, temperatures, humidities, lights) 四個 array
+        """
+        result = (array('d'), array('f'), array('f'), array('b'))
+        with self._lock:
+            if self.ordered:
+                # 二分搜尋找出範圍後只複製範圍內的數據
+                ts = self.timestamps
+                for lo, hi in self._bounds():
+                    if start is not None:
+                        lo = bisect_left(ts, start, lo, hi)
+                    if end is not None:
+                        hi = bisect_right(ts, end, lo, hi)
+                    if lo >= hi:
+                        continue
+                    for column, source in zip(result, (ts, self.temperatures, self.humidities, self.lights)):
+                        column.extend(source[lo:hi])
+                return result
+            segments = self._segments()
+        rows = []
+        for segment in segments:
+            rows.extend(row for row in zip(*segment)
+                        if (start is None or row[0] >= start) and (end is None or row[0] <= end))
+        rows.sort(key=lambda row: row[0])
+        for column, values in zip(result, zip(*rows)):
+            column.extend(values)
+        return result
+
+    def oldest_timestamp(self):
+        """最舊一筆數據的時間戳記，緩衝區為空時回傳 None"""
+        with self._lock:
+            return self._oldest_timestamp()
+
+    def _oldest_timestamp(self):
+        """oldest_timestamp() 的本體（呼叫端必須持有 self._lock）"""
+        if self._total == 0:
+            return None
+        return self.timestamps[self._total % self.capacity if self._total >= self.capacity else 0]
+
+    def complete_since(self):
+        """
+        記憶體中保有完整數據的起點：時間戳記不早於此值的數據都還在緩衝區內
+
+        被覆蓋的數據可能比最舊一筆還新（裝置補傳的數據寫入得較晚），因此取兩者較晚的一個
+
+        Returns:
+            float: epoch 秒數，緩衝區為空時回傳 None
+        """
+        with self._lock:
+            oldest = self._oldest_timestamp()
+            evicted = self._evicted_max
+        if oldest is None or evicted is None or evicted < oldest:
+            return oldest
+        return math.nextafter(evicted, math.inf)
+
+    def max_timestamp(self):
+        """寫入過的最大時間戳記（不一定是最後寫入的一筆），尚無數據時回傳 None"""
+        return self._max_timestamp
+
+    def latest_timestamp(self):
+        """最後寫入的一筆數據的時間戳記，緩衝區為空時回傳 None"""
+        with self._lock:
+            if self._total == 0:
+                return None
+            return self.timestamps[(self._total - 1) % self.capacity]
+
+    def records(self, n=None):
+        """
+        取得最近 n 筆數據（dict 列表，供 JSON 輸出）
+
+        Args:
+            n: 筆數，None 表示全部
+        """
+        return self._records(self.segments(n))
+
+    @staticmethod
+    def _records(segments):
+        """將 segments() 取出的區段轉為 dict 列表"""
+        result = []
+        for ts, temps, humis, lights in segments:
+            result.extend(map(make_record, ts, temps, humis, lights))
+        return result
+
+    def since(self, seq):
+        """
+        取得序號大於 seq 的數據（供斷線重連的客戶端補上漏掉的數據）
+
+        Returns:
+            list: (序號, dict) 的列表；需要的數據已被覆蓋時回傳 None
+        """
+        # 累計筆數與數據在同一次持有鎖時取得，期間寫入的數據不會讓序號錯位
+        with self._lock:
+            total = self._total
+            missing = total - seq
+            if missing < 0 or missing > min(total, self.capacity):
+                return None
+            segments = self._segments(missing)
+        records = self._records(segments)
+        first = total - len(records) + 1
+        return list(zip(range(first, total + 1), records))
+
+    def latest(self):
+        """取得最新一筆數據（dict），緩衝區為空時回傳 None"""
+        records = self.records(1)
+        return records[0] if records else None
+
+    # dump_state() / restore_state() 保存的時間順序欄位
+    ORDER_FIELDS = ('max_timestamp', 'evicted_max', 'unordered_at')
+
+    def dump_state(self):
+        """
+        複製整個緩衝區的原始內容（供 checkpoint.py 寫入檢查點）
+
+        Returns:
+            tuple: (累計筆數, 四個欄位依序串接的 bytes（依記憶體中的位置排列，未繞回）, {時間順序欄位: 值})
+        """
+        with self._lock:
+            data = b''.join(col.tobytes() for col in
+                            (self.timestamps, self.temperatures, self.humidities, self.lights))
+            return self._total, data, {key: getattr(self, '_' + key) for key in self.ORDER_FIELDS}
+
+    def restore_state(self, total, data, order=None):
+        """
+        還原 dump_state() 的內容（容量必須相同）
+
+        Args:
+            total: 累計筆數
+            data: 四個欄位串接的 bytes-like（可以是 mmap 的 memoryview，直接複製到陣列中）
+            order: 時間順序欄位（舊版檢查點沒有：當時寫入的時間戳記一律遞增）
+        """
+        data = memoryview(data).cast('B')
+        if len(data) != self.nbytes:
+            raise ValueError(f"數據大小 {len(data)} 與緩衝區容量不符（需要 {self.nbytes} bytes）")
+        with self._lock:
+            offset = 0
+            for col in (self.timestamps, self.temperatures, self.humidities, self.lights):
+                size = col.itemsize * len(col)
+                memoryview(col).cast('B')[:] = data[offset:offset + size]
+                offset += size
+            self._total = total
+            if order is None:
+                latest = self.timestamps[(total - 1) % self.capacity] if total else None
+                order = {'max_timestamp': latest, 'evicted_max': None, 'unordered_at': None}
+            for key in self.ORDER_FIELDS:
+                setattr(self, '_' + key, order[key])
@@ -0,0 +1,341 @@
+"""
+跨程序共用的環形緩衝區（mmap 檔案）
+多程序部署時只有接收程序寫入，多個唯讀的網頁工作程序各自 mmap 同一個檔案讀取，
+不需要 Redis 等外部服務，資料也不經過序列化
+
+檔案配置（位元組順序與執行環境相同）:
+    檔頭 64 bytes : MAGIC | 版本 | 容量 | 裝置上限 | 旗標 | seqlock 計數 | 累計筆數 | 寫入端識別碼
+    裝置表        : 每個裝置 80 bytes（名稱 UTF-8 64 bytes、最新一筆的序號、訊息數）
+    數據欄位      : 時間戳記 'd'、溫度 'f'、濕度 'f'、裝置編號 'H'、電燈 'b'，各 capacity 筆
+
+seqlock：寫入端在修改前把計數加 1（奇數表示寫入中），寫完再加 1（偶數）；
+讀取端讀取前後各看一次計數，相同且為偶數才表示讀到一致的檔頭，否則重讀。
+讀取端從不取得鎖，寫入端永遠不會等待讀取端
+
+數據欄位不在 seqlock 內複製（一次複製數百筆時重試機率太高），改為複製完再讀一次累計筆數，
+複製期間已被覆蓋的最舊幾筆直接捨棄；CPython 沒有記憶體屏障，
+這裡依賴 seqlock 計數的前後檢查，對監控數據而言足夠
+"""
+
+import mmap
+import os
+import struct
+import threading
+import time
+import uuid
+
+from ring_buffer import make_record
+
+MAGIC = b'SRNG'
+VERSION = 1
+
+# 檔頭：MAGIC、版本、容量、裝置上限、旗標、seqlock 計數、累計筆數、寫入端識別碼
+_HEADER = struct.Struct('<4sIIII4xQQ16s')
+HEADER_SIZE = 64
+_SEQ_OFFSET = 24       # seqlock 計數與累計筆數的位置（uint64 × 2）
+
+# 裝置表：名稱、最新一筆的序號（從 1 開始的累計筆數，0 表示沒有數據）、訊息數
+DEVICE_NAME_SIZE = 64
+_DEVICE = struct.Struct(f'<{DEVICE_NAME_SIZE}sQQ')
+
+# 旗標
+FLAG_MQTT_CONNECTED = 1
+
+# 讀取端等待寫入完成時最多重試幾次（每次讓出 CPU），超過時回傳最後讀到的值
+READ_RETRIES = 1000
+
+
+def _layout(capacity, max_devices):
+    """各欄位的 (位置, 型別)，以及檔案總大小"""
+    offset = HEADER_SIZE + _DEVICE.size * max_devices
+    columns = {}
+    for name, code, size in (('timestamps', 'd', 8), ('temperatures', 'f', 4), ('humidities', 'f', 4),
+                             ('devices', 'H', 2), ('lights', 'b', 1)):
+        columns[name] = (offset, code)
+        offset += size * capacity
+    return columns, offset
+
+
+class SharedRingBuffer:
+    """
+    mmap 檔案上的欄式環形緩衝區（單一寫入端、多個讀取端）
+
+    以 create() 建立（接收程序）或 open() 開啟（工作程序），不直接呼叫建構子
+
+    Args:
+        mm: mmap 物件
+        writable: 是否為寫入端
+    """
+
+    def __init__(self, mm, writable):
+        self._mm = mm
+        self.writable = writable
+        magic, version, capacity, max_devices, _, _, _, writer_id = _HEADER.unpack_from(mm)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("不是共用環形緩衝區檔案")
+        self.capacity = capacity
+        self.max_devices = max_devices
+        self.writer_id = writer_id.hex()
+        view = memoryview(mm)
+        self._view = view
+        self._counters = view[_SEQ_OFFSET:_SEQ_OFFSET + 16].cast('Q')     # [seqlock 計數, 累計筆數]
+        self._flags = view[16:20].cast('I')
+        columns, _ = _layout(capacity, max_devices)
+        size = {'d': 8, 'f': 4, 'H': 2, 'b': 1}
+        for name, (offset, code) in columns.items():
+            setattr(self, name, view[offset:offset + size[code] * capacity].cast(code))
+        # 裝置名稱只在第一次出現時寫入，之後不會改變，讀取端可以快取
+        self._device_ids = {}
+        self._device_names = []
+        # 只在寫入端程序內使用（MQTT 執行緒與接收工作執行緒可能同時寫入），讀取端不會取得
+        self._write_lock = threading.Lock()
+
+    @classmethod
+    def create(cls, path, capacity, max_devices=256):
+        """
+        建立（或覆蓋）共用檔案並以寫入端開啟
+
+        先寫到暫存檔再 rename，工作程序不會開到一半初始化的檔案
+        """
+        _, size = _layout(capacity, max_devices)
+        temp_path = path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.truncate(size)
+            f.write(_HEADER.pack(MAGIC, VERSION, capacity, max_devices, 0, 0, 0, uuid.uuid4().bytes))
+        os.replace(temp_path, path)
+        with open(path, 'r+b') as f:
+            mm = mmap.mmap(f.fileno(), size)
+        return cls(mm, writable=True)
+
+    @classmethod
+    def open(cls, path, wait=0.0):
+        """
+        以唯讀方式開啟（工作程序）
+
+        Args:
+            wait: 檔案還不存在時最多等待幾秒（接收程序可能還在啟動）
+        """
+        deadline = time.monotonic() + wait
+        while not os.path.exists(path):
+            if time.monotonic() >= deadline:
+                raise FileNotFoundError(path)
+            time.sleep(0.1)
+        with open(path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(mm, writable=False)
+
+    def close(self):
+        for name in ('_counters', '_flags', 'timestamps', 'temperatures', 'humidities', 'devices', 'lights',
+                     '_view'):
+            getattr(self, name).release()
+        self._mm.close()
+
+    # ===== 寫入端 =====
+
+    def _device_id(self, name):
+        """（持有寫入鎖時呼叫）裝置編號，第一次出現時寫入裝置表；超過上限時回傳 None"""
+        index = self._device_ids.get(name)
+        if index is not None:
+            return index
+        index = len(self._device_names)
+        if index >= self.max_devices:
+            return None
+        encoded = name.encode('utf-8')[:DEVICE_NAME_SIZE]
+        self._counters[0] += 1
+        _DEVICE.pack_into(self._mm, HEADER_SIZE + _DEVICE.size * index, encoded, 0, 0)
+        self._counters[0] += 1
+        self._device_ids[name] = index
+        self._device_names.append(name)
+        return index
+
+    def append(self, timestamp, temperature, humidity, light, device):
+        """
+        新增一筆數據，O(1)（只能由寫入端呼叫）
+
+        Returns:
+            int: 這筆數據的序號（從 1 開始的累計筆數）；裝置數已達上限時回傳 None
+        """
+        with self._write_lock:
+            index = self._device_id(device)
+            if index is None:
+                return None
+            counters = self._counters
+            total = counters[1]
+            i = total % self.capacity
+            counters[0] += 1
+            self.timestamps[i] = timestamp
+            self.temperatures[i] = temperature
+            self.humidities[i] = humidity
+            self.devices[i] = index
+            self.lights[i] = light
+            total += 1
+            counters[1] = total
+            offset = HEADER_SIZE + _DEVICE.size * index + DEVICE_NAME_SIZE
+            _, messages = struct.unpack_from('<QQ', self._mm, offset)
+            struct.pack_into('<QQ', self._mm, offset, total, messages + 1)
+            counters[0] += 1
+            return total
+
+    def set_flag(self, flag, on):
+        """設定旗標（例如 MQTT 連線狀態）"""
+        with self._write_lock:
+            self._counters[0] += 1
+            self._flags[0] = self._flags[0] | flag if on else self._flags[0] & ~flag
+            self._counters[0] += 1
+
+    # ===== 讀取端（不取得鎖，寫入中時重讀） =====
+
+    def _stable(self, read):
+        """在 seqlock 保護下呼叫 read()，回傳一致的結果"""
+        counters = self._counters
+        for attempt in range(READ_RETRIES):
+            before = counters[0]
+            if not before & 1:
+                value = read()
+                if counters[0] == before:
+                    return value
+            if attempt:
+                time.sleep(0)
+        return read()
+
+    @property
+    def total(self):
+        """累計寫入筆數（包含已被覆蓋的數據）"""
+        return self._counters[1]
+
+    def __len__(self):
+        return min(self.total, self.capacity)
+
+    def flag(self, flag):
+        return bool(self._flags[0] & flag)
+
+    def device_names(self):
+        """已登錄的裝置名稱（依登錄順序）"""
+        count = self._stable(self._count_devices)
+        while len(self._device_names) < count:
+            index = len(self._device_names)
+            raw = _DEVICE.unpack_from(self._mm, HEADER_SIZE + _DEVICE.size * index)[0]
+            name = raw.rstrip(b'\0').decode('utf-8', 'replace')
+            self._device_ids[name] = index
+            self._device_names.append(name)
+        return list(self._device_names[:count])
+
+    def _count_devices(self):
+        """裝置表中已使用的項目數（名稱不是空的）"""
+        count = len(self._device_names)
+        while count < self.max_devices:
+            if self._mm[HEADER_SIZE + _DEVICE.size * count] == 0:
+                break
+            count += 1
+        return count
+
+    def device_info(self, name):
+        """
+        裝置的最新序號與訊息數
+
+        Returns:
+            tuple: (最新一筆的序號, 訊息數)；裝置不存在時回傳 None
+        """
+        index = self._device_ids.get(name)
+        if index is None:
+            self.device_names()
+            index = self._device_ids.get(name)
+            if index is None:
+                return None
+        offset = HEADER_SIZE + _DEVICE.size * index + DEVICE_NAME_SIZE
+        return self._stable(lambda: struct.unpack_from('<QQ', self._mm, offset))
+
+    def _copy(self, first, end, device_index=None):
+        """
+        複製序號 first+1 ~ end 的數據（0 起算的 first 到 end - 1），捨棄複製期間被覆蓋的部分
+
+        Returns:
+            list: (序號, 時間戳記, 溫度, 濕度, 電燈, 裝置編號) 由舊到新
+        """
+        capacity = self.capacity
+        rows = []
+        position = first
+        while position < end:
+            lo = position % capacity
+            hi = min(capacity, lo + end - position)
+            columns = (self.timestamps[lo:hi].tolist(), self.temperatures[lo:hi].tolist(),
+                       self.humidities[lo:hi].tolist(), self.lights[lo:hi].tolist(),
+                       self.devices[lo:hi].tolist())
+            rows.extend(zip(range(position + 1, position + 1 + hi - lo), *columns))
+            position += hi - lo
+        # 寫入端在複製期間前進了多少：序號 <= 最新累計筆數 + 1 - capacity 的位置可能已被覆蓋
+        valid_from = self._stable(lambda: self._counters[1]) + 1 - capacity
+        if rows and rows[0][0] <= valid_from:
+            rows = [row for row in rows if row[0] > valid_from]
+        if device_index is not None:
+            rows = [row for row in rows if row[5] == device_index]
+        return rows
+
+    def rows(self, n=None):
+        """
+        最近 n 筆數據
+
+        Returns:
+            list: (序號, 時間戳記, 溫度, 濕度, 電燈, 裝置名稱) 由舊到新
+        """
+        total = self._stable(lambda: self._counters[1])
+        size = min(total, self.capacity)
+        if n is None or n > size:
+            n = size
+        return self._with_names(self._copy(total - n, total))
+
+    def _with_names(self, rows):
+        """將 _copy() 結果中的裝置編號換成裝置名稱"""
+        names = self.device_names()
+        return [(seq, ts, temp, humi, light, names[dev] if dev < len(names) else None)
+                for seq, ts, temp, humi, light, dev in rows]
+
+    def device_rows(self, device, n):
+        """
+        指定裝置最近 n 筆數據（由最新往回分段掃描裝置欄位，直到湊滿 n 筆或到達最舊的數據）
+        """
+        info = self.device_info(device)
+        if info is None or not info[0]:
+            return []
+        index = self._device_ids[device]
+        end = info[0]
+        oldest = max(0, self._stable(lambda: self._counters[1]) - self.capacity)
+        chunk = max(n * 4, 256)
+        result = []
+        while end > oldest and len(result) < n:
+            first = max(oldest, end - chunk)
+            result[:0] = self._copy(first, end, index)
+            end = first
+            chunk *= 2
+        return [row[:5] + (device,) for row in result[-n:]] if n else []
+
+    def records(self, n=None):
+        """最近 n 筆數據（dict 列表，與 SensorRingBuffer.records 相同格式）"""
+        return [make_record(ts, temp, humi, light) for _, ts, temp, humi, light, _ in self.rows(n)]
+
+    def device_records(self, device, n):
+        """指定裝置最近 n 筆數據（dict 列表）"""
+        return [make_record(ts, temp, humi, light) for _, ts, temp, humi, light, _ in self.device_rows(device, n)]
+
+    def latest(self, device=None):
+        """最新一筆數據（dict），沒有數據時回傳 None"""
+        rows = self.rows(1) if device is None else self.device_rows(device, 1)
+        return make_record(*rows[-1][1:5]) if rows else None
+
+    def since(self, seq):
+        """
+        序號大於 seq 的數據（供工作程序推送增量與斷線重連補送）
+
+        Returns:
+            list: (序號, 時間戳記, 溫度, 濕度, 電燈, 裝置名稱)；需要的數據已被覆蓋時回傳 None
+        """
+        total = self._stable(lambda: self._counters[1])
+        missing = total - seq
+        if missing < 0 or missing > min(total, self.capacity):
+            return None
+        # 以同一個 total 複製 seq+1 ~ total，期間新寫入的數據留給下一次；
+        # 開頭不是 seq+1 表示複製期間被覆蓋了
+        rows = self._copy(seq, total)
+        if missing and (not rows or rows[0][0] != seq + 1):
+            return None
+        return self._with_names(rows)
@@ -0,0 +1,169 @@
+"""
+輪詢 API 的不可變快照
+資料改變時（接收管線處理完一則訊息、MQTT 連線狀態改變）呼叫 publish() 把版本加 1；
+每個查詢（例如 /api/latest、/api/history?limit=100）在同一個版本只組成並序列化一次 JSON，
+之後的請求直接回傳同一份 bytes，因此 N 個輪詢中的分頁每筆新數據只花一次序列化成本
+
+    - ETag 為「啟動識別碼-版本」，客戶端帶 If-None-Match 且版本沒變時回傳 304（不傳內容）
+    - 客戶端接受 gzip 時回傳壓縮後的內容（每個版本只壓縮一次）
+    - 快照建立後不再修改，多個執行緒可同時讀取
+"""
+
+import gzip
+import json
+import threading
+import uuid
+from collections import OrderedDict
+
+# 小於這個大小的內容不壓縮（壓縮後幾乎不會變小）
+GZIP_MIN_SIZE = 1024
+GZIP_LEVEL = 6
+
+
+def default_dumps(value):
+    """與 Flask jsonify 相同的輸出（鍵排序、緊湊格式）"""
+    return json.dumps(value, sort_keys=True, separators=(',', ':'))
+
+
+class Snapshot:
+    """
+    某個版本的序列化結果（建立後不再修改）
+
+    Args:
+        version: 資料版本
+        body: UTF-8 JSON
+        etag: ETag（含引號）
+    """
+
+    __slots__ = ('version', 'body', 'etag', '_gzipped')
+
+    def __init__(self, version, body, etag):
+        self.version = version
+        self.body = body
+        self.etag = etag
+        self._gzipped = None
+
+    def gzipped(self):
+        """gzip 壓縮後的內容（第一次需要時才壓縮，之後重複使用）"""
+        data = self._gzipped
+        if data is None:
+            data = self._gzipped = gzip.compress(self.body, GZIP_LEVEL, mtime=0)
+        return data
+
+
+class SnapshotCache:
+    """
+    依版本快取序列化後的 JSON（LRU，總大小上限 max_bytes）
+
+    Args:
+        max_entries: 最多保留幾個查詢的快照
+        max_bytes: 快照內容的總大小上限
+        dumps: 序列化函式（預設與 jsonify 相同格式）
+    """
+
+    def __init__(self, max_entries=64, max_bytes=64 * 1024 * 1024, dumps=default_dumps):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.dumps = dumps
+        self.instance = uuid.uuid4().hex[:8]
+        self.version = 0
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._build_locks = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.builds = 0
+
+    def publish(self):
+        """資料已改變：版本加 1，之後的請求會重新建立快照"""
+        with self._lock:
+            self.version += 1
+
+    def get(self, key, build):
+        """
+        取得目前版本的快照，還沒有時呼叫 build() 組成資料並序列化
+
+        同一個查詢同時只有一個執行緒在建立，其他執行緒等待後直接使用結果
+
+        Args:
+            key: 查詢鍵（例如 ('history', device, limit)）
+            build: 無參數函式，回傳要序列化的資料
+
+        Returns:
+            Snapshot: 快照
+        """
+        with self._lock:
+            snapshot = self._lookup(key, self.version)
+            if snapshot is not None:
+                return snapshot
+            build_lock = self._build_locks.setdefault(key, threading.Lock())
+
+        with build_lock:
+            # 先讀版本再組資料：組資料期間有新數據時，下一個請求會看到新版本而重新建立
+            with self._lock:
+                version = self.version
+                snapshot = self._lookup(key, version)
+                if snapshot is not None:
+                    return snapshot
+            body = self.dumps(build()).encode('utf-8')
+            snapshot = Snapshot(version, body, f'"{self.instance}-{version}"')
+            with self._lock:
+                self.builds += 1
+                self._store(key, snapshot)
+        return snapshot
+
+    def _lookup(self, key, version):
+        """（持有鎖時呼叫）版本相同的快照"""
+        snapshot = self._entries.get(key)
+        if snapshot is not None and snapshot.version == version:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return snapshot
+        return None
+
+    def _store(self, key, snapshot):
+        """（持有鎖時呼叫）保存快照，超過數量或大小上限時移除最久沒用的"""
+        old = self._entries.get(key)
+        if old is not None:
+            if old.version > snapshot.version:
+                return
+            self.nbytes -= len(old.body)
+        self._entries[key] = snapshot
+        self._entries.move_to_end(key)
+        self.nbytes += len(snapshot.body)
+        while len(self._entries) > 1 and (len(self._entries) > self.max_entries or self.nbytes > self.max_bytes):
+            evicted_key, evicted = self._entries.popitem(last=False)
+            self._build_locks.pop(evicted_key, None)
+            self.nbytes -= len(evicted.body)
+
+    def stats(self):
+        return {
+            'version': self.version,
+            'entries': len(self._entries),
+            'bytes': self.nbytes,
+            'hits': self.hits,
+            'builds': self.builds,
+        }
+
+
+def snapshot_response(snapshot, request, response_class):
+    """
+    把快照轉為 HTTP 回應（支援 If-None-Match 與 gzip）
+
+    Args:
+        snapshot: Snapshot
+        request: Flask request
+        response_class: Flask Response 類別
+    """
+    headers = {
+        'ETag': snapshot.etag,
+        'Cache-Control': 'no-cache',      # 瀏覽器可保存，但每次都要以 ETag 向伺服器確認
+        'Vary': 'Accept-Encoding',
+    }
+    if snapshot.etag in request.headers.get('If-None-Match', ''):
+        return response_class(status=304, headers=headers)
+    body = snapshot.body
+    if len(body) >= GZIP_MIN_SIZE and 'gzip' in request.accept_encodings:
+        body = snapshot.gzipped()
+        headers['Content-Encoding'] = 'gzip'
+    return response_class(body, content_type='application/json', headers=headers)
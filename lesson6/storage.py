@@ -0,0 +1,405 @@
+"""
+感測器數據儲存後端
+StorageBackend 定義寫入、歷史查詢與統計的共同介面，目前有兩種實作：
+    CSVStorage    - 原本的 sensor_data.csv 歸檔（批次寫入 + 稀疏時間索引）
+    SQLiteStorage - 內嵌 SQLite（WAL 模式、交易批次寫入、時間與裝置索引）
+"""
+
+import os
+import sqlite3
+import threading
+
+from csv_writer import BatchCSVWriter, BatchWriter, FSYNC_NONE, FSYNC_BATCH, FSYNC_INTERVAL
+from csv_index import SparseTimeIndex, DEFAULT_BUCKET_SECONDS
+from csv_tail import read_header, read_tail_rows, DEVICE_COLUMN, DEFAULT_DEVICE
+from ring_buffer import encode_light, format_timestamp, LIGHT_ON
+
+CSV_FIELDNAMES = ['時間戳記', '電燈狀態', '溫度', '濕度', DEVICE_COLUMN]
+
+BACKEND_CSV = 'csv'
+BACKEND_SQLITE = 'sqlite'
+
+
+class StorageBackend:
+    """
+    儲存後端介面
+
+    查詢結果一律為 (epoch 秒數, 溫度, 濕度, 電燈狀態編碼) 的 tuple，由舊到新排列
+    """
+
+    name = 'base'
+
+    def open(self):
+        """開啟儲存並啟動背景寫入"""
+        return self
+
+    def close(self):
+        """寫入剩餘數據並關閉"""
+
+    def flush(self, timeout=None):
+        """等待目前佇列中的數據寫入完成"""
+
+    def append(self, timestamp, light_status, temperature, humidity, device=DEFAULT_DEVICE):
+        """
+        新增一筆數據（放入批次寫入佇列，立即返回）
+
+        Args:
+            timestamp: epoch 秒數
+            light_status: 電燈狀態文字（開/關）
+            temperature: 溫度
+            humidity: 濕度
+            device: 裝置名稱
+        """
+        raise NotImplementedError
+
+    def tail(self, n, with_device=False):
+        """
+        取得最後 n 筆數據（啟動時載入記憶體用）
+
+        Args:
+            n: 筆數
+            with_device: 是否在每筆數據最後附上裝置名稱
+        """
+        raise NotImplementedError
+
+    def iter_range(self, start=None, end=None, limit=None, device=None, with_device=False):
+        """
+        逐筆讀取時間範圍內的數據（start、end 皆包含，None 表示不限）
+
+        Args:
+            with_device: 是否在每筆數據最後附上裝置名稱
+        """
+        raise NotImplementedError
+
+    def query(self, start=None, end=None, limit=None, device=None):
+        """取得時間範圍內的數據列表"""
+        return list(self.iter_range(start, end, limit, device))
+
+    def aggregate(self, start=None, end=None, device=None):
+        """
+        統計時間範圍內的數據
+
+        預設實作逐筆掃描；支援查詢的後端（例如 SQLite）應覆寫成由引擎計算
+
+        Returns:
+            dict: 筆數、溫濕度的最小/最大/平均值與開燈比例
+        """
+        count = light_on = 0
+        t_sum = h_sum = 0.0
+        t_min = h_min = float('inf')
+        t_max = h_max = float('-inf')
+        for _, temperature, humidity, light in self.iter_range(start, end, None, device):
+            count += 1
+            t_sum += temperature
+            h_sum += humidity
+            t_min = min(t_min, temperature)
+            t_max = max(t_max, temperature)
+            h_min = min(h_min, humidity)
+            h_max = max(h_max, humidity)
+            light_on += light == LIGHT_ON
+        if not count:
+            return summary_dict(0, None, None, None, None, None, None, None)
+        return summary_dict(count, t_min, t_max, t_sum / count, h_min, h_max, h_sum / count, light_on / count)
+
+    def stats(self):
+        """寫入統計"""
+        return {}
+
+
+def summary_dict(count, t_min, t_max, t_avg, h_min, h_max, h_avg, light_ratio):
+    """組成 aggregate() 的回傳格式"""
+    def r(value):
+        return None if value is None else round(value, 2)
+    return {
+        'count': count,
+        'temperature': {'min': r(t_min), 'max': r(t_max), 'avg': r(t_avg)},
+        'humidity': {'min': r(h_min), 'max': r(h_max), 'avg': r(h_avg)},
+        'light_on_ratio': None if light_ratio is None else round(light_ratio, 4),
+    }
+
+
+class CSVStorage(StorageBackend):
+    """
+    CSV 歸檔儲存（原本的 sensor_data.csv 格式）
+
+    Args:
+        path: CSV 檔案路徑
+        batch_size / flush_interval / fsync_policy / fsync_interval: 批次寫入設定
+        bucket_seconds: 稀疏時間索引的區間秒數
+    """
+
+    name = BACKEND_CSV
+
+    def __init__(self, path, batch_size=200, flush_interval=1.0, fsync_policy=FSYNC_INTERVAL,
+                 fsync_interval=5.0, bucket_seconds=DEFAULT_BUCKET_SECONDS):
+        self.path = path
+        self.index = SparseTimeIndex(path, bucket_seconds=bucket_seconds)
+        self.writer = BatchCSVWriter(
+            path,
+            CSV_FIELDNAMES,
+            batch_size=batch_size,
+            flush_interval=flush_interval,
+            fsync_policy=fsync_policy,
+            fsync_interval=fsync_interval,
+            on_flush=self.index.on_flush,
+        )
+
+    def open(self):
+        self._match_header()
+        # 索引必須在寫入器開始寫入前開啟（之後寫入的列由寫入器回報）
+        self.index.open()
+        self.writer.start()
+        return self
+
+    def close(self):
+        self.writer.close()
+        self.index.close()
+
+    def flush(self, timeout=None):
+        return self.writer.flush(timeout)
+
+    def append(self, timestamp, light_status, temperature, humidity, device=DEFAULT_DEVICE):
+        self.writer.write({
+            '時間戳記': format_timestamp(timestamp),
+            '電燈狀態': light_status,
+            '溫度': temperature,
+            '濕度': humidity,
+            DEVICE_COLUMN: device
+        })
+
+    def tail(self, n, with_device=False):
+        if not os.path.exists(self.path):
+            return []
+        return read_tail_rows(self.path, n, with_device=with_device)
+
+    def iter_range(self, start=None, end=None, limit=None, device=None, with_device=False):
+        return self.index.iter_range(start, end, limit, device, with_device)
+
+    def _match_header(self):
+        """
+        舊版 CSV（標題列沒有裝置欄位）不改寫檔案：依原本的欄位順序追加，裝置寫在最後多出的一欄
+
+        讀取時沒有裝置欄位的標題列以最後多出的一欄作為裝置（舊數據沒有這一欄，視為 DEFAULT_DEVICE），
+        啟動時間因此與歸檔大小無關，位元組位置不變，索引檔也不必重建
+        """
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return
+        header = read_header(self.path)
+        if DEVICE_COLUMN in header or not set(CSV_FIELDNAMES[:-1]) <= set(header):
+            return
+        self.writer.fieldnames = header + [DEVICE_COLUMN]
+        print(f"ℹ️  {self.path} 的標題列沒有「{DEVICE_COLUMN}」欄位：裝置寫在最後一欄，舊數據視為 {DEFAULT_DEVICE}")
+
+    def stats(self):
+        return self.writer.stats()
+
+
+# SQLite 資料表：時間為 epoch 秒數，電燈狀態存編碼（-1 未知 / 0 關 / 1 開）
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sensor_data (
+    id          INTEGER PRIMARY KEY,
+    ts          REAL    NOT NULL,
+    device      TEXT    NOT NULL,
+    light       INTEGER NOT NULL,
+    temperature REAL    NOT NULL,
+    humidity    REAL    NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sensor_data_ts ON sensor_data (ts);
+CREATE INDEX IF NOT EXISTS idx_sensor_data_device_ts ON sensor_data (device, ts);
+"""
+
+INSERT_SQL = "INSERT INTO sensor_data (ts, device, light, temperature, humidity) VALUES (?, ?, ?, ?, ?)"
+
+# fsync 策略對應的 PRAGMA synchronous（WAL 模式下）
+#   none     - OFF：不主動 fsync，交給作業系統
+#   batch    - FULL：每個交易提交時都 fsync
+#   interval - NORMAL：只在 checkpoint 時 fsync（SQLite 自行決定時機，fsync_interval 不適用）
+SQLITE_SYNCHRONOUS = {
+    FSYNC_NONE: 'OFF',
+    FSYNC_BATCH: 'FULL',
+    FSYNC_INTERVAL: 'NORMAL',
+}
+
+
+def connect_sqlite(path, readonly=False, synchronous='NORMAL'):
+    """
+    開啟 SQLite 連線並設定 WAL 模式
+
+    WAL 讓讀取者與寫入者互不阻擋；synchronous=NORMAL 在 WAL 下只在 checkpoint 時 fsync
+    """
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute(f'PRAGMA synchronous={synchronous}')
+    if readonly:
+        conn.execute('PRAGMA query_only=1')
+    return conn
+
+
+def init_schema(conn):
+    """建立資料表與索引（已存在時略過）"""
+    conn.executescript(SCHEMA)
+    conn.commit()
+
+
+class SQLiteBatchWriter(BatchWriter):
+    """以交易批次寫入 SQLite 的背景寫入器"""
+
+    def __init__(self, path, batch_size=200, flush_interval=1.0, report_interval=60, synchronous='NORMAL'):
+        super().__init__(batch_size, flush_interval, report_interval, name='SQLite 寫入器')
+        self.path = path
+        self.synchronous = synchronous
+        self._conn = None
+
+    def _open(self):
+        self._conn = connect_sqlite(self.path, synchronous=self.synchronous)
+        init_schema(self._conn)
+
+    def _write_batch(self, batch):
+        # 一個批次一個交易
+        with self._conn:
+            self._conn.executemany(INSERT_SQL, batch)
+
+    def _close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class SQLiteStorage(StorageBackend):
+    """
+    內嵌 SQLite 儲存
+
+    Args:
+        path: 資料庫檔案路徑
+        batch_size / flush_interval: 批次寫入設定
+        fsync_policy: fsync 策略，對應到 PRAGMA synchronous（見 SQLITE_SYNCHRONOUS）
+    """
+
+    name = BACKEND_SQLITE
+
+    # 逐筆讀取時每次從游標取出的筆數
+    FETCH_SIZE = 5000
+
+    def __init__(self, path, batch_size=200, flush_interval=1.0, fsync_policy=FSYNC_INTERVAL):
+        if fsync_policy not in SQLITE_SYNCHRONOUS:
+            raise ValueError(f"未知的 fsync 策略: {fsync_policy}")
+        self.path = path
+        self.writer = SQLiteBatchWriter(path, batch_size=batch_size, flush_interval=flush_interval,
+                                        synchronous=SQLITE_SYNCHRONOUS[fsync_policy])
+        self._local = threading.local()
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+    def open(self):
+        self._ensure_schema()
+        self.writer.start()
+        return self
+
+    def _ensure_schema(self):
+        """
+        建立資料表（只做一次）
+
+        讀取可能早於寫入執行緒啟動（啟動時載入歷史、寫入器開始前就到達的查詢），
+        因此不依賴寫入器的 _open，在第一次讀取或 open() 時同步建立
+        """
+        if self._schema_ready:
+            return
+        with self._schema_lock:
+            if self._schema_ready:
+                return
+            conn = connect_sqlite(self.path)
+            try:
+                init_schema(conn)
+            finally:
+                conn.close()
+            self._schema_ready = True
+
+    def close(self):
+        self.writer.close()
+
+    def flush(self, timeout=None):
+        return self.writer.flush(timeout)
+
+    def append(self, timestamp, light_status, temperature, humidity, device=DEFAULT_DEVICE):
+        self.writer.write((timestamp, device, encode_light(light_status), temperature, humidity))
+
+    def _reader(self):
+        """每個執行緒各自一條唯讀連線（WAL 模式下讀取不會被寫入阻擋）"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            self._ensure_schema()
+            conn = connect_sqlite(self.path, readonly=True)
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _where(start, end, device):
+        """組合 WHERE 條件與參數"""
+        clauses, params = [], []
+        if device is not None:
+            clauses.append('device = ?')
+            params.append(device)
+        if start is not None:
+            clauses.append('ts >= ?')
+            params.append(start)
+        if end is not None:
+            clauses.append('ts <= ?')
+            params.append(end)
+        return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+    def tail(self, n, with_device=False):
+        columns = 'ts, temperature, humidity, light, device' if with_device else 'ts, temperature, humidity, light'
+        rows = self._reader().execute(
+            f'SELECT {columns} FROM sensor_data ORDER BY ts DESC LIMIT ?', (n,)
+        ).fetchall()
+        rows.reverse()
+        return rows
+
+    def iter_range(self, start=None, end=None, limit=None, device=None, with_device=False):
+        where, params = self._where(start, end, device)
+        columns = 'ts, temperature, humidity, light, device' if with_device else 'ts, temperature, humidity, light'
+        sql = f'SELECT {columns} FROM sensor_data{where} ORDER BY ts'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        cursor = self._reader().execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(self.FETCH_SIZE)
+            if not rows:
+                break
+            yield from rows
+
+    def aggregate(self, start=None, end=None, device=None):
+        where, params = self._where(start, end, device)
+        row = self._reader().execute(
+            'SELECT COUNT(*), MIN(temperature), MAX(temperature), AVG(temperature), '
+            'MIN(humidity), MAX(humidity), AVG(humidity), AVG(light = 1) '
+            f'FROM sensor_data{where}', params
+        ).fetchone()
+        return summary_dict(*row)
+
+    def devices(self):
+        """資料庫中出現過的裝置名稱"""
+        return [row[0] for row in self._reader().execute('SELECT DISTINCT device FROM sensor_data ORDER BY device')]
+
+    def stats(self):
+        return self.writer.stats()
+
+
+def create_storage(backend, csv_path, sqlite_path, **options):
+    """
+    依名稱建立儲存後端
+
+    Args:
+        backend: 'csv' 或 'sqlite'
+        csv_path: CSV 檔案路徑
+        sqlite_path: SQLite 資料庫路徑
+        options: 批次寫入等設定（各後端只取自己支援的參數；
+            SQLite 的 fsync_policy 對應到 PRAGMA synchronous，fsync_interval 不適用，由 SQLite 的 checkpoint 決定）
+    """
+    if backend == BACKEND_CSV:
+        return CSVStorage(csv_path, **options)
+    if backend == BACKEND_SQLITE:
+        keys = ('batch_size', 'flush_interval', 'fsync_policy')
+        return SQLiteStorage(sqlite_path, **{k: v for k, v in options.items() if k in keys})
+    raise ValueError(f"未知的儲存後端: {backend}")
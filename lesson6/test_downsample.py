@@ -0,0 +1,70 @@
+"""
+降採樣的 numpy 與純 Python 版本必須選出相同的索引
+（有無安裝 numpy 時圖表顯示的點相同，快取結果也才能互相比較）
+
+使用方式:
+    uv run python -m unittest test_downsample
+"""
+
+import random
+import unittest
+
+import downsample
+
+# 隨機測試的次數
+TRIALS = 500
+
+
+def random_series(rng, size):
+    """遞增的時間與帶有大量相同數值的數值序列（相同數值時兩個版本的選擇方式最容易不同）"""
+    x = sorted(rng.uniform(0, 1e6) for _ in range(size))
+    y = [rng.choice((rng.gauss(25, 3), float(rng.randrange(4)))) for _ in range(size)]
+    return x, y
+
+
+@unittest.skipUnless(downsample.HAS_NUMPY, '需要 numpy')
+class BackendParityTest(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = random.Random(0)
+
+    def test_lttb(self):
+        np = downsample.np
+        for _ in range(TRIALS):
+            size = self.rng.randint(4, 600)
+            n = self.rng.randint(3, size - 1)
+            x, y = random_series(self.rng, size)
+            expected = downsample._lttb_python(x, y, n)
+            actual = downsample._lttb_numpy(np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64), n)
+            self.assertEqual(actual, expected, f'size={size}, n={n}')
+            self.assertEqual(len(expected), n)
+
+    def test_lttb_last_bucket(self):
+        # 185 / 22 * 22 截斷後為 184：純 Python 版本的最後一個分桶曾停在 size - 2，選不到索引 185 的高峰
+        np = downsample.np
+        x = list(range(187))
+        y = [0.0] * 187
+        y[185] = 100.0
+        expected = downsample._lttb_python(x, y, 24)
+        actual = downsample._lttb_numpy(np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64), 24)
+        self.assertEqual(actual, expected)
+        self.assertIn(185, expected)
+
+    def test_minmax(self):
+        for _ in range(TRIALS):
+            size = self.rng.randint(2, 600)
+            n = self.rng.randint(1, size)
+            _, y = random_series(self.rng, size)
+            results = []
+            for has_numpy in (True, False):
+                downsample.HAS_NUMPY = has_numpy
+                try:
+                    results.append(downsample.minmax(y, n))
+                finally:
+                    downsample.HAS_NUMPY = True
+            self.assertEqual(results[0], results[1], f'size={size}, n={n}')
+            self.assertTrue(all(0 <= i < size for i in results[0]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -14,6 +14,9 @@ BROKER = "localhost"
 PORT = 1883
 TOPIC = "客廳/感測器"  # 與 config.py 中的設定一致
 
+# 每次執行不同的識別碼：message_id 每次從 1 開始，伺服器依 session 改變判斷是重新執行而不是重送
+SESSION = int(time.time())
+
 def on_connect(client, userdata, flags, reason_code, properties):
     """連線回調函數"""
     if reason_code.is_failure:
@@ -42,7 +45,8 @@ def publish_test_data(client, count=10, interval=3):
             "light_status": "開" if i % 2 == 0 else "關",
             "timestamp": datetime.now().isoformat(),
             "device": "測試裝置",
-            "message_id": i + 1
+            "message_id": i + 1,
+            "session": SESSION
         }
         
         # 轉換為 JSON 字串
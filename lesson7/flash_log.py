@@ -0,0 +1,227 @@
+# 未送出數據的快閃記憶體環形日誌（MicroPython / CPython 皆可使用）
+# WiFi 或 Broker 斷線時，數據以 sensor_codec 的 13 bytes 格式寫入快閃記憶體，
+# 恢復連線後依序補傳，斷線期間的數據不會遺失
+#
+# 日誌分成多個區段檔（unsent/00000000.log、00000001.log ...），只會附加、不會覆寫：
+#   - 數據先累積在 RAM，滿 flush_records 筆才寫入一次，減少快閃記憶體的寫入次數
+#   - 區段送完或超過 max_segments 時整個刪除，不需要改寫檔案內容
+#   - 不另外記錄讀取位置（避免每送一批就改寫同一個區塊）；重新開機後
+#     最舊的區段會從頭重送，伺服器依序號去除重複
+# 斷電時 RAM 中尚未寫入的數據（最多 flush_records 筆）會遺失
+
+import os
+from sensor_codec import RECORD_SIZE
+
+LOG_DIR = 'unsent'
+SEQ_FILE = 'seq.txt'
+
+
+class LocalFS:
+    """實際的檔案系統（Pico 的 LittleFS 或電腦的檔案系統）"""
+
+    def open(self, path, mode):
+        return open(path, mode)
+
+    def listdir(self, path):
+        return os.listdir(path)
+
+    def mkdir(self, path):
+        os.mkdir(path)
+
+    def remove(self, path):
+        os.remove(path)
+
+    def rename(self, src, dst):
+        os.rename(src, dst)
+
+    def size(self, path):
+        return os.stat(path)[6]
+
+
+class FlashLog:
+    """
+    有上限的環形日誌（先進先出）
+
+    Args:
+        directory: 區段檔所在的目錄
+        segment_records: 每個區段檔幾筆（256 筆 = 3328 bytes，小於一個 4 KB 區塊）
+        max_segments: 最多幾個區段檔，超過時丟棄最舊的區段
+        flush_records: RAM 累積幾筆才寫入一次
+        fs: 檔案系統（預設 LocalFS；電腦上模擬時傳入替身）
+    """
+
+    def __init__(self, directory=LOG_DIR, segment_records=256, max_segments=16, flush_records=16, fs=None):
+        self.fs = fs or LocalFS()
+        self.directory = directory
+        self.segment_records = segment_records
+        self.max_segments = max_segments
+        self.flush_records = flush_records
+        self.dropped = 0
+        self.writes = 0
+
+        self._pending = bytearray(RECORD_SIZE * flush_records)
+        self._pending_count = 0
+        self._offset = 0  # 最舊區段中已送出的筆數
+
+        try:
+            self.fs.mkdir(directory)
+        except OSError:
+            pass
+        self._segments = sorted(int(name[:-4]) for name in self.fs.listdir(directory) if name.endswith('.log'))
+        self._counts = []
+        torn = False
+        for index in self._segments:
+            size = self.fs.size(self._path(index))
+            self._counts.append(size // RECORD_SIZE)
+            torn = size % RECORD_SIZE != 0
+        # 最後一個區段結尾不完整（寫入時斷電）就不再附加，從新區段開始，避免後續數據錯位
+        self._head_closed = torn
+        self._next_index = self._segments[-1] + 1 if self._segments else 0
+
+    def __len__(self):
+        """尚未送出的筆數"""
+        return sum(self._counts) - self._offset + self._pending_count
+
+    def _path(self, index):
+        return f'{self.directory}/{index:08d}.log'
+
+    def _remove_oldest(self):
+        self.fs.remove(self._path(self._segments[0]))
+        self._segments.pop(0)
+        self._counts.pop(0)
+        self._offset = 0
+
+    def _new_segment(self):
+        self._segments.append(self._next_index)
+        self._counts.append(0)
+        self._next_index += 1
+        self._head_closed = False
+        if len(self._segments) > self.max_segments:
+            self.dropped += self._counts[0] - self._offset
+            print(f"⚠️ 快閃記憶體日誌已滿，丟棄最舊的 {self._counts[0] - self._offset} 筆")
+            self._remove_oldest()
+
+    def append(self, data):
+        """
+        加入數據（sensor_codec 格式，可一次多筆）
+
+        Args:
+            data: bytes / memoryview，長度為 RECORD_SIZE 的倍數
+        """
+        total = len(data) // RECORD_SIZE
+        done = 0
+        while done < total:
+            take = min(total - done, self.flush_records - self._pending_count)
+            start = self._pending_count * RECORD_SIZE
+            self._pending[start:start + take * RECORD_SIZE] = data[done * RECORD_SIZE:(done + take) * RECORD_SIZE]
+            self._pending_count += take
+            done += take
+            if self._pending_count == self.flush_records:
+                self.flush()
+
+    def flush(self):
+        """把 RAM 中累積的數據寫入快閃記憶體"""
+        pending = memoryview(self._pending)
+        done = 0
+        try:
+            while done < self._pending_count:
+                if not self._segments or self._head_closed or self._counts[-1] >= self.segment_records:
+                    self._new_segment()
+                take = min(self._pending_count - done, self.segment_records - self._counts[-1])
+                with self.fs.open(self._path(self._segments[-1]), 'ab') as f:
+                    f.write(pending[done * RECORD_SIZE:(done + take) * RECORD_SIZE])
+                self._counts[-1] += take
+                self.writes += 1
+                done += take
+        except OSError as e:
+            # 快閃記憶體已滿或損壞：丟棄這批，不中斷取樣
+            self.dropped += self._pending_count - done
+            print(f"⚠️ 快閃記憶體寫入失敗: {e}，丟棄 {self._pending_count - done} 筆")
+            self._head_closed = True
+        self._pending_count = 0
+
+    def peek(self, view):
+        """
+        讀出最舊的未送出數據（不移除；送出成功後再呼叫 consume()）
+
+        Args:
+            view: 可寫入的 memoryview（例如 SensorEncoder.free()），讀入 len(view) // RECORD_SIZE 筆以內
+
+        Returns:
+            int: 讀出的筆數
+        """
+        limit = len(view) // RECORD_SIZE
+        got = 0
+        skip = self._offset
+        for index, count in zip(self._segments, self._counts):
+            if got >= limit:
+                break
+            take = min(count - skip, limit - got)
+            if take > 0:
+                with self.fs.open(self._path(index), 'rb') as f:
+                    f.seek(skip * RECORD_SIZE)
+                    f.readinto(view[got * RECORD_SIZE:(got + take) * RECORD_SIZE])
+                got += take
+            skip = 0
+        take = min(self._pending_count, limit - got)
+        if take > 0:
+            view[got * RECORD_SIZE:(got + take) * RECORD_SIZE] = self._pending[:take * RECORD_SIZE]
+            got += take
+        return got
+
+    def consume(self, count):
+        """
+        移除最舊的 count 筆（已成功送出）
+
+        送完的區段檔直接刪除，只送出一部分的區段只在 RAM 記錄位置
+        """
+        while count and self._segments:
+            available = self._counts[0] - self._offset
+            if count < available:
+                self._offset += count
+                return
+            count -= available
+            self._remove_oldest()
+        if count:
+            rest = self._pending_count - count
+            self._pending[:rest * RECORD_SIZE] = self._pending[count * RECORD_SIZE:self._pending_count * RECORD_SIZE]
+            self._pending_count = rest
+
+
+class SequenceStore:
+    """
+    重新開機後仍然遞增的序號
+
+    每 step 個序號才寫入一次快閃記憶體（記錄已預留的上限），開機後從上限之後繼續；
+    中間跳過的序號不影響伺服器，伺服器只需要序號不重複
+
+    Args:
+        path: 保存上限的檔案
+        step: 一次預留幾個序號
+        fs: 檔案系統（預設 LocalFS）
+    """
+
+    def __init__(self, path=SEQ_FILE, step=1000, fs=None):
+        self.fs = fs or LocalFS()
+        self.path = path
+        self.step = step
+        try:
+            with self.fs.open(path, 'r') as f:
+                self.reserved = int(f.read())
+        except (OSError, ValueError):
+            self.reserved = 0
+        self.value = self.reserved
+
+    def next(self):
+        """取得下一個序號"""
+        self.value += 1
+        if self.value > self.reserved:
+            self.reserved = self.value + self.step - 1
+            try:
+                # 先寫暫存檔再改名，寫入中斷電不會留下損壞的上限
+                with self.fs.open(self.path + '.tmp', 'w') as f:
+                    f.write(str(self.reserved))
+                self.fs.rename(self.path + '.tmp', self.path)
+            except OSError as e:
+                print(f"⚠️ 無法保存序號: {e}")
+        return self.value
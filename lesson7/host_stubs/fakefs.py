@@ -0,0 +1,107 @@
+# 記憶體中的檔案系統替身（CPython 主機端模擬用，不要上傳到 Pico）
+# 介面與 flash_log.LocalFS 相同，另外統計寫入次數與位元組數，用來估計快閃記憶體的磨耗
+#
+#   fs.write_ops       write() 呼叫次數（每次至少改寫一個快閃記憶體頁面）
+#   fs.bytes_written   寫入的總位元組數
+#   fs.capacity        容量上限（bytes），超過時 write() 拋出 OSError(28)
+
+ENOENT = 2
+EEXIST = 17
+ENOSPC = 28
+
+
+class FakeFile:
+    """open() 回傳的檔案物件"""
+
+    def __init__(self, fs, path, mode):
+        self.fs = fs
+        self.text = 'b' not in mode
+        if 'w' in mode:
+            fs.files[path] = bytearray()
+        elif path not in fs.files:
+            if 'a' not in mode:
+                raise OSError(ENOENT)
+            fs.files[path] = bytearray()
+        self.data = fs.files[path]
+        self.append = 'a' in mode
+        self.pos = len(self.data) if self.append else 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        pass
+
+    def write(self, data):
+        data = data.encode('utf-8') if self.text else bytes(data)
+        if self.fs.capacity is not None and self.fs.used() + len(data) > self.fs.capacity:
+            raise OSError(ENOSPC)
+        if self.append:
+            self.pos = len(self.data)
+        self.data[self.pos:self.pos + len(data)] = data
+        self.pos += len(data)
+        self.fs.write_ops += 1
+        self.fs.bytes_written += len(data)
+        return len(data)
+
+    def read(self, size=-1):
+        end = len(self.data) if size is None or size < 0 else min(len(self.data), self.pos + size)
+        chunk = bytes(self.data[self.pos:end])
+        self.pos = end
+        return chunk.decode('utf-8') if self.text else chunk
+
+    def readinto(self, buffer):
+        size = min(len(buffer), len(self.data) - self.pos)
+        buffer[:size] = self.data[self.pos:self.pos + size]
+        self.pos += size
+        return size
+
+    def seek(self, offset, whence=0):
+        self.pos = offset if whence == 0 else (self.pos + offset if whence == 1 else len(self.data) + offset)
+        return self.pos
+
+
+class FakeFS:
+    """以 dict 保存檔案內容的檔案系統"""
+
+    def __init__(self, capacity=None):
+        self.capacity = capacity
+        self.files = {}
+        self.dirs = set()
+        self.write_ops = 0
+        self.bytes_written = 0
+
+    def used(self):
+        return sum(len(data) for data in self.files.values())
+
+    def open(self, path, mode='r'):
+        return FakeFile(self, path, mode)
+
+    def listdir(self, path):
+        if path not in self.dirs:
+            raise OSError(ENOENT)
+        prefix = path.rstrip('/') + '/'
+        return [name[len(prefix):] for name in self.files if name.startswith(prefix) and '/' not in name[len(prefix):]]
+
+    def mkdir(self, path):
+        if path in self.dirs:
+            raise OSError(EEXIST)
+        self.dirs.add(path)
+
+    def remove(self, path):
+        if path not in self.files:
+            raise OSError(ENOENT)
+        del self.files[path]
+
+    def rename(self, src, dst):
+        if src not in self.files:
+            raise OSError(ENOENT)
+        self.files[dst] = self.files.pop(src)
+
+    def size(self, path):
+        if path not in self.files:
+            raise OSError(ENOENT)
+        return len(self.files[path])
@@ -0,0 +1,38 @@
+# network 模組替身（CPython 主機端模擬用，不要上傳到 Pico）
+# 只實作 wifi_connect.py 用到的 WLAN 介面，connect() 後立即視為已連線
+
+STA_IF = 0
+AP_IF = 1
+
+STAT_IDLE = 0
+STAT_GOT_IP = 3
+
+
+class WLAN:
+    """模擬的 WLAN 介面（同一個介面的所有物件共用連線狀態，與 Pico 相同）"""
+
+    _connected = {}
+
+    def __init__(self, interface=STA_IF):
+        self.interface = interface
+        self._active = False
+
+    def active(self, state=None):
+        if state is None:
+            return self._active
+        self._active = bool(state)
+
+    def connect(self, ssid=None, password=None):
+        WLAN._connected[self.interface] = True
+
+    def disconnect(self):
+        WLAN._connected[self.interface] = False
+
+    def isconnected(self):
+        return WLAN._connected.get(self.interface, False)
+
+    def status(self):
+        return STAT_GOT_IP if self.isconnected() else STAT_IDLE
+
+    def ifconfig(self):
+        return ('192.168.137.100', '255.255.255.0', '192.168.137.1', '8.8.8.8')
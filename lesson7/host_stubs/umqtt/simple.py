@@ -0,0 +1,61 @@
+# umqtt.simple 替身（CPython 主機端模擬用，不要上傳到 Pico）
+# 不連線到真正的 Broker，只記錄發布的主題與訊息，並可模擬發布失敗（OSError）
+#
+#   client.published        已發布的 (主題 bytes, 訊息 bytes) 列表
+#   client.fail_publishes   接下來幾次 publish() 拋出 OSError（模擬瞬間斷線）
+#   client.down             True 時 connect() 與 publish() 都拋出 OSError（模擬 WiFi / Broker 長時間斷線）
+
+
+class MQTTException(Exception):
+    pass
+
+
+class MQTTClient:
+    """與 umqtt.simple.MQTTClient 相同的建構參數與方法"""
+
+    def __init__(self, client_id, server, port=0, user=None, password=None, keepalive=0,
+                 ssl=None, ssl_params={}):
+        self.client_id = client_id
+        self.server = server
+        self.port = port
+        self.keepalive = keepalive
+        self.connected = False
+        self.published = []
+        self.fail_publishes = 0
+        self.down = False
+        self.connects = 0
+
+    def connect(self, clean_session=True):
+        if self.down:
+            raise OSError(-1)
+        self.connected = True
+        self.connects += 1
+        return False
+
+    def disconnect(self):
+        self.connected = False
+
+    def ping(self):
+        if not self.connected:
+            raise OSError(-1)
+
+    def publish(self, topic, msg, retain=False, qos=0):
+        if self.fail_publishes > 0:
+            self.fail_publishes -= 1
+            self.connected = False
+            raise OSError(-1)
+        if self.down:
+            self.connected = False
+        if not self.connected:
+            raise OSError(-1)
+        # 訊息可能是 memoryview（sensor_codec 的緩衝區），複製一份保存
+        self.published.append((bytes(topic), bytes(msg)))
+
+    def set_callback(self, f):
+        self.cb = f
+
+    def subscribe(self, topic, qos=0):
+        pass
+
+    def check_msg(self):
+        return None
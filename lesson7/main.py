@@ -3,6 +3,9 @@ import time
 import json
 import random
 from umqtt.simple import MQTTClient
+import sensor_codec
+import flash_log
+import report_policy
 
 # MQTT 設定
 MQTT_BROKER = "192.168.137.37"  # 公開測試用 Broker #broker裡要用伺服器的ip，pico要和伺服器同網域
@@ -11,66 +14,218 @@ CLIENT_ID = "pico_w_publisher"
 TOPIC = "客廳/感測器"
 KEEPALIVE = 60  # 保持連線時間（秒）
 
-# 嘗試連線 WiFi
-wifi.connect()
+# 負載格式："bin" 為 17 bytes 的二進位格式（sensor_codec.py），"json" 為原本的 JSON 格式
+PAYLOAD_FORMAT = "bin"
+DEVICE_ID = 1  # 裝置編號（每塊 Pico 不同，二進位格式使用）
 
-# 顯示 IP
-print("IP:", wifi.get_ip())
+# 取樣與批次發布（二進位格式才會批次，JSON 格式每筆都立即發布）
+# 累積 BATCH_SIZE 筆，或距離這批第一筆已超過 BATCH_INTERVAL 秒，就合成一則訊息發布
+# 取樣越頻繁越值得批次：每則訊息省下 MQTT 標頭、主題與一次無線電傳輸
+# BATCH_SIZE = 1 即每筆立即發布（與原本相同）
+SAMPLE_INTERVAL = 10  # 取樣間隔（秒）
+BATCH_SIZE = 6        # 一則訊息最多幾筆（1~255）
+BATCH_INTERVAL = 60   # 一批最久等幾秒就發布（秒）
+
+# 斷線時的數據保存與補傳（flash_log.py，二進位格式才會保存）
+# 斷線期間的數據寫入快閃記憶體，恢復連線後每次迴圈最多補傳 REPLAY_BATCHES 則訊息、
+# 每則 REPLAY_BATCH 筆，每則間隔 REPLAY_GAP 秒，避免一次送太多塞爆 Broker 與伺服器
+LOG_SEGMENTS = 16     # 最多保留幾個區段（每段 256 筆，16 段約 4096 筆、53 KB）
+REPLAY_BATCH = 50     # 補傳時一則訊息幾筆
+REPLAY_BATCHES = 4    # 每次迴圈最多補傳幾則
+REPLAY_GAP = 0.5      # 補傳訊息之間的間隔（秒）
+WIFI_RETRY = 5        # 重新連線 WiFi 時最多等幾秒
+
+# 變化才回報（report_policy.py）：溫濕度變化超過死區、電燈開關改變，或超過 HEARTBEAT 秒才回報
+# 變化緩慢的房間大部分取樣都不需要送出；REPORT_BY_EXCEPTION = False 即每筆都回報
+REPORT_BY_EXCEPTION = True
+TEMPERATURE_DEADBAND = 0.3  # 溫度死區（°C）
+HUMIDITY_DEADBAND = 1.0     # 濕度死區（%）
+HEARTBEAT = 300             # 最久幾秒一定回報一次（秒）
 
 # 建立 MQTT 連線（加入 keepalive 設定）
 client = MQTTClient(CLIENT_ID, MQTT_BROKER, port=MQTT_PORT, keepalive=KEEPALIVE)
 
+if PAYLOAD_FORMAT == "bin":
+    topic = (TOPIC + sensor_codec.TOPIC_SUFFIX).encode('utf-8')
+else:
+    topic = TOPIC.encode('utf-8')
+
 def mqtt_connect():
     """連接 MQTT Broker"""
     print("正在連接 MQTT Broker...")
     client.connect()
     print(f"已連接到 {MQTT_BROKER}")
 
-# 初始連線
-mqtt_connect()
-
-# 在 while True 之前宣告計數器
-counter = 0
-
-# 每隔 10 秒發布一次訊息
-while True:
-    # 每次迴圈加 1
-    counter += 1
-
-    # 產生亂數資料
-    temperature = round(random.uniform(20.0, 35.0), 1)  # 溫度 20~35°C
-    humidity = round(random.uniform(40.0, 80.0), 1)     # 濕度 40~80%
-    light_status = random.choice(["開", "關"])          # 燈光狀態
-    
-    # 建立 JSON 資料
-    data = {
-        "temperature": temperature,
-        "humidity": humidity,
-        "light_status": light_status
-    }
-    message = json.dumps(data)
-    
-    print("-" * 30)
-    
-    # 嘗試發布，如果失敗則重新連線
+def connect():
+    """
+    連線 WiFi 與 MQTT Broker
+
+    Returns:
+        bool: 是否連線成功（失敗時數據先保存在快閃記憶體，下一次迴圈再試，不中斷取樣）
+    """
     try:
-        client.publish(TOPIC.encode('utf-8'), message.encode('utf-8'))
-        print(f"已發布訊息: {counter}")
-        print(f"  溫度: {temperature}°C")
-        print(f"  濕度: {humidity}%")
-        print(f"  燈光: {light_status}")
-        print(f"主題: {TOPIC}")
-    except OSError as e:
-        print(f"發布失敗: {e}")
-        print("嘗試重新連線...")
+        if not wifi.is_connected():
+            wifi.connect(retry=WIFI_RETRY)
+            # 顯示 IP
+            print("IP:", wifi.get_ip())
         mqtt_connect()
-        # 重新連線後再發布一次
-        client.publish(TOPIC, message)
-        print("重新連線後發布成功!")
-    
-    print("等待 10 秒後再次發布...")
-    time.sleep(10)
+        return True
+    except (OSError, RuntimeError) as e:
+        print(f"連線失敗: {e}")
+        return False
+
+# 模擬的房間狀態（溫濕度緩慢漂移，電燈偶爾開關）
+room = {"temperature": 26.0, "humidity": 60.0, "light_status": "關"}
+
+def read_sensor():
+    """讀取感測器（目前以亂數模擬緩慢變化的房間）"""
+    room["temperature"] = min(35.0, max(20.0, room["temperature"] + random.uniform(-0.05, 0.05)))  # 溫度 20~35°C
+    room["humidity"] = min(80.0, max(40.0, room["humidity"] + random.uniform(-0.2, 0.2)))          # 濕度 40~80%
+    if random.random() < 0.005:                                                                    # 燈光狀態
+        room["light_status"] = "開" if room["light_status"] == "關" else "關"
+    return round(room["temperature"], 1), round(room["humidity"], 1), room["light_status"]
+
+def publish(message, qos=0):
+    """發布訊息（失敗時拋出 OSError，由呼叫端決定如何處理）"""
+    client.publish(topic, message, qos=qos)
+    print(f"主題: {topic.decode('utf-8')}（{len(message)} bytes）")
+
+def send_or_log(encoder, log, connected):
+    """
+    送出一批數據；尚未連線、發布失敗，或快閃記憶體還有較舊的數據待補傳時，
+    改為寫入快閃記憶體（維持先後順序，伺服器收到的數據時間一定遞增）
+
+    Returns:
+        bool: 是否仍在連線
+    """
+    if connected and not len(log):
+        try:
+            publish(encoder.message(time.time()))
+            print(f"已發布 {encoder.count} 筆")
+            encoder.reset()
+            return True
+        except OSError as e:
+            print(f"發布失敗: {e}")
+            connected = False
+    log.append(encoder.records())
+    print(f"📼 已保存 {encoder.count} 筆到快閃記憶體（共 {len(log)} 筆未送出）")
+    encoder.reset()
+    return connected
+
+def replay_log(log, replay):
+    """
+    補傳快閃記憶體中的數據（從最舊的開始，每次最多 REPLAY_BATCHES 則）
+
+    以 QoS 1 發布，Broker 確認收到後才從日誌移除
+
+    Returns:
+        bool: 是否仍在連線
+    """
+    for _ in range(REPLAY_BATCHES):
+        replay.reset()
+        count = log.peek(replay.free())
+        if not count:
+            break
+        replay.commit(count)
+        try:
+            publish(replay.message(time.time()), qos=1)
+        except OSError as e:
+            print(f"補傳失敗: {e}")
+            return False
+        log.consume(count)
+        print(f"📤 已補傳 {count} 筆（剩 {len(log)} 筆）")
+        time.sleep(REPLAY_GAP)
+    return True
+
+def main(batch_size=BATCH_SIZE, batch_interval=BATCH_INTERVAL, max_samples=None, fs=None):
+    """
+    主迴圈：每 SAMPLE_INTERVAL 秒取樣一次，依批次設定發布
+
+    Args:
+        batch_size: 一則訊息最多幾筆
+        batch_interval: 一批最久等幾秒就發布
+        max_samples: 取樣幾筆後結束（None 為永不結束；主機端模擬用）
+        fs: 檔案系統（None 為 Pico 的快閃記憶體；主機端模擬時傳入替身）
+    """
+    # 初次連線失敗也開始取樣，數據先保存在快閃記憶體
+    connected = connect()
+
+    # 快閃記憶體日誌與序號（重新開機後序號繼續遞增，伺服器依序號去除重複）
+    log = flash_log.FlashLog(max_segments=LOG_SEGMENTS, fs=fs)
+    sequence = flash_log.SequenceStore(fs=fs)
+    if len(log):
+        print(f"📼 快閃記憶體中有 {len(log)} 筆未送出的數據")
+
+    # 二進位格式：緩衝區只在這裡配置一次（batch_size 筆），之後重複使用
+    encoder = sensor_codec.SensorEncoder(DEVICE_ID, batch_size)
+    replay = sensor_codec.SensorEncoder(DEVICE_ID, REPLAY_BATCH)
+    batch_started = 0
+
+    # 變化才回報（REPORT_BY_EXCEPTION = False 時每筆都回報）
+    policy = None
+    if REPORT_BY_EXCEPTION:
+        policy = report_policy.ReportPolicy(
+            {"temperature": TEMPERATURE_DEADBAND, "humidity": HUMIDITY_DEADBAND}, heartbeat=HEARTBEAT)
+
+    # 在 while 之前宣告計數器
+    samples = 0
+
+    while max_samples is None or samples < max_samples:
+        samples += 1
+
+        temperature, humidity, light_status = read_sensor()
+        now = time.time()
+
+        reason = report_policy.REPORT_CHANGE
+        if policy is not None:
+            reason = policy.check(now, {"temperature": temperature, "humidity": humidity, "light_status": light_status})
+
+        # 沒有明顯變化就不回報（序號只給回報的數據，伺服器看到的序號才會連續）
+        if reason is not None:
+            counter = sequence.next()
+            print("-" * 30)
+            print(f"第 {counter} 筆（{reason}）  溫度: {temperature}°C  濕度: {humidity}%  燈光: {light_status}")
+
+            if PAYLOAD_FORMAT == "bin":
+                # 寫入預先配置的緩衝區
+                if encoder.count == 0:
+                    batch_started = now
+                light = sensor_codec.LIGHT_ON if light_status == "開" else sensor_codec.LIGHT_OFF
+                encoder.add(counter, now, temperature, humidity, light)
+            else:
+                # 建立 JSON 資料（JSON 格式不保存到快閃記憶體，斷線期間的數據會遺失）
+                data = {
+                    "temperature": temperature,
+                    "humidity": humidity,
+                    "light_status": light_status
+                }
+                try:
+                    publish(json.dumps(data).encode('utf-8'))
+                    print(f"已發布訊息: {counter}")
+                except OSError as e:
+                    print(f"發布失敗: {e}")
+                    connected = False
+
+        # 緩衝區滿了、超過 BATCH_INTERVAL，或電燈開關改變（立即送出）就發布
+        if encoder.count and (encoder.count >= encoder.capacity or now - batch_started >= batch_interval
+                              or reason == report_policy.REPORT_STATE):
+            connected = send_or_log(encoder, log, connected)
+
+        if not connected:
+            print("嘗試重新連線...")
+            connected = connect()
+        if connected and len(log):
+            connected = replay_log(log, replay)
+
+        time.sleep(SAMPLE_INTERVAL)
+
+    # 結束前把緩衝區剩下的數據送出（送不出去就寫入快閃記憶體）
+    if encoder.count:
+        send_or_log(encoder, log, connected)
+    log.flush()
+
+if __name__ == "__main__":
+    main()
       #問題在於 umqtt.simple 的 publish() 方法需要 bytes 類型，而不是字串。使用中文時，需要先將字串編碼為 UTF-8 bytes。
       #問題原因在 umqtt.simple 中：publish() 方法的第一個參數（主題）和第二個參數（訊息）都必須是 bytes 類型如果直接傳入包含中文的字串，會出現編碼錯誤
       #將主題和訊息都轉換為 UTF-8 bytes
-
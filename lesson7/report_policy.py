@@ -0,0 +1,81 @@
+# 變化才回報（report by exception）的共用模組（MicroPython / CPython 皆可使用）
+# lesson7/main.py（MQTT 發布）與 lesson8/lesson8_3.py（可變電阻）共用，使用時一起上傳到 Pico
+#
+# 數值變化超過死區（deadband）、狀態改變（例如電燈開關），或太久沒有回報（心跳）時才回報，
+# 變化緩慢的房間可以少送一個數量級的訊息，伺服器的接收負擔也跟著下降
+# ADC 先以過取樣平均降低雜訊，再套用死區，避免雜訊本身就超過死區
+
+# 回報原因
+REPORT_FIRST = 'first'          # 第一筆
+REPORT_CHANGE = 'change'        # 數值變化超過死區
+REPORT_STATE = 'state'          # 狀態改變（沒有設定死區的欄位，例如電燈）
+REPORT_HEARTBEAT = 'heartbeat'  # 超過 heartbeat 秒沒有回報
+
+
+def read_average(adc, samples=16):
+    """
+    過取樣平均：連續讀取 samples 次 ADC.read_u16() 取平均
+
+    雜訊的標準差約降為 1/√samples（16 次約 1/4）
+
+    Returns:
+        int: 平均值（0~65535）
+    """
+    total = 0
+    for _ in range(samples):
+        total += adc.read_u16()
+    return total // samples
+
+
+class ReportPolicy:
+    """
+    決定這次讀數要不要回報
+
+    Args:
+        deadbands: {欄位: 死區}，與上次回報值相差超過死區才回報；
+                   沒有列出的欄位只要改變就回報（狀態欄位）
+        heartbeat: 最久幾秒一定回報一次（0 為不使用心跳）
+    """
+
+    def __init__(self, deadbands, heartbeat=300):
+        self.deadbands = deadbands
+        self.heartbeat = heartbeat
+        self.last = None
+        self.last_time = 0
+        self.samples = 0
+        self.reports = 0
+        self.reasons = {}
+
+    def check(self, now, values):
+        """
+        檢查一筆讀數；需要回報時記錄為最後回報值
+
+        Args:
+            now: 目前時間（秒）
+            values: {欄位: 數值}
+
+        Returns:
+            str: 回報原因（REPORT_*）；不需要回報時回傳 None
+        """
+        self.samples += 1
+        reason = None
+        if self.last is None:
+            reason = REPORT_FIRST
+        else:
+            for name, value in values.items():
+                band = self.deadbands.get(name)
+                if band is None:
+                    if value != self.last.get(name):
+                        reason = REPORT_STATE
+                        break
+                elif abs(value - self.last[name]) > band:
+                    reason = REPORT_CHANGE
+            if reason is None and self.heartbeat and now - self.last_time >= self.heartbeat:
+                reason = REPORT_HEARTBEAT
+        if reason is None:
+            return None
+        self.last = dict(values)
+        self.last_time = now
+        self.reports += 1
+        self.reasons[reason] = self.reasons.get(reason, 0) + 1
+        return reason
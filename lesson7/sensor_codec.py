@@ -0,0 +1,105 @@
+# 感測器二進位負載編碼器（MicroPython / CPython 皆可使用）
+# 格式與伺服器端 lesson6/binary_payload.py 相同：
+#   標頭 v1  <BBH    版本, 筆數, 裝置編號                       4 bytes
+#   標頭 v2  <BBHI   版本, 筆數, 裝置編號, 發送時間             8 bytes
+#   每筆     <IIhHb  序號, 時間戳記, 溫度x100, 濕度x100, 電燈   13 bytes
+# 一筆數據只要 17 bytes（JSON 約 70 bytes），伺服器也不需要 json.loads
+# v2 多帶發送時間，伺服器據此換算斷線補傳的舊數據時間（Pico 的時鐘不一定準確）
+#
+# 緩衝區在建立時配置一次，之後以 struct.pack_into 直接寫入，
+# 發布時不再產生新的字串或 dict，減少 Pico 的記憶體配置與垃圾回收
+
+import struct
+
+VERSION = 1
+VERSION_SENT_AT = 2
+HEADER_FORMAT = '<BBH'
+HEADER_SENT_AT_FORMAT = '<BBHI'
+RECORD_FORMAT = '<IIhHb'
+HEADER_SIZE = 4
+HEADER_SENT_AT_SIZE = 8
+RECORD_SIZE = 13
+
+# 緩衝區前面保留 v2 標頭的空間，v1 標頭寫在數據正前方，兩種格式都不需要複製
+RECORDS_OFFSET = HEADER_SENT_AT_SIZE
+
+# 發布到 <房間>/感測器/bin，伺服器依 /bin 後綴辨識二進位負載
+TOPIC_SUFFIX = '/bin'
+
+LIGHT_OFF = 0
+LIGHT_ON = 1
+LIGHT_UNKNOWN = -1
+
+
+class SensorEncoder:
+    """
+    預先配置緩衝區的編碼器
+
+    Args:
+        device_id: 裝置編號（0~65535，每塊 Pico 不同）
+        capacity: 一則訊息最多幾筆（1~255）
+    """
+
+    def __init__(self, device_id, capacity=1):
+        self.device_id = device_id
+        self.capacity = capacity
+        self.buffer = bytearray(RECORDS_OFFSET + RECORD_SIZE * capacity)
+        self.view = memoryview(self.buffer)
+        self.count = 0
+
+    def add(self, seq, timestamp, temperature, humidity, light):
+        """
+        加入一筆數據
+
+        Args:
+            seq: 序號（每筆數據加 1）
+            timestamp: 時間戳記（秒）
+            temperature: 溫度（°C）
+            humidity: 濕度（%）
+            light: LIGHT_ON / LIGHT_OFF / LIGHT_UNKNOWN
+
+        Returns:
+            bool: 緩衝區是否已滿
+        """
+        if self.count >= self.capacity:
+            raise ValueError("緩衝區已滿，請先發布")
+        struct.pack_into(RECORD_FORMAT, self.buffer, RECORDS_OFFSET + RECORD_SIZE * self.count,
+                         seq & 0xFFFFFFFF, int(timestamp) & 0xFFFFFFFF,
+                         round(temperature * 100), round(humidity * 100), light)
+        self.count += 1
+        return self.count >= self.capacity
+
+    def message(self, sent_at=None):
+        """
+        取得目前累積的訊息（緩衝區的 memoryview，不複製）
+
+        Args:
+            sent_at: 發送時間（秒）；有值時使用 v2 標頭，否則為 v1
+
+        下一次 add() 之前必須發布完成
+        """
+        end = RECORDS_OFFSET + RECORD_SIZE * self.count
+        if sent_at is None:
+            start = RECORDS_OFFSET - HEADER_SIZE
+            struct.pack_into(HEADER_FORMAT, self.buffer, start, VERSION, self.count, self.device_id)
+        else:
+            start = 0
+            struct.pack_into(HEADER_SENT_AT_FORMAT, self.buffer, 0, VERSION_SENT_AT, self.count,
+                             self.device_id, int(sent_at) & 0xFFFFFFFF)
+        return self.view[start:end]
+
+    def records(self):
+        """目前累積的數據（不含標頭，寫入快閃記憶體日誌用）"""
+        return self.view[RECORDS_OFFSET:RECORDS_OFFSET + RECORD_SIZE * self.count]
+
+    def free(self):
+        """尚未使用的數據空間（從快閃記憶體日誌直接讀入，再呼叫 commit()）"""
+        return self.view[RECORDS_OFFSET + RECORD_SIZE * self.count:]
+
+    def commit(self, count):
+        """直接寫入 free() 的數據筆數"""
+        self.count += count
+
+    def reset(self):
+        """發布後清空（緩衝區重複使用）"""
+        self.count = 0
@@ -0,0 +1,140 @@
+"""
+批次發布模擬（在電腦上以 CPython 執行，不需要 Pico）
+以 host_stubs/ 的 network、umqtt 與檔案系統替身執行 main.py 的主迴圈，時間改用模擬時鐘，
+比較不同 BATCH_SIZE 的訊息數、傳輸量與數據延遲，
+再以伺服器端 lesson6/binary_payload.py 解回所有數據，確認筆數與序號完整並量測解碼成本
+
+使用方式:
+    python simulate_batching.py                          # 每秒取樣 1 筆、共 3600 筆
+    python simulate_batching.py --interval 0.2 --samples 10000 --batches 1,10,50,255
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, 'host_stubs'))
+sys.path.insert(1, os.path.join(HERE, '..', 'lesson6'))
+
+import main  # noqa: E402
+import wifi_connect  # noqa: E402
+from umqtt.simple import MQTTClient  # noqa: E402
+from fakefs import FakeFS  # noqa: E402
+from binary_payload import unpack  # noqa: E402
+
+# MQTT 3.1.1 PUBLISH（QoS 0）：固定標頭 2 bytes + 主題長度 2 bytes
+MQTT_OVERHEAD = 4
+# 無線電每次傳輸的固定成本（喚醒、前導、TCP/IP 標頭與 ACK），粗估 100 bytes
+RADIO_OVERHEAD = 100
+
+
+class SimulatedClock:
+    """模擬時鐘：sleep() 只推進時間，不真的等待"""
+
+    def __init__(self, start=1_700_000_000.0):
+        self.now = start
+
+    def time(self):
+        return int(self.now)
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class TimedClient(MQTTClient):
+    """記錄每則訊息的發布時間（模擬時鐘）"""
+
+    def __init__(self, clock, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.clock = clock
+        self.published_at = []
+
+    def publish(self, topic, msg, retain=False, qos=0):
+        super().publish(topic, msg, retain, qos)
+        self.published_at.append(self.clock.now)
+
+
+def run(batch_size, batch_interval, interval, samples):
+    """
+    以指定批次設定執行 main.main()
+
+    Returns:
+        TimedClient: 記錄了所有發布內容的 MQTT 替身
+    """
+    clock = SimulatedClock()
+    main.time = clock
+    wifi_connect.time = clock
+    main.SAMPLE_INTERVAL = interval
+    main.REPORT_BY_EXCEPTION = False  # 每筆都回報，只比較批次大小
+    main.client = TimedClient(clock, main.CLIENT_ID, main.MQTT_BROKER, port=main.MQTT_PORT)
+    with contextlib.redirect_stdout(io.StringIO()):
+        main.main(batch_size=batch_size, batch_interval=batch_interval, max_samples=samples, fs=FakeFS())
+    return main.client
+
+
+def analyse(client, samples):
+    """
+    以伺服器端的方式解回所有訊息並統計
+
+    Returns:
+        dict: 訊息數、每筆 bytes、平均延遲、解碼微秒
+    """
+    payloads = [msg for _, msg in client.published]
+    topic_bytes = len(client.published[0][0])
+
+    started = time.perf_counter()
+    seqs = []
+    delays = []
+    for payload, sent in zip(payloads, client.published_at):
+        _, _, _, records = unpack(payload)
+        for seq, timestamp, _, _, _ in records:
+            seqs.append(seq)
+            delays.append(sent - timestamp)
+    decode_seconds = time.perf_counter() - started
+
+    assert seqs == list(range(1, samples + 1)), "解回的序號不完整或順序錯誤"
+
+    payload_bytes = sum(len(p) for p in payloads)
+    wire_bytes = payload_bytes + len(payloads) * (MQTT_OVERHEAD + topic_bytes)
+    return {
+        'messages': len(payloads),
+        'payload': payload_bytes / samples,
+        'wire': wire_bytes / samples,
+        'radio': (wire_bytes + len(payloads) * RADIO_OVERHEAD) / samples,
+        'delay': sum(delays) / len(delays),
+        'decode_us': decode_seconds / samples * 1e6,
+    }
+
+
+def main_cli():
+    """主程式"""
+    parser = argparse.ArgumentParser(description='Pico 批次發布模擬')
+    parser.add_argument('--samples', type=int, default=3600, help='取樣筆數（預設 3600）')
+    parser.add_argument('--interval', type=float, default=1.0, help='取樣間隔秒數（預設 1）')
+    parser.add_argument('--batches', default='1,6,30,120,255', help='要比較的 BATCH_SIZE（逗號分隔）')
+    parser.add_argument('--batch-interval', type=float, default=300, help='一批最久等幾秒（預設 300）')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(" Pico 批次發布模擬")
+    print("=" * 60)
+    print(f" 取樣 {args.samples:,} 筆，每 {args.interval:g} 秒一筆，BATCH_INTERVAL {args.batch_interval:g} 秒")
+    print(f" 線上 bytes 含 MQTT 標頭與主題；無線電 bytes 另加每次傳輸 {RADIO_OVERHEAD} bytes 粗估\n")
+    print(f" {'BATCH_SIZE':>10} {'訊息數':>8} {'負載/筆':>8} {'線上/筆':>8} {'無線電/筆':>9} {'平均延遲(s)':>11} {'解碼(µs/筆)':>11}")
+
+    for batch_size in (int(b) for b in args.batches.split(',')):
+        client = run(batch_size, args.batch_interval, args.interval, args.samples)
+        result = analyse(client, args.samples)
+        print(f" {batch_size:>10} {result['messages']:>8,} {result['payload']:>8.1f} {result['wire']:>8.1f} "
+              f"{result['radio']:>9.1f} {result['delay']:>11.1f} {result['decode_us']:>11.2f}")
+
+    print("\n 訊息數與無線電 bytes 越少，Pico 越省電、Broker 與伺服器負擔越低；代價是數據延遲增加")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,186 @@
+"""
+斷線保存與補傳模擬（在電腦上以 CPython 執行，不需要 Pico）
+以 host_stubs/ 的替身（network、umqtt、記憶體檔案系統）執行 main.py 的主迴圈，時間改用模擬時鐘，
+在指定時段讓 Broker 斷線，確認斷線期間的數據寫入快閃記憶體日誌（flash_log.py）並在恢復後補傳；
+伺服器端以 lesson6 的 binary_payload.unpack 與 devices.SequenceTracker 接收，統計重複與遺失筆數
+
+情境:
+    outage   Broker 斷線 30 分鐘後恢復
+    reboot   長時間斷線，補傳到一半時斷電重新開機（重送的數據由伺服器依序號去除）
+    overflow 斷線時間超過日誌容量，最舊的數據被丟棄
+
+使用方式:
+    python simulate_outage.py
+    python simulate_outage.py --scenario reboot
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, 'host_stubs'))
+sys.path.insert(1, os.path.join(HERE, '..', 'lesson6'))
+
+import main  # noqa: E402
+import wifi_connect  # noqa: E402
+from umqtt.simple import MQTTClient  # noqa: E402
+from fakefs import FakeFS  # noqa: E402
+from binary_payload import unpack  # noqa: E402
+from devices import SequenceTracker  # noqa: E402
+
+START = 1_700_000_000.0
+
+
+class PowerLoss(Exception):
+    """模擬斷電：主迴圈直接中止，RAM 中的數據遺失"""
+
+
+class Server:
+    """伺服器端：解碼、依序號去除重複，並檢查換算出的時間"""
+
+    def __init__(self):
+        self.tracker = SequenceTracker()
+        self.messages = 0
+        self.max_time_error = 0.0
+
+    def receive(self, payload, received):
+        self.messages += 1
+        _, _, sent_at, records = unpack(payload)
+        for seq, timestamp, _, _, _ in records:
+            self.tracker.accept(seq)
+            # 模擬中裝置時鐘與伺服器相同，換算後的時間應與取樣時間一致
+            epoch = received - (sent_at - timestamp)
+            self.max_time_error = max(self.max_time_error, abs(epoch - timestamp))
+
+
+class Scenario:
+    """
+    模擬時鐘與 Broker 斷線排程
+
+    Args:
+        outages: [(開始秒數, 結束秒數), ...]（相對於模擬開始）
+        power_off: 第幾秒斷電（None 為不斷電）
+    """
+
+    def __init__(self, server, outages=(), power_off=None):
+        self.now = START
+        self.server = server
+        self.outages = outages
+        self.power_off = power_off
+        self.client = None
+
+    def time(self):
+        return int(self.now)
+
+    def sleep(self, seconds):
+        self.now += seconds
+        elapsed = self.now - START
+        if self.power_off is not None and elapsed >= self.power_off:
+            self.power_off = None
+            raise PowerLoss()
+        self.client.down = any(start <= elapsed < end for start, end in self.outages)
+
+    def boot(self, samples, fs):
+        """開機並執行 main.main()，回傳是否正常結束"""
+        scenario = self
+
+        class Client(MQTTClient):
+            def publish(self, topic, msg, retain=False, qos=0):
+                super().publish(topic, msg, retain, qos)
+                scenario.server.receive(bytes(msg), scenario.now)
+
+        self.client = Client(main.CLIENT_ID, main.MQTT_BROKER, port=main.MQTT_PORT)
+        main.client = self.client
+        main.time = self
+        main.REPORT_BY_EXCEPTION = False  # 每筆都回報，數據筆數才能逐筆核對
+        wifi_connect.time = self
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                main.main(max_samples=samples, fs=fs)
+            return True
+        except PowerLoss:
+            return False
+
+
+def report(title, server, fs, produced, log_dropped):
+    """輸出一個情境的結果"""
+    tracker = server.tracker
+    lost = produced - tracker.accepted
+    print(f"\n ▶ {title}")
+    print(f"   取樣 {produced:,} 筆，伺服器收到 {tracker.accepted:,} 筆（重複 {tracker.duplicates:,} 筆已略過），"
+          f"遺失 {lost:,} 筆（日誌已滿丟棄 {log_dropped:,} 筆）")
+    print(f"   伺服器依序號判斷缺號 {tracker.missing:,} 筆（{tracker.gaps:,} 次跳號）、亂序 {tracker.reordered:,} 筆")
+    print(f"   MQTT 訊息 {server.messages:,} 則，補傳數據的時間誤差最大 {server.max_time_error:.0f} 秒")
+    print(f"   快閃記憶體寫入 {fs.write_ops:,} 次、{fs.bytes_written:,} bytes，"
+          f"日誌剩 {sum(len(v) for k, v in fs.files.items() if k.endswith('.log')):,} bytes")
+
+
+def run_outage(samples):
+    server = Server()
+    fs = FakeFS()
+    scenario = Scenario(server, outages=[(600, 2400)])
+    scenario.boot(samples, fs)
+    report('Broker 斷線 30 分鐘（第 10~40 分鐘）', server, fs, samples, 0)
+
+
+def run_reboot(samples):
+    server = Server()
+    fs = FakeFS()
+    # 斷線 2 小時 20 分鐘，恢復後 20 秒（補傳到一半）斷電重新開機
+    scenario = Scenario(server, outages=[(600, 9000)], power_off=9020)
+    scenario.boot(samples, fs)
+    first = int(9020 // main.SAMPLE_INTERVAL) + 1
+    scenario.boot(samples - first, fs)
+    report('長時間斷線，補傳中斷電重新開機', server, fs, samples, 0)
+    print("   （斷電時 RAM 中的數據會遺失：日誌緩衝最多 16 筆，加上還沒湊滿一批的數據；"
+          "缺號另外包含重新開機後跳過的預留序號）")
+
+
+def run_overflow(samples):
+    server = Server()
+    fs = FakeFS()
+    scenario = Scenario(server, outages=[(100, samples * main.SAMPLE_INTERVAL - 600)])
+    log_dropped = []
+    original = main.flash_log.FlashLog
+
+    class TrackedLog(original):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            log_dropped.append(self)
+
+    main.flash_log.FlashLog = TrackedLog
+    try:
+        scenario.boot(samples, fs)
+    finally:
+        main.flash_log.FlashLog = original
+    report(f'斷線超過日誌容量（{main.LOG_SEGMENTS} 段 × 256 筆）', server, fs, samples,
+           sum(log.dropped for log in log_dropped))
+
+
+SCENARIOS = {'outage': run_outage, 'reboot': run_reboot, 'overflow': run_overflow}
+
+
+def main_cli():
+    """主程式"""
+    parser = argparse.ArgumentParser(description='Pico 斷線保存與補傳模擬')
+    parser.add_argument('--scenario', choices=['all'] + list(SCENARIOS), default='all', help='情境（預設全部）')
+    parser.add_argument('--samples', type=int, default=1200, help='outage / reboot 情境的取樣筆數（預設 1200）')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(" Pico 斷線保存與補傳模擬")
+    print("=" * 60)
+    print(f" 每 {main.SAMPLE_INTERVAL} 秒取樣，BATCH_SIZE {main.BATCH_SIZE}，"
+          f"補傳每次迴圈 {main.REPLAY_BATCHES} 則 × {main.REPLAY_BATCH} 筆")
+
+    for name, run in SCENARIOS.items():
+        if args.scenario in ('all', name):
+            run(5000 if name == 'overflow' else args.samples)
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main_cli()
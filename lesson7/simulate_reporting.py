@@ -0,0 +1,210 @@
+"""
+變化才回報（report_policy.py）模擬（在電腦上以 CPython 執行，不需要 Pico）
+
+1. 房間感測器：以 host_stubs/ 的替身執行 main.py 的主迴圈（模擬時鐘，每 10 秒取樣、共 24 小時），
+   比較每筆都回報（立即或批次發布）與變化才回報的 MQTT 訊息數、伺服器接收筆數，以及伺服器端數值與實際數值的最大誤差
+2. 可變電阻（lesson8/lesson8_3.py）：模擬帶雜訊的 ADC，比較有無過取樣時
+   旋鈕沒動卻因雜訊而輸出的次數
+
+使用方式:
+    python simulate_reporting.py
+    python simulate_reporting.py --hours 72 --noise 600
+"""
+
+import argparse
+import contextlib
+import io
+import math
+import os
+import random
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, 'host_stubs'))
+sys.path.insert(1, os.path.join(HERE, '..', 'lesson6'))
+
+import main  # noqa: E402
+import report_policy  # noqa: E402
+import wifi_connect  # noqa: E402
+from umqtt.simple import MQTTClient  # noqa: E402
+from fakefs import FakeFS  # noqa: E402
+from binary_payload import unpack  # noqa: E402
+
+# MQTT 3.1.1 PUBLISH（QoS 0）：固定標頭 2 bytes + 主題長度 2 bytes
+MQTT_OVERHEAD = 4
+
+
+class SimulatedClock:
+    """模擬時鐘：sleep() 只推進時間，不真的等待"""
+
+    def __init__(self, start=1_700_000_000.0):
+        self.now = start
+
+    def time(self):
+        return int(self.now)
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def run_room(samples, by_exception, batch_size, seed):
+    """
+    執行 main.main() 並記錄每次取樣的實際數值
+
+    Returns:
+        tuple: (MQTT 替身, [(時間, 溫度, 濕度, 電燈)] 實際數值)
+    """
+    random.seed(seed)
+    clock = SimulatedClock()
+    main.time = clock
+    wifi_connect.time = clock
+    main.REPORT_BY_EXCEPTION = by_exception
+    main.room.update(temperature=26.0, humidity=60.0, light_status="關")
+    main.client = MQTTClient(main.CLIENT_ID, main.MQTT_BROKER, port=main.MQTT_PORT)
+
+    actual = []
+    read_sensor = main.read_sensor
+
+    def recording_read_sensor():
+        values = read_sensor()
+        actual.append((clock.time(),) + values)
+        return values
+
+    main.read_sensor = recording_read_sensor
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            main.main(batch_size=batch_size, max_samples=samples, fs=FakeFS())
+    finally:
+        main.read_sensor = read_sensor
+    return main.client, actual
+
+
+def analyse_room(client, actual):
+    """伺服器端收到的數據與實際數值比較"""
+    received = []
+    wire = 0
+    for topic, payload in client.published:
+        wire += len(payload) + MQTT_OVERHEAD + len(topic)
+        _, _, _, records = unpack(payload)
+        received.extend((ts, t / 100, h / 100, light) for _, ts, t, h, light in records)
+    received.sort()
+
+    # 每次取樣時，伺服器最新一筆數據與實際數值的差距（伺服器只看得到已回報的數值）
+    max_temp = max_humi = 0.0
+    light_wrong = 0
+    i = -1
+    for ts, temperature, humidity, light_status in actual:
+        while i + 1 < len(received) and received[i + 1][0] <= ts:
+            i += 1
+        if i < 0:
+            continue
+        _, t, h, light = received[i]
+        max_temp = max(max_temp, abs(temperature - t))
+        max_humi = max(max_humi, abs(humidity - h))
+        light_wrong += (light == 1) != (light_status == "開")
+    return {
+        'messages': len(client.published),
+        'samples': len(received),
+        'wire': wire,
+        'max_temp': max_temp,
+        'max_humi': max_humi,
+        'light_wrong': light_wrong,
+    }
+
+
+class NoisyADC:
+    """帶高斯雜訊的 ADC（read_u16 回傳 0~65535，reads 為呼叫次數）"""
+
+    def __init__(self, sigma, seed):
+        self.value = 20000
+        self.sigma = sigma
+        self.rng = random.Random(seed)
+        self.reads = 0
+
+    def read_u16(self):
+        self.reads += 1
+        return min(65535, max(0, int(self.rng.gauss(self.value, self.sigma))))
+
+
+def run_knob(seconds, oversample, noise, seed):
+    """
+    模擬 lesson8_3.py：每 0.5 秒讀取一次，每 10 分鐘轉動旋鈕 5 秒
+
+    Returns:
+        tuple: (ADC read_u16 次數, 輸出次數, 旋鈕沒動時的輸出次數, 最大誤差)
+    """
+    adc = NoisyADC(noise, seed)
+    rng = random.Random(seed + 1)
+    policy = report_policy.ReportPolicy({"raw": 655}, heartbeat=30)
+    false_reports = 0
+    max_error = 0
+    target = start = adc.value
+    turn_start = None
+    steps = int(seconds / 0.5)
+    for step in range(steps):
+        now = step * 0.5
+        # 每 10 分鐘轉動一次旋鈕，5 秒內平滑轉到新位置
+        if step % 1200 == 0 and step:
+            start, target, turn_start = adc.value, rng.randrange(0, 65536), now
+        moving = turn_start is not None and now - turn_start < 5
+        if moving:
+            progress = (now - turn_start) / 5
+            adc.value = int(start + (target - start) * (1 - math.cos(progress * math.pi)) / 2)
+        elif turn_start is not None:
+            adc.value = target
+
+        raw = report_policy.read_average(adc, oversample)
+        reason = policy.check(now, {"raw": raw})
+        if reason == report_policy.REPORT_CHANGE and not moving and now - (turn_start or -10) > 5.5:
+            false_reports += 1
+        max_error = max(max_error, abs(policy.last["raw"] - adc.value))
+    return adc.reads, policy.reports, false_reports, max_error
+
+
+def main_cli():
+    """主程式"""
+    parser = argparse.ArgumentParser(description='變化才回報模擬')
+    parser.add_argument('--hours', type=float, default=24, help='模擬幾小時（預設 24）')
+    parser.add_argument('--noise', type=float, default=400, help='ADC 雜訊標準差（預設 400，約 0.6%%）')
+    parser.add_argument('--seed', type=int, default=1, help='亂數種子（預設 1）')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(" 變化才回報模擬")
+    print("=" * 60)
+
+    samples = int(args.hours * 3600 / main.SAMPLE_INTERVAL)
+    print(f"\n ▶ 房間感測器（main.py）：{args.hours:g} 小時、每 {main.SAMPLE_INTERVAL} 秒取樣，共 {samples:,} 筆")
+    print(f"   死區 溫度 {main.TEMPERATURE_DEADBAND}°C / 濕度 {main.HUMIDITY_DEADBAND}%，"
+          f"心跳 {main.HEARTBEAT} 秒，BATCH_SIZE {main.BATCH_SIZE}\n")
+    print(f"   {'模式':<10} {'訊息數':>8} {'伺服器筆數':>10} {'線上 bytes':>11} {'溫度誤差':>8} {'濕度誤差':>8} {'電燈不符':>8}")
+    modes = (
+        ('每筆立即發布', False, 1),
+        ('每筆批次發布', False, main.BATCH_SIZE),
+        ('變化才回報', True, main.BATCH_SIZE),
+    )
+    results = []
+    for label, by_exception, batch_size in modes:
+        result = analyse_room(*run_room(samples, by_exception, batch_size, args.seed))
+        results.append(result)
+        print(f"   {label:<10} {result['messages']:>8,} {result['samples']:>10,} {result['wire']:>11,} "
+              f"{result['max_temp']:>8.2f} {result['max_humi']:>8.2f} {result['light_wrong']:>8,}")
+    policy = results[-1]
+    for (label, _, _), result in zip(modes[:-1], results):
+        print(f"\n   相較{label}：訊息數減少 {result['messages'] / max(1, policy['messages']):.1f} 倍，"
+              f"線上 bytes 減少 {result['wire'] / max(1, policy['wire']):.1f} 倍，"
+              f"伺服器接收筆數減少 {result['samples'] / max(1, policy['samples']):.1f} 倍", end='')
+    print()
+
+    seconds = args.hours * 3600
+    print(f"\n ▶ 可變電阻（lesson8_3.py）：每 0.5 秒讀取、每 10 分鐘轉動一次，ADC 雜訊 σ={args.noise:g}\n")
+    print(f"   {'過取樣':>6} {'讀取次數':>9} {'輸出次數':>9} {'雜訊誤報':>9} {'最大誤差':>9}")
+    for oversample in (1, 4, 16):
+        reads, reports, false_reports, max_error = run_knob(seconds, oversample, args.noise, args.seed)
+        print(f"   {oversample:>6} {reads:>9,} {reports:>9,} {false_reports:>9,} {max_error:>9,}")
+    print("\n   原本每次讀取都 print()；過取樣讓雜訊低於死區，旋鈕沒動時只剩心跳")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,181 @@
+# 中斷驅動、防彈跳的按鈕輸入模組（MicroPython / CPython 皆可使用）
+# lesson18_3.py 以 while 迴圈每 10 ms 讀一次 button.value()，放開前還卡在內層迴圈，
+# CPU 不能休息、也不能同時處理 MQTT；這裡改由硬體通知：
+#
+#   Pin.irq（任一邊緣）→ 重新開始 debounce_ms 的單次 Timer（彈跳期間的每個邊緣都會把計時往後延）
+#   → Timer 到期時電位已穩定，讀取一次並推進狀態機 → 產生事件
+#
+# 事件:
+#   press         按下（穩定後）
+#   release       放開
+#   click         單擊（放開後 double_ms 內沒有再按下；double_ms 為 0 時放開立即產生）
+#   double_click  雙擊（第二次放開時產生，這時不會產生 click）
+#   long_press    按住超過 long_ms（之後的放開不會再產生 click）
+#
+# 事件交給 on_event(名稱, 事件) 回呼，或放入 EventQueue 由主迴圈取出；
+# 兩者都在排程後的軟體中斷中執行（rp2 的 Pin.irq 預設 hard=False、Timer 回呼也是），可以配置記憶體，
+# 但應該盡快結束，耗時的工作（發布 MQTT、寫檔）請放在主迴圈處理佇列時做
+# 每個按鈕使用 2 個軟體 Timer（防彈跳、長按 / 雙擊間隔），可以同時使用多個按鈕
+
+from machine import Pin, Timer
+
+try:
+    from time import ticks_ms
+except ImportError:
+    # CPython 模擬：由 host_stubs/machine.py 的模擬時鐘提供
+    from machine import ticks_ms
+
+# 預設時間（毫秒）
+DEBOUNCE_MS = 30
+LONG_PRESS_MS = 800
+DOUBLE_CLICK_MS = 300
+
+# 事件名稱
+EVENT_PRESS = 'press'
+EVENT_RELEASE = 'release'
+EVENT_CLICK = 'click'
+EVENT_DOUBLE_CLICK = 'double_click'
+EVENT_LONG_PRESS = 'long_press'
+
+
+class EventQueue:
+    """
+    固定大小的事件佇列（預先配置，放入時不建立新的 list）
+
+    Args:
+        size: 最多保留幾個事件，滿了之後丟棄新事件並計入 dropped
+    """
+
+    def __init__(self, size=16):
+        self.size = size
+        self._names = [None] * size
+        self._events = [None] * size
+        self._ticks = [0] * size
+        self._head = 0
+        self._count = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return self._count
+
+    def put(self, name, event, ticks):
+        if self._count >= self.size:
+            self.dropped += 1
+            return False
+        i = (self._head + self._count) % self.size
+        self._names[i] = name
+        self._events[i] = event
+        self._ticks[i] = ticks
+        self._count += 1
+        return True
+
+    def get(self):
+        """
+        取出最舊的事件
+
+        Returns:
+            tuple: (按鈕名稱, 事件, ticks_ms)；沒有事件時回傳 None
+        """
+        if not self._count:
+            return None
+        i = self._head
+        item = (self._names[i], self._events[i], self._ticks[i])
+        self._head = (i + 1) % self.size
+        self._count -= 1
+        return item
+
+
+class Button:
+    """
+    單一按鈕
+
+    Args:
+        pin: GPIO 編號
+        name: 事件中的按鈕名稱（預設為 GPIO 編號）
+        on_event: 回呼函式 on_event(名稱, 事件)
+        queue: EventQueue（與 on_event 可同時使用）
+        active_low: 按下時為低電位（接 GND、使用內部上拉，與 lesson18_3.py 相同）
+        debounce_ms: 最後一個邊緣之後電位維持多久才視為穩定
+        long_ms: 按住多久產生 long_press（0 為不使用）
+        double_ms: 放開後多久內再按下算雙擊（0 為不使用雙擊，click 立即產生）
+    """
+
+    def __init__(self, pin, name=None, on_event=None, queue=None, active_low=True,
+                 debounce_ms=DEBOUNCE_MS, long_ms=LONG_PRESS_MS, double_ms=DOUBLE_CLICK_MS):
+        self.name = pin if name is None else name
+        self.on_event = on_event
+        self.queue = queue
+        self.active_low = active_low
+        self.debounce_ms = debounce_ms
+        self.long_ms = long_ms
+        self.double_ms = double_ms
+        self.pin = Pin(pin, Pin.IN, Pin.PULL_UP if active_low else Pin.PULL_DOWN)
+        self.pressed = self._read()
+        self.edges = 0           # 收到的邊緣數（包含彈跳）
+        self.events = 0
+        self._clicks = 0         # 等待判斷是否為雙擊的單擊數
+        self._long_fired = False
+        self._debounce = Timer(-1)
+        self._hold = Timer(-1)   # 按住時為長按計時，放開後為雙擊間隔計時
+        self.pin.irq(handler=self._edge, trigger=Pin.IRQ_FALLING | Pin.IRQ_RISING)
+
+    def _read(self):
+        return self.pin.value() == (0 if self.active_low else 1)
+
+    def _edge(self, pin):
+        """中斷處理：只重新開始防彈跳計時，不讀取也不判斷"""
+        self.edges += 1
+        self._debounce.init(mode=Timer.ONE_SHOT, period=self.debounce_ms, callback=self._settled)
+
+    def _settled(self, timer):
+        """電位已穩定 debounce_ms：與目前狀態不同才算一次按下或放開（短於防彈跳時間的雜訊被忽略）"""
+        pressed = self._read()
+        if pressed == self.pressed:
+            return
+        self.pressed = pressed
+        if pressed:
+            self._emit(EVENT_PRESS)
+            self._long_fired = False
+            if self.long_ms:
+                self._hold.init(mode=Timer.ONE_SHOT, period=self.long_ms, callback=self._hold_expired)
+            else:
+                self._hold.deinit()
+            return
+
+        self._emit(EVENT_RELEASE)
+        self._hold.deinit()
+        if self._long_fired:
+            return
+        self._clicks += 1
+        if self._clicks >= 2:
+            self._clicks = 0
+            self._emit(EVENT_DOUBLE_CLICK)
+        elif not self.double_ms:
+            self._clicks = 0
+            self._emit(EVENT_CLICK)
+        else:
+            self._hold.init(mode=Timer.ONE_SHOT, period=self.double_ms, callback=self._hold_expired)
+
+    def _hold_expired(self, timer):
+        if self.pressed:
+            # 按住超過 long_ms：長按（之前等待中的單擊一併取消）
+            self._long_fired = True
+            self._clicks = 0
+            self._emit(EVENT_LONG_PRESS)
+        elif self._clicks:
+            # 放開後 double_ms 內沒有再按下：單擊
+            self._clicks = 0
+            self._emit(EVENT_CLICK)
+
+    def _emit(self, event):
+        self.events += 1
+        if self.on_event is not None:
+            self.on_event(self.name, event)
+        if self.queue is not None:
+            self.queue.put(self.name, event, ticks_ms())
+
+    def deinit(self):
+        """停用中斷與計時器"""
+        self.pin.irq(handler=None)
+        self._debounce.deinit()
+        self._hold.deinit()
@@ -0,0 +1,176 @@
+# machine 模組替身（CPython 主機端模擬用，不要上傳到 Pico）
+# 以模擬時鐘（毫秒，可有小數）驅動 Pin 中斷與 Timer，時間只在 sim.advance() 時前進，不真的等待
+#
+#   sim.at(ms, fn)          在模擬時間 ms 呼叫 fn()（用來在指定時間改變按鈕電位，不算喚醒）
+#   sim.drive(pin, level)   外部改變輸入腳位的電位，符合觸發條件時呼叫 Pin.irq 的處理函式
+#   sim.advance(ms)         時間前進 ms，依序執行到期的 Timer 與 at() 事件
+#   sim.wakeups             CPU 被喚醒的次數（中斷處理、Timer 回呼、主迴圈 sleep 醒來）
+#   sim.outputs[pin]        輸出腳位的 [(時間, 電位)] 變化記錄
+#   sim.reset()             清除所有狀態（每個情境開始時呼叫）
+
+import heapq
+
+
+class Simulator:
+    """模擬時鐘與事件排程"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.now = 0.0
+        self.levels = {}
+        self.handlers = {}
+        self.outputs = {}
+        self.wakeups = 0
+        self.irq_calls = 0
+        self.timer_calls = 0
+        self._queue = []
+        self._order = 0
+
+    def _push(self, when, fn, wakeup):
+        self._order += 1
+        entry = [when, self._order, fn, wakeup, True]
+        heapq.heappush(self._queue, entry)
+        return entry
+
+    def at(self, when, fn):
+        """在模擬時間 when（ms）呼叫 fn()"""
+        self._push(when, fn, False)
+
+    def advance(self, ms):
+        """時間前進 ms，依序處理到期的事件"""
+        self.run_until(self.now + ms)
+
+    def run_until(self, end):
+        queue = self._queue
+        while queue and queue[0][0] <= end:
+            when, _, fn, wakeup, active = heapq.heappop(queue)
+            if not active:
+                continue
+            self.now = max(self.now, when)
+            if wakeup:
+                self.wakeups += 1
+                self.timer_calls += 1
+            fn()
+        self.now = max(self.now, end)
+
+    def drive(self, pin_id, level):
+        """外部改變輸入電位（按鈕接點），邊緣符合觸發條件時呼叫中斷處理函式"""
+        old = self.levels.get(pin_id, 1)
+        self.levels[pin_id] = level
+        if old == level or pin_id not in self.handlers:
+            return
+        handler, trigger, pin = self.handlers[pin_id]
+        if (level == 0 and trigger & Pin.IRQ_FALLING) or (level == 1 and trigger & Pin.IRQ_RISING):
+            self.wakeups += 1
+            self.irq_calls += 1
+            handler(pin)
+
+    def sleep(self, ms):
+        """主迴圈 sleep：時間前進，醒來算一次喚醒"""
+        self.advance(ms)
+        self.wakeups += 1
+
+
+sim = Simulator()
+
+
+def ticks_ms():
+    return int(sim.now)
+
+
+def ticks_add(ticks, delta):
+    return ticks + delta
+
+
+def ticks_diff(end, start):
+    return end - start
+
+
+def idle():
+    pass
+
+
+def lightsleep(ms=None):
+    sim.sleep(ms or 0)
+
+
+class Pin:
+    """與 machine.Pin 相同的常數與方法（只模擬數位輸入與輸出）"""
+
+    IN = 0
+    OUT = 1
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_FALLING = 4
+    IRQ_RISING = 8
+
+    def __init__(self, id, mode=IN, pull=None, value=None):
+        self.id = id
+        self.mode = mode
+        if mode == Pin.IN:
+            # 沒有外部訊號時依上拉 / 下拉決定電位
+            sim.levels.setdefault(id, 0 if pull == Pin.PULL_DOWN else 1)
+        elif value is not None:
+            self.value(value)
+
+    def value(self, v=None):
+        if v is None:
+            return sim.levels.get(self.id, 0)
+        v = 1 if v else 0
+        if self.mode == Pin.OUT and sim.levels.get(self.id) != v:
+            sim.outputs.setdefault(self.id, []).append((sim.now, v))
+        sim.levels[self.id] = v
+
+    def on(self):
+        self.value(1)
+
+    def off(self):
+        self.value(0)
+
+    def toggle(self):
+        self.value(1 - self.value())
+
+    def irq(self, handler=None, trigger=IRQ_FALLING | IRQ_RISING, hard=False):
+        if handler is None:
+            sim.handlers.pop(self.id, None)
+        else:
+            sim.handlers[self.id] = (handler, trigger, self)
+
+
+class Timer:
+    """與 machine.Timer 相同的介面（軟體計時器）；init() 會取消尚未到期的上一次設定"""
+
+    ONE_SHOT = 0
+    PERIODIC = 1
+
+    def __init__(self, id=-1, **kwargs):
+        self._entry = None
+        if kwargs:
+            self.init(**kwargs)
+
+    def init(self, mode=PERIODIC, period=-1, callback=None, freq=-1):
+        self.deinit()
+        if freq > 0:
+            period = 1000 / freq
+        self._mode = mode
+        self._period = period
+        self._callback = callback
+        self._schedule()
+
+    def _schedule(self):
+        self._entry = sim._push(sim.now + self._period, self._fire, True)
+
+    def _fire(self):
+        if self._mode == Timer.PERIODIC:
+            self._schedule()
+        else:
+            self._entry = None
+        if self._callback is not None:
+            self._callback(self)
+
+    def deinit(self):
+        if self._entry is not None:
+            self._entry[4] = False
+            self._entry = None
@@ -0,0 +1,46 @@
+from machine import Pin
+from time import sleep_ms
+
+from button_input import Button, EventQueue, EVENT_CLICK, EVENT_DOUBLE_CLICK, EVENT_LONG_PRESS
+
+# 與 lesson18_3.py 相同的接線：按鈕接 GPIO14 與 GND，紅燈 GPIO15、黃燈 GPIO13
+btn_pin = 14
+rled_pin = 15
+yled_pin = 13
+
+rled = Pin(rled_pin, Pin.OUT)
+yled = Pin(yled_pin, Pin.OUT)
+
+# 初始狀態：紅燈亮，黃燈滅
+led_state = True  # True: 紅燈亮, False: 黃燈亮
+rled.on()
+yled.off()
+
+# 按鈕由中斷與 Timer 處理防彈跳，事件放入佇列；要多個按鈕就再建立 Button 共用同一個佇列
+events = EventQueue()
+button = Button(btn_pin, name='btn', queue=events)
+
+# 主迴圈沒有事件時的休息時間（毫秒），按鈕事件不會因此遺失，只是最多晚這麼久處理
+IDLE_MS = 100
+
+while True:
+    event = events.get()
+    if event is None:
+        # 沒有事件：CPU 可以休息，或在這裡處理 MQTT（client.check_msg()）、讀感測器
+        sleep_ms(IDLE_MS)
+        continue
+
+    name, kind, ticks = event
+    if kind == EVENT_CLICK:
+        # 單擊：切換紅黃燈（與 lesson18_3.py 相同）
+        led_state = not led_state
+        rled.value(led_state)
+        yled.value(not led_state)
+    elif kind == EVENT_DOUBLE_CLICK:
+        # 雙擊：兩個燈都亮
+        rled.on()
+        yled.on()
+    elif kind == EVENT_LONG_PRESS:
+        # 長按：兩個燈都滅
+        rled.off()
+        yled.off()
@@ -1,5 +1,6 @@
 from machine import ADC, Pin, PWM
-from time import sleep
+from time import sleep, time
+import report_policy  # 需要一起上傳 lesson7/report_policy.py
 
 # 初始化 ADC（使用 GPIO 27）
 potentiometer = ADC(Pin(27))
@@ -8,22 +9,28 @@ yled = PWM(Pin(13))
 rled.freq(1000)  # 設定 PWM 頻率為 1000Hz
 yled.freq(500)  # 設定 PWM 頻率為 500Hz
 
+# 過取樣次數：每次連續讀取 16 次取平均，降低 ADC 雜訊
+OVERSAMPLE = 16
+
+# 原始值變化超過 1%（655）才輸出，最久 30 秒輸出一次（心跳）
+policy = report_policy.ReportPolicy({"raw": 655}, heartbeat=30)
+
 while True:
-    # 讀取 ADC 值（0 ~ 65535）
-    raw_value = potentiometer.read_u16()
-    
-    # 轉換為電壓值（0 ~ 3.3V）
-    voltage = raw_value * 3.3 / 65535
-    
-    # 轉換為百分比（0% ~ 100%）
-    percentage = raw_value * 100 / 65535
-    
-    print(f"原始值: {raw_value}, 電壓: {voltage:.2f}V, 百分比: {percentage:.1f}%")
-    
-     # 直接將 ADC 值作為 PWM 的 duty cycle
+    # 讀取 ADC 值（0 ~ 65535，過取樣平均）
+    raw_value = report_policy.read_average(potentiometer, OVERSAMPLE)
+
+     # 直接將 ADC 值作為 PWM 的 duty cycle（LED 亮度每次都更新）
     rled.duty_u16(raw_value)
     yled.duty_u16(raw_value)
-    
-    sleep(0.5)
 
+    # 旋鈕有轉動才輸出
+    if policy.check(time(), {"raw": raw_value}):
+        # 轉換為電壓值（0 ~ 3.3V）
+        voltage = raw_value * 3.3 / 65535
 
+        # 轉換為百分比（0% ~ 100%）
+        percentage = raw_value * 100 / 65535
+
+        print(f"原始值: {raw_value}, 電壓: {voltage:.2f}V, 百分比: {percentage:.1f}%")
+
+    sleep(0.5)
@@ -0,0 +1,341 @@
+"""
+按鈕輸入模擬（在電腦上以 CPython 執行，不需要 Pico）
+以 host_stubs/machine.py 的模擬時鐘與腳位替身，對按鈕注入含彈跳的邊緣序列，檢查 button_input.py 的事件，
+並比較輪詢版（lesson18_3.py）與中斷版（lesson18_4.py）的 CPU 喚醒次數
+
+    1. 事件正確性：3 個按鈕同時操作（單擊、雙擊、長按、短於防彈跳時間的雜訊），每次按下 / 放開都帶有
+       最多 9 個、在 8 ms 內結束的邊緣（含彈跳）；逐一比對事件種類與產生時間，並確認事件佇列的內容與回呼相同
+    2. CPU 使用：以相同的操作序列執行兩個範例程式的主迴圈（time.sleep 改為推進模擬時鐘），
+       統計每秒喚醒次數與估計的 CPU 使用率，並檢查每次操作後 LED 的狀態
+
+使用方式:
+    python simulate_buttons.py
+    python simulate_buttons.py --gestures 500 --seed 7
+"""
+
+import argparse
+import os
+import random
+import runpy
+import sys
+import types
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, 'host_stubs'))
+sys.path.insert(1, HERE)
+
+from machine import sim  # noqa: E402
+import button_input  # noqa: E402
+from button_input import (  # noqa: E402
+    Button, EventQueue, EVENT_PRESS, EVENT_RELEASE, EVENT_CLICK, EVENT_DOUBLE_CLICK, EVENT_LONG_PRESS,
+)
+
+# 彈跳：每次按下 / 放開最多幾組多餘的邊緣、全部在幾毫秒內結束（須短於防彈跳時間）
+MAX_BOUNCES = 4
+BOUNCE_MS = 8
+# 操作之間的間隔（毫秒），須長於雙擊間隔
+IDLE_MS = (600, 1200)
+# 一次喚醒（中斷或 sleep 醒來、執行幾行 Python、再進入休眠）的估計成本（微秒，RP2040 125 MHz）
+WAKEUP_COST_US = 40
+# 事件時間允許的誤差（毫秒）
+TOLERANCE_MS = 0.5
+
+# 第 1 部分的按鈕：(GPIO, 名稱, Button 參數)；第 3 個按鈕不使用長按與雙擊
+BUTTONS = [
+    (14, 'A', {}),
+    (16, 'B', {'debounce_ms': 20, 'long_ms': 1000, 'double_ms': 250}),
+    (17, 'C', {'long_ms': 0, 'double_ms': 0}),
+]
+GESTURES = ('click', 'double', 'long', 'glitch')
+
+
+class SimulationEnd(Exception):
+    """模擬時間到：中止範例程式的 while True 主迴圈"""
+
+
+def transition(rng, t, level):
+    """
+    從 t 開始切換到 level，前面加上隨機的彈跳邊緣
+
+    Returns:
+        tuple: ([(時間, 電位)], 最後一個邊緣的時間)
+    """
+    count = rng.randint(0, MAX_BOUNCES) * 2 + 1
+    edges = []
+    # 依序為 level、1 - level、level…，邊緣數為奇數，最後一個是 level
+    for i in range(count):
+        edges.append((t, level if i % 2 == 0 else 1 - level))
+        t += rng.uniform(0.05, BOUNCE_MS / count)
+    return edges, edges[-1][0]
+
+
+def build_script(rng, count, debounce_ms, long_ms, double_ms):
+    """
+    產生一個按鈕的操作序列（按下為低電位）
+
+    Returns:
+        tuple: (邊緣 [(時間, 電位)], 預期事件 [(事件, 時間)], 檢查點 [(時間, 操作)])
+    """
+    edges, expected, checkpoints = [], [], []
+    t = rng.uniform(0, 500)
+    pending = None  # 等待雙擊間隔的單擊（放開穩定的時間）
+
+    def press(t):
+        changes, last = transition(rng, t, 0)
+        edges.extend(changes)
+        expected.append((EVENT_PRESS, last + debounce_ms))
+        return last + debounce_ms
+
+    def release(t, pressed_at):
+        nonlocal pending
+        changes, last = transition(rng, t, 1)
+        edges.extend(changes)
+        settled = last + debounce_ms
+        expected.append((EVENT_RELEASE, settled))
+        if long_ms and settled - pressed_at >= long_ms:
+            return
+        if pending is not None:
+            pending = None
+            expected.append((EVENT_DOUBLE_CLICK, settled))
+        elif not double_ms:
+            expected.append((EVENT_CLICK, settled))
+        else:
+            pending = settled
+
+    for _ in range(count):
+        kind = rng.choice(GESTURES)
+        if kind == 'glitch':
+            # 1~3 個短於防彈跳時間的低電位脈衝，不應產生任何事件
+            for _ in range(rng.randint(1, 3)):
+                edges.append((t, 0))
+                t += rng.uniform(0.05, (debounce_ms - BOUNCE_MS) / 3)
+                edges.append((t, 1))
+                t += rng.uniform(0.05, 2)
+        elif kind == 'long':
+            pressed_at = press(t)
+            hold = rng.uniform(long_ms or 800, (long_ms or 800) + 1500) + BOUNCE_MS
+            if long_ms:
+                expected.append((EVENT_LONG_PRESS, pressed_at + long_ms))
+            release(t + hold, pressed_at)
+            t += hold
+        else:
+            pressed_at = press(t)
+            hold = rng.uniform(50, 400 if kind == 'click' else 150)
+            release(t + hold, pressed_at)
+            t += hold
+            if kind == 'double':
+                # 間隔加上彈跳須短於雙擊間隔
+                t += rng.uniform(50, (double_ms or 200) - 2 * BOUNCE_MS - 40)
+                pressed_at = press(t)
+                hold = rng.uniform(50, 150)
+                release(t + hold, pressed_at)
+                t += hold
+        if pending is not None:
+            expected.append((EVENT_CLICK, pending + double_ms))
+            pending = None
+        t += rng.uniform(*IDLE_MS)
+        checkpoints.append((t - 1, kind))
+    return edges, expected, checkpoints
+
+
+def schedule(pin_id, edges):
+    for when, level in edges:
+        sim.at(when, lambda pin_id=pin_id, level=level: sim.drive(pin_id, level))
+
+
+def check_events(gestures, seed):
+    """
+    第 1 部分：多個按鈕同時操作，比對事件
+
+    Returns:
+        bool: 全部正確
+    """
+    print(f"\n🔘 事件正確性（{len(BUTTONS)} 個按鈕，每個 {gestures} 次操作）")
+    sim.reset()
+    rng = random.Random(seed)
+    queue = EventQueue(size=32)
+    received = {}
+    queued = {}
+    buttons = []
+    scripts = {}
+    end = 0.0
+    for pin_id, name, options in BUTTONS:
+        received[name] = []
+        queued[name] = []
+        button = Button(pin_id, name=name, queue=queue,
+                        on_event=lambda name, event: received[name].append((event, sim.now)), **options)
+        buttons.append(button)
+        edges, expected, checkpoints = build_script(
+            rng, gestures, button.debounce_ms, button.long_ms, button.double_ms)
+        scripts[name] = (expected, len(edges))
+        schedule(pin_id, edges)
+        end = max(end, checkpoints[-1][0] + 1)
+
+    # 主迴圈每 100 ms 醒來取出佇列中的事件
+    while sim.now < end:
+        sim.advance(100)
+        while True:
+            item = queue.get()
+            if item is None:
+                break
+            name, event, _ = item
+            queued[name].append(event)
+
+    ok = True
+    for button in buttons:
+        expected, edge_count = scripts[button.name]
+        got = received[button.name]
+        errors = 0
+        worst = 0.0
+        for i in range(max(len(expected), len(got))):
+            if i >= len(expected) or i >= len(got) or expected[i][0] != got[i][0]:
+                errors += 1
+                continue
+            worst = max(worst, abs(expected[i][1] - got[i][1]))
+        timing_ok = worst <= TOLERANCE_MS
+        queue_ok = queued[button.name] == [event for event, _ in got]
+        passed = not errors and len(expected) == len(got) and timing_ok and queue_ok
+        ok = ok and passed
+        counts = {}
+        for event, _ in got:
+            counts[event] = counts.get(event, 0) + 1
+        print(f"   {'✅' if passed else '❌'} {button.name}（GPIO{button.pin.id}，防彈跳 {button.debounce_ms} ms、"
+              f"長按 {button.long_ms} ms、雙擊 {button.double_ms} ms）")
+        print(f"      邊緣 {edge_count:,}（含彈跳）→ 事件 {len(got):,}，預期 {len(expected):,}，不符 {errors}，"
+              f"時間誤差最大 {worst:.3f} ms，佇列{'一致' if queue_ok else '不一致'}")
+        print("      " + "、".join(f"{event} {counts.get(event, 0)}" for event in
+                                   (EVENT_PRESS, EVENT_RELEASE, EVENT_CLICK, EVENT_DOUBLE_CLICK, EVENT_LONG_PRESS)))
+        button.deinit()
+    print(f"   佇列丟棄: {queue.dropped}")
+    return ok and queue.dropped == 0
+
+
+def time_module(end):
+    """MicroPython time 模組替身：sleep 推進模擬時鐘，到 end 時中止主迴圈"""
+    module = types.ModuleType('time')
+
+    def sleep_ms(ms):
+        if sim.now >= end:
+            raise SimulationEnd
+        sim.sleep(ms)
+
+    module.sleep_ms = sleep_ms
+    module.sleep = lambda seconds: sleep_ms(seconds * 1000)
+    module.sleep_us = lambda us: sleep_ms(us / 1000)
+    module.ticks_ms = lambda: int(sim.now)
+    module.ticks_add = lambda ticks, delta: ticks + delta
+    module.ticks_diff = lambda end, start: end - start
+    return module
+
+
+def expected_leds(checkpoints):
+    """
+    依每次操作推算兩個範例程式的預期結果
+
+    Returns:
+        dict: {'lesson18_3.py': [每次操作紅燈切換的次數], 'lesson18_4.py': [每次操作後的 (紅, 黃)]}
+    """
+    # lesson18_3.py：每次按下再放開切換一次（雙擊切換兩次），雜訊不切換
+    toggles = {'click': 1, 'double': 2, 'long': 1, 'glitch': 0}
+    polling = [toggles[kind] for _, kind in checkpoints]
+    # lesson18_4.py：單擊切換紅黃燈、雙擊全亮、長按全滅（led_state 只在單擊時改變）
+    irq = []
+    led_state = True
+    state = (1, 0)
+    for _, kind in checkpoints:
+        if kind == 'click':
+            led_state = not led_state
+            state = (1, 0) if led_state else (0, 1)
+        elif kind == 'double':
+            state = (1, 1)
+        elif kind == 'long':
+            state = (0, 0)
+        irq.append(state)
+    return {'lesson18_3.py': polling, 'lesson18_4.py': irq}
+
+
+def run_example(filename, edges, checkpoints, end):
+    """
+    以模擬時鐘執行範例程式，在每個檢查點記錄 LED
+
+    Returns:
+        tuple: (每秒喚醒次數, 中斷次數, Timer 回呼次數, 每次操作的紅燈切換次數, 每次操作後的 (紅, 黃))
+    """
+    sim.reset()
+    schedule(14, edges)
+    states = []
+    changes = []
+
+    def sample():
+        # 第一筆輸出記錄是程式開始時的 rled.on()，不算切換
+        changes.append(len(sim.outputs.get(15, [])) - 1)
+        states.append((sim.levels.get(15, 0), sim.levels.get(13, 0)))
+
+    for when, _ in checkpoints:
+        sim.at(when, sample)
+
+    saved = sys.modules.get('time')
+    sys.modules['time'] = time_module(end)
+    try:
+        runpy.run_path(os.path.join(HERE, filename), run_name='__main__')
+    except SimulationEnd:
+        pass
+    finally:
+        sys.modules['time'] = saved
+    toggles = [b - a for a, b in zip([0] + changes, changes)]
+    return sim.wakeups / (sim.now / 1000), sim.irq_calls, sim.timer_calls, toggles, states
+
+
+def compare_examples(gestures, seed):
+    """
+    第 2 部分：輪詢版與中斷版的 CPU 喚醒次數
+
+    Returns:
+        bool: lesson18_4.py 每次操作後的 LED 都正確
+    """
+    rng = random.Random(seed + 1)
+    edges, _, checkpoints = build_script(
+        rng, gestures, button_input.DEBOUNCE_MS, button_input.LONG_PRESS_MS, button_input.DOUBLE_CLICK_MS)
+    end = checkpoints[-1][0] + 1
+    expected = expected_leds(checkpoints)
+    kinds = {kind: sum(1 for _, k in checkpoints if k == kind) for kind in GESTURES}
+
+    print(f"\n⚡ CPU 使用（GPIO14，{gestures} 次操作、模擬 {end / 1000:,.0f} 秒："
+          + "、".join(f"{kind} {count}" for kind, count in kinds.items()) + "）")
+    print(f"   {'程式':<15} {'喚醒/秒':>8} {'中斷':>7} {'Timer':>7} {'估計 CPU':>9} {'LED 不符':>9}")
+    results = {}
+    for filename in ('lesson18_3.py', 'lesson18_4.py'):
+        rate, irqs, timers, toggles, states = run_example(filename, edges, checkpoints, end)
+        got = toggles if filename == 'lesson18_3.py' else states
+        wrong = sum(1 for a, b in zip(got, expected[filename]) if a != b) + len(checkpoints) - len(got)
+        duty = rate * WAKEUP_COST_US / 1e6 * 100
+        results[filename] = (rate, wrong)
+        print(f"   {filename:<15} {rate:>8.1f} {irqs:>7,} {timers:>7,} {duty:>8.2f}% {wrong:>5}/{len(checkpoints)}")
+    print(f"   喚醒次數減少 {results['lesson18_3.py'][0] / results['lesson18_4.py'][0]:.1f} 倍"
+          f"（估計 CPU 以每次喚醒 {WAKEUP_COST_US} µs 計算）")
+    print("   lesson18_3.py 按住按鈕時停在內層迴圈，這段期間無法處理 MQTT；"
+          "放開後約 60 ms 內再按下會漏掉（LED 不符）")
+    print("   lesson18_4.py 主迴圈只在佇列有事件時工作，其餘時間可以 sleep 或處理 MQTT")
+    return results['lesson18_4.py'][1] == 0
+
+
+def main():
+    """主程式"""
+    parser = argparse.ArgumentParser(description='按鈕輸入模擬')
+    parser.add_argument('--gestures', type=int, default=200, help='每個按鈕的操作次數（預設 200）')
+    parser.add_argument('--seed', type=int, default=1, help='亂數種子（預設 1）')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(" 按鈕輸入模擬（button_input.py）")
+    print("=" * 60)
+    ok = check_events(args.gestures, args.seed)
+    ok = compare_examples(args.gestures, args.seed) and ok
+    print("=" * 60)
+    print(" ✅ 事件與 LED 全部正確" if ok else " ❌ 事件或 LED 不符")
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()